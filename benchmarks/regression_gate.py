@@ -0,0 +1,247 @@
+"""Fail when the core operations got slower than the committed baseline.
+
+Usage: python benchmarks/regression_gate.py [--repeat 7] [--update-baseline]
+
+Runs a fixed workload (saving, loading and querying a month of records,
+exporting it and computing payroll) in a scratch directory and compares
+the median time of each operation with benchmarks/baseline.json.
+An operation regresses when its median is both more than --tolerance
+slower than the baseline and slower by more than --mad-factor robust
+standard deviations (1.4826 x MAD) of the two runs, so ordinary noise does
+not fail the gate. Baseline times are scaled by a calibration loop,
+measured with every run, so the baseline carries across machines. Each
+operation is scaled by the loop that matches where it spends its time:
+pure-Python work for most (the Excel export included, as openpyxl builds
+its XML in Python), compiled code (numpy, zlib) for payroll, which does
+not speed up or slow down with the interpreter.
+
+--update-baseline measures and writes a new baseline instead of comparing.
+Exit status: 0 pass, 1 regression, 2 baseline missing or incompatible.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import zlib
+from datetime import date
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import wfh_attendance as app
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+WORKLOAD_VERSION = 2
+RECORDS = 20000
+EXCEL_RECORDS = 2000
+
+
+def make_records(count: int, first_day: int) -> list:
+    rng = random.Random(7)
+    records = []
+    for _ in range(count):
+        user = rng.randrange(200)
+        time_in = rng.randint(7 * 3600, 10 * 3600)
+        records.append(app.AttendanceRecord(
+            f"EMP{user:04d}", f"Employee {user}", first_day + rng.randint(0, 27),
+            time_in, time_in + rng.randint(4 * 3600, 10 * 3600)
+        ))
+    return records
+
+
+def calibrate_python():
+    """Fixed pure-Python work used to scale interpreter-bound operations to this machine's speed"""
+    total = 0
+    for i in range(300000):
+        total += i % 7
+    return sorted(str(i) for i in range(20000))
+
+
+def calibrate_native():
+    """Fixed work in compiled code, used to scale operations that mostly run numpy or zlib"""
+    values = np.arange(1000000, dtype=np.int64)
+    np.bincount(values % 1000, weights=values)
+    return zlib.compress(bytes(range(256)) * 10000, 6)
+
+
+# Calibration each operation is scaled by; operations not listed use 'calibration_python'
+CALIBRATIONS = ('calibration_python', 'calibration_native')
+OPERATION_CALIBRATION = {
+    'payroll': 'calibration_native',
+}
+
+
+class Workload:
+    """Scratch data directory with a month of records; each operation restores what it changes"""
+
+    def __init__(self):
+        self.data_dir = tempfile.mkdtemp(prefix="wfh_bench_")
+        self.first_day = date(2024, 3, 1).toordinal()
+        self.key = app.month_key(self.first_day)
+        self.records = make_records(RECORDS, self.first_day)
+        self.store = self.new_store()
+        for record in self.records:
+            self.store.append(record)
+        self.store.save()
+
+    def new_store(self) -> app.AttendanceStore:
+        store = app.AttendanceStore(os.path.join(self.data_dir, "attendance_partitions"))
+        store.load()
+        return store
+
+    def operations(self) -> dict:
+        return {
+            'calibration_python': calibrate_python,
+            'calibration_native': calibrate_native,
+            'save_data': self.save_data,
+            'load_partition': self.load_partition,
+            'records_view': self.records_view,
+            'records_filtered': self.records_filtered,
+            'export_csv': lambda: self.export('.csv', self.records),
+            'export_xlsx': lambda: self.export('.xlsx', self.records[:EXCEL_RECORDS]),
+            'payroll': self.payroll,
+        }
+
+    def save_data(self):
+        self.store.dirty.add(self.key)
+        self.store.save()
+
+    def load_partition(self):
+        self.new_store().load_partition(self.key)
+
+    def records_view(self):
+        # The data side of update_records_display: sorted query plus row values
+        for record in self.store.query(sort_key='duration', descending=True):
+            record.display_values()
+
+    def records_filtered(self):
+        for record in self.store.query(
+            user_ids=['EMP0001', 'EMP0002'], start_day=self.first_day + 7, end_day=self.first_day + 14,
+            min_duration=5 * 3600
+        ):
+            record.display_values()
+
+    def export(self, extension: str, records: list):
+        path = os.path.join(self.data_dir, f"export{extension}")
+        app.write_export_file((record.export_row() for record in records), path)
+        os.remove(path)
+
+    def payroll(self):
+        engine = app.PayrollEngine(os.path.join(self.data_dir, "payroll_cache"))
+        engine.compute(self.records, *app.month_bounds(self.key), self.key)
+
+    def close(self):
+        shutil.rmtree(self.data_dir, ignore_errors=True)
+
+
+def mad(values: list) -> float:
+    median = statistics.median(values)
+    return statistics.median(abs(value - median) for value in values)
+
+
+def measure(repeat: int) -> dict:
+    """Median and MAD in milliseconds per operation, after one warm-up run"""
+    workload = Workload()
+    try:
+        results = {}
+        for name, operation in workload.operations().items():
+            operation()
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                operation()
+                timings.append((time.perf_counter() - start) * 1000)
+            results[name] = {
+                'median_ms': round(statistics.median(timings), 3),
+                'mad_ms': round(mad(timings), 3),
+                'runs': repeat
+            }
+            print(f"  {name:<18}{results[name]['median_ms']:>10.2f} ms")
+        return results
+    finally:
+        workload.close()
+
+
+def calibration_scales(baseline: dict, current: dict) -> dict:
+    """How much slower this machine is than the baseline's, per calibration loop"""
+    return {name: current[name]['median_ms'] / baseline[name]['median_ms'] for name in CALIBRATIONS}
+
+
+def compare(baseline: dict, current: dict, tolerance: float, mad_factor: float) -> list:
+    """Rows of (operation, baseline ms, current ms, change, limit ms, status)"""
+    scales = calibration_scales(baseline, current)
+    rows = []
+    for name, result in current.items():
+        if name in CALIBRATIONS or name not in baseline:
+            continue
+        scale = scales[OPERATION_CALIBRATION.get(name, 'calibration_python')]
+        expected = baseline[name]['median_ms'] * scale
+        noise = 1.4826 * (baseline[name]['mad_ms'] * scale + result['mad_ms'])
+        limit = max(expected * (1 + tolerance), expected + mad_factor * noise)
+        change = result['median_ms'] / expected - 1 if expected else 0.0
+        if result['median_ms'] > limit:
+            status = "REGRESSION"
+        elif result['median_ms'] < expected / (1 + tolerance):
+            status = "faster"
+        else:
+            status = "ok"
+        rows.append((name, expected, result['median_ms'], change, limit, status))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=7, help="timed runs per operation")
+    parser.add_argument('--tolerance', type=float, default=0.5, help="allowed relative slowdown (0.5 = 50%%)")
+    parser.add_argument('--mad-factor', type=float, default=3.0, help="allowed slowdown in robust standard deviations")
+    parser.add_argument('--update-baseline', action='store_true', help="write the measured times as the new baseline")
+    args = parser.parse_args()
+
+    print(f"Running benchmark workload ({args.repeat} runs per operation)...")
+    current = measure(args.repeat)
+
+    if args.update_baseline:
+        # Indented so baseline changes are readable in review
+        with open(BASELINE_FILE, 'w') as f:
+            json.dump({
+                'workload_version': WORKLOAD_VERSION,
+                'created': date.today().isoformat(),
+                'python': sys.version.split()[0],
+                'results': current
+            }, f, indent=2)
+            f.write('\n')
+        print(f"\nBaseline written to {BASELINE_FILE}")
+        return
+
+    if not os.path.exists(BASELINE_FILE):
+        print(f"\nNo baseline at {BASELINE_FILE}; run with --update-baseline first.")
+        sys.exit(2)
+    with open(BASELINE_FILE, 'r') as f:
+        baseline = json.load(f)
+    if baseline.get('workload_version') != WORKLOAD_VERSION:
+        print("\nThe baseline was recorded for a different workload; run with --update-baseline.")
+        sys.exit(2)
+
+    rows = compare(baseline['results'], current, args.tolerance, args.mad_factor)
+    scales = calibration_scales(baseline['results'], current)
+    print(f"\nBaseline from {baseline.get('created', '?')}, scaled for this machine's speed "
+          f"x{scales['calibration_python']:.2f} (Python) and x{scales['calibration_native']:.2f} (compiled code)")
+    print(f"\n  {'operation':<18}{'baseline':>11}{'current':>11}{'change':>9}{'limit':>11}  status")
+    for name, expected, measured, change, limit, status in rows:
+        print(f"  {name:<18}{expected:>9.2f}ms{measured:>9.2f}ms{change:>+8.0%}{limit:>9.2f}ms  {status}")
+
+    regressions = [row[0] for row in rows if row[5] == "REGRESSION"]
+    if regressions:
+        print(f"\nFAIL: {', '.join(regressions)} slower than the baseline allows")
+        sys.exit(1)
+    print("\nPASS")
+
+
+if __name__ == '__main__':
+    main()
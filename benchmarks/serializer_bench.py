@@ -0,0 +1,99 @@
+"""Compare the data file serializers on realistic attendance data.
+
+Usage: python benchmarks/serializer_bench.py [--records N] [--repeat R]
+
+Encodes and decodes a month-sized list of attendance records and the user
+list with every available backend, and prints the median times and the
+encoded sizes next to the old indented JSON format.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import date, datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import wfh_attendance as app
+
+
+def make_records(count: int) -> list:
+    """Attendance records in their stored form, spread over one month"""
+    random.seed(42)
+    users = [(f"EMP{i:04d}", f"Employee {i}") for i in range(200)]
+    first_day = date.today().replace(day=1).toordinal()
+    records = []
+    for _ in range(count):
+        user_id, user_name = random.choice(users)
+        day = first_day + random.randint(0, 27)
+        time_in = random.randint(7 * 3600, 10 * 3600)
+        time_out = time_in + random.randint(4 * 3600, 10 * 3600)
+        records.append(app.AttendanceRecord(user_id, user_name, day, time_in, time_out).to_dict())
+    return records
+
+
+def make_users(count: int) -> list:
+    now = int(time.time())
+    return [
+        {'user_id': f"EMP{i:04d}", 'user_name': f"Employee {i}", 'registered_date': now - i * 3600, 'role': 'regular'}
+        for i in range(count)
+    ]
+
+
+def backends() -> dict:
+    """Encode/decode pairs for each serializer available here"""
+    result = {
+        'json indent=2 (old)': (lambda data: json.dumps(data, indent=2).encode('utf-8'), json.loads),
+        'json compact (stdlib)': (
+            lambda data: json.dumps(data, separators=(',', ':')).encode('utf-8'), json.loads
+        ),
+    }
+    if app.orjson is not None:
+        result['orjson'] = (app.orjson.dumps, app.orjson.loads)
+    if app.msgpack is not None:
+        result['msgpack'] = (app.msgpack_dumps, app.msgpack_loads)
+    return result
+
+
+def measure(func, arg, repeat: int) -> float:
+    """Median wall time of func(arg) in milliseconds"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(arg)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=50000, help="attendance records in the data set")
+    parser.add_argument('--repeat', type=int, default=7, help="timed runs per measurement")
+    args = parser.parse_args()
+
+    datasets = {
+        f"{args.records} records": make_records(args.records),
+        "1000 users": make_users(1000),
+    }
+
+    print(f"Serializer benchmark ({datetime.now():%Y-%m-%d %H:%M}, Python {sys.version.split()[0]})")
+    print(f"Active serializer: {app.SERIALIZER}{' (orjson)' if app.orjson is not None else ''}")
+    for name, data in datasets.items():
+        print()
+        print(f"{name}:")
+        print(f"  {'backend':<24}{'encode ms':>11}{'decode ms':>11}{'size':>12}")
+        for backend, (dumps, loads) in backends().items():
+            encoded = dumps(data)
+            if loads(encoded) != data:
+                print(f"  {backend:<24}round trip mismatch")
+                continue
+            encode_ms = measure(dumps, data, args.repeat)
+            decode_ms = measure(loads, encoded, args.repeat)
+            print(f"  {backend:<24}{encode_ms:>11.2f}{decode_ms:>11.2f}{app.format_file_size(len(encoded)):>12}")
+
+
+if __name__ == '__main__':
+    main()
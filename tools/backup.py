@@ -0,0 +1,66 @@
+"""Take, list and restore backup snapshots of the attendance data.
+
+Usage: python tools/backup.py [--data-dir DIR] [--keep 14] snapshot
+       python tools/backup.py [--data-dir DIR] list
+       python tools/backup.py [--data-dir DIR] restore SNAPSHOT [--target DIR]
+
+Snapshots are the same ones the app takes in the background and lists
+under Backups: chunks of the data files deduplicated by hash in
+DIR/backups. restore makes the target directory (by default the data
+directory itself) match the snapshot, rewriting only files that differ
+and deleting data files the snapshot does not have. Close the app before
+restoring into its data directory.
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import wfh_attendance as app
+
+
+def progress_printer(label: str):
+    def progress(done, total):
+        if total:
+            print(f"\r{label} {done * 100 // total:3d}%", end='', flush=True)
+    return progress
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data-dir', default='.', help="the app's data directory (default: current directory)")
+    parser.add_argument('--keep', type=int, default=14, help="snapshots to keep when taking a new one")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('snapshot', help="take a snapshot now")
+    commands.add_parser('list', help="list snapshots, newest first")
+    restore = commands.add_parser('restore', help="restore a snapshot")
+    restore.add_argument('snapshot', help="snapshot ID, as shown by list")
+    restore.add_argument('--target', help="directory to restore into (default: the data directory)")
+    args = parser.parse_args()
+
+    backups = app.BackupManager(args.data_dir, os.path.join(args.data_dir, "backups"), keep=args.keep)
+
+    if args.command == 'snapshot':
+        manifest = backups.snapshot(progress=progress_printer("Backing up"))
+        print(f"\nSnapshot {manifest['id']}: {len(manifest['files'])} files, "
+              f"{app.format_file_size(manifest['size'])} of data, "
+              f"{app.format_file_size(manifest['new_bytes'])} new, {manifest['duration_ms'] / 1000:.1f} s")
+    elif args.command == 'list':
+        print(f"  {'snapshot':<20}{'taken':<22}{'files':>7}{'size':>12}{'new':>12}")
+        for snapshot_id in reversed(backups.snapshot_ids()):
+            manifest = backups.load_snapshot(snapshot_id)
+            print(f"  {snapshot_id:<20}{app.format_timestamp(manifest['created']):<22}{len(manifest['files']):>7}"
+                  f"{app.format_file_size(manifest['size']):>12}{app.format_file_size(manifest['new_bytes']):>12}")
+    else:
+        if args.snapshot not in backups.snapshot_ids():
+            print(f"No snapshot {args.snapshot!r}; run with list to see the snapshots.")
+            sys.exit(2)
+        target = args.target or args.data_dir
+        result = backups.restore(args.snapshot, target, progress=progress_printer("Restoring"))
+        print(f"\nRestored {args.snapshot} into {os.path.abspath(target)}: {result['restored']} files written, "
+              f"{result['skipped']} unchanged, {result['removed']} removed")
+
+
+if __name__ == '__main__':
+    main()
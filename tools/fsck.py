@@ -0,0 +1,513 @@
+"""Check the attendance data files for corruption and inconsistencies.
+
+Usage: python tools/fsck.py [--data-dir DIR] [--repair] [--verify-exports] [--show 5]
+
+Every department's records and exported history are streamed one month
+at a time, both stores of a month together, so memory is bounded by the
+largest month plus the users and active sessions. Duplicates and
+sessions that already have a record are found with hash indexes keyed by
+(user, time in), which can only collide within one month.
+
+Checks:
+  partitions  manifest entries without a file, files missing from the
+              manifest, unreadable files, wrong counts, date spans or tiers
+  records     malformed entries, negative durations, records filed under
+              the wrong month, duplicates within and across the live
+              store and the exported history
+  sessions    malformed entries, duplicate session IDs, several open
+              sessions for one user, sessions that already have a record,
+              sessions starting in the future
+  users       records and sessions of unknown users or of users registered
+              to another department, admin/roles entries without a
+              registered user, duplicate user IDs
+  exports     roles export manifest entries whose file is missing and,
+              with --verify-exports, stored exports whose hash is wrong
+
+--repair fixes what can be fixed without guessing: it rebuilds manifests,
+drops exact duplicate records and recorded sessions, moves misfiled
+records to their month, and removes malformed or conflicting entries into
+fsck_quarantine/ instead of deleting them. Run it with the app closed.
+Exit status: 0 when no problems remain, 1 otherwise.
+"""
+import argparse
+import os
+import shutil
+import sys
+import time
+from collections import Counter
+from datetime import date, datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import wfh_attendance as app
+
+# Problems --repair can fix; everything else needs a person to look at it
+REPAIRABLE = {
+    'manifest entry without file', 'file missing from manifest', 'manifest entry out of date', 'unreadable file',
+    'partition in both tiers', 'malformed record', 'invalid duration', 'misfiled record', 'duplicate record',
+    'conflicting duplicate record', 'malformed session', 'duplicate session ID', 'session already recorded',
+    'orphaned role entry', 'missing export file'
+}
+
+
+class Report:
+    """Problem counts with a few examples of each"""
+
+    def __init__(self, show: int):
+        self.show = show
+        self.counts = Counter()
+        self.examples = {}
+        self.repaired = Counter()
+
+    def problem(self, check: str, message: str):
+        self.counts[check] += 1
+        examples = self.examples.setdefault(check, [])
+        if len(examples) < self.show:
+            examples.append(message)
+
+    def fixed(self, check: str, count: int = 1):
+        self.repaired[check] += count
+
+
+class Quarantine:
+    """Entries removed by --repair, saved per source file under fsck_quarantine/<timestamp>/"""
+
+    def __init__(self, data_dir: str):
+        self.data_dir = data_dir
+        self.directory = os.path.join(data_dir, "fsck_quarantine", datetime.now().strftime("%Y%m%d_%H%M%S"))
+        self.entries = {}
+
+    def add(self, source: str, item):
+        self.entries.setdefault(source, []).append(item)
+
+    def move_file(self, path: str):
+        os.makedirs(self.directory, exist_ok=True)
+        shutil.move(path, os.path.join(self.directory, os.path.relpath(path, self.data_dir).replace(os.sep, '__')))
+
+    def save(self):
+        if not self.entries:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        for source, items in self.entries.items():
+            name = source.replace('/', '__')
+            if not name.endswith('.json'):
+                name += '.json'
+            app.write_data_file(os.path.join(self.directory, name), items, 'json')
+
+
+def read_list(path: str, report: Report, check: str):
+    """A data file holding a list, or None (reported) if it cannot be read"""
+    try:
+        data = app.read_data_file(path)
+    except FileNotFoundError:
+        return []
+    except Exception as e:
+        report.problem(check, f"{path}: {e}")
+        return None
+    if not isinstance(data, list):
+        report.problem(check, f"{path}: not a list")
+        return None
+    return data
+
+
+def parse_record(item):
+    """(user ID, user name, time in, time out) as epochs, or None if the entry is malformed
+
+    Epoch entries are read as they are, without building an AttendanceRecord,
+    which keeps a run over millions of records fast.
+    """
+    try:
+        if not isinstance(item, dict) or not item.get('user_id') or not isinstance(item.get('user_name'), str):
+            return None
+        time_in = item['time_in']
+        time_out = item['time_out']
+        if type(time_in) is int and type(time_out) is int:
+            return item['user_id'], item['user_name'], time_in, time_out
+        if not isinstance(time_in, str):
+            return None
+        record = app.AttendanceRecord.from_dict(item)
+        return record.user_id, record.user_name, record.time_in_epoch, record.time_out_epoch
+    except (KeyError, ValueError, TypeError, AttributeError, OverflowError, OSError):
+        return None
+
+
+def epoch_date(epoch: int) -> str:
+    return date.fromordinal(app.local_day_seconds(epoch)[0]).isoformat()
+
+
+class StoreChecker:
+    """Streams one attendance store (partition directory) month by month"""
+
+    def __init__(self, label: str, partition_dir: str, compress_all: bool, report: Report,
+                 quarantine: Quarantine, repair: bool):
+        self.label = label
+        self.partition_dir = partition_dir
+        self.compress_all = compress_all
+        self.report = report
+        self.quarantine = quarantine
+        self.repair = repair
+        self.manifest_file = os.path.join(partition_dir, "manifest.json")
+        self.manifest = {}
+        self.manifest_changed = False
+        self.files = {}
+        if not os.path.isdir(partition_dir):
+            return
+        if os.path.exists(self.manifest_file):
+            try:
+                self.manifest = app.read_data_file(self.manifest_file)
+            except Exception as e:
+                report.problem('unreadable file', f"{self.manifest_file}: {e}")
+                if repair:
+                    quarantine.move_file(self.manifest_file)
+                self.manifest_changed = True
+        self.files = self.scan_files()
+
+    def scan_files(self) -> dict:
+        """{month key: file name} of the partition files on disk, newest file when both tiers exist"""
+        found = {}
+        with os.scandir(self.partition_dir) as entries:
+            for entry in entries:
+                name = entry.name
+                if not entry.is_file() or name == "manifest.json" or name.endswith('.tmp'):
+                    continue
+                key = name.split('.json')[0]
+                if not (name.endswith('.json') or name.endswith('.json' + app.COLD_SUFFIX)):
+                    continue
+                try:
+                    app.month_bounds(key)
+                except ValueError:
+                    continue
+                found.setdefault(key, []).append((entry.stat().st_mtime_ns, name))
+        files = {}
+        for key, names in found.items():
+            names.sort()
+            files[key] = names[-1][1]
+            for _, stale in names[:-1]:
+                self.report.problem('partition in both tiers', f"{self.label} {key}: {stale} and {names[-1][1]}")
+                if self.repair:
+                    self.quarantine.move_file(os.path.join(self.partition_dir, stale))
+                    self.report.fixed('partition in both tiers')
+        return files
+
+    def keys(self) -> set:
+        return set(self.manifest) | set(self.files)
+
+    def load(self, key: str):
+        """Raw entries of a month, or None when the month has no readable file"""
+        entry = self.manifest.get(key)
+        filename = self.files.get(key)
+        if filename is None:
+            if entry is not None:
+                self.report.problem('manifest entry without file', f"{self.label} {key}: {entry.get('file')}")
+                if self.repair:
+                    del self.manifest[key]
+                    self.manifest_changed = True
+                    self.report.fixed('manifest entry without file')
+            return None
+        if entry is None:
+            self.report.problem('file missing from manifest', f"{self.label} {filename}")
+        path = os.path.join(self.partition_dir, filename)
+        items = read_list(path, self.report, 'unreadable file')
+        if items is None and self.repair:
+            self.quarantine.move_file(path)
+            del self.files[key]
+            self.manifest.pop(key, None)
+            self.manifest_changed = True
+            self.report.fixed('unreadable file')
+        return items
+
+    def store(self, key: str, items: list, rewrite: bool):
+        """Write a month back (when changed) and bring its manifest entry up to date"""
+        filename = self.files.get(key)
+        if not items:
+            if self.repair and (filename or key in self.manifest):
+                if filename:
+                    os.remove(os.path.join(self.partition_dir, filename))
+                    del self.files[key]
+                self.manifest.pop(key, None)
+                self.manifest_changed = True
+            return
+        cold = filename.endswith(app.COLD_SUFFIX) if filename else self.compress_all
+        filename = f"{key}.json{app.COLD_SUFFIX if cold else ''}"
+        times = [parsed[2] for parsed in map(parse_record, items) if parsed]
+        expected = {
+            'file': filename,
+            'tier': 'cold' if cold else 'hot',
+            'count': len(items),
+            'first_date': epoch_date(min(times)),
+            'last_date': epoch_date(max(times))
+        }
+        entry = self.manifest.get(key)
+        if entry is not None and not rewrite and any(entry.get(name) != value for name, value in expected.items()):
+            self.report.problem(
+                'manifest entry out of date',
+                f"{self.label} {key}: {entry.get('count')} records listed, {len(items)} found"
+            )
+        if not self.repair:
+            return
+        if rewrite:
+            os.makedirs(self.partition_dir, exist_ok=True)
+            app.write_data_file(os.path.join(self.partition_dir, filename), items)
+            self.files[key] = filename
+        if entry != expected:
+            if entry is not None and not rewrite:
+                self.report.fixed('manifest entry out of date')
+            elif entry is None and not rewrite:
+                self.report.fixed('file missing from manifest')
+            self.manifest[key] = expected
+            self.manifest_changed = True
+
+    def save_manifest(self):
+        if self.repair and self.manifest_changed:
+            os.makedirs(self.partition_dir, exist_ok=True)
+            app.write_data_file(self.manifest_file, self.manifest)
+
+
+def check_department(department: str, data_dir: str, users: dict, report: Report, quarantine: Quarantine,
+                     repair: bool, verify_exports: bool) -> Counter:
+    """Check one department's sessions, records, history and roles exports; returns totals"""
+    totals = Counter()
+    now = int(time.time())
+    label = department
+
+    # Active sessions, indexed by (user, time in) so records can be matched against them
+    sessions_file = os.path.join(data_dir, "active_sessions.json")
+    sessions = read_list(sessions_file, report, 'unreadable file')
+    if sessions is None:
+        if repair:
+            quarantine.move_file(sessions_file)
+            app.write_data_file(sessions_file, [])
+            report.fixed('unreadable file')
+        sessions = []
+    kept_sessions = []
+    session_ids = set()
+    session_keys = {}
+    open_per_user = Counter()
+    for session in sessions:
+        try:
+            key = (session['user_id'].lower(), int(session['time_in']))
+            session_id = session['session_id']
+            if not isinstance(session['time_in'], int) or not session['user_name']:
+                raise ValueError
+        except (KeyError, TypeError, ValueError, AttributeError):
+            report.problem('malformed session', f"{label}: {session!r}")
+            quarantine.add(f"{label}/active_sessions.json", session)
+            continue
+        if session_id in session_ids:
+            report.problem('duplicate session ID', f"{label}: {session_id}")
+            quarantine.add(f"{label}/active_sessions.json", session)
+            continue
+        session_ids.add(session_id)
+        session_keys[key] = session_id
+        open_per_user[key[0]] += 1
+        if key[0] not in users:
+            report.problem('session of unknown user', f"{label}: {session_id}")
+        elif users[key[0]] != department:
+            report.problem('session in another department', f"{label}: {session_id} (user is in {users[key[0]]})")
+        if session['time_in'] > now + 300:
+            report.problem('session in the future', f"{label}: {session_id} at {app.format_timestamp(session['time_in'])}")
+        kept_sessions.append(session)
+    for user_id, count in open_per_user.items():
+        if count > 1:
+            report.problem('several open sessions for one user', f"{label}: {user_id} has {count}")
+    totals['sessions'] += len(kept_sessions)
+    recorded_sessions = set()
+
+    # Records: the live store and the exported history, month by month
+    # History first: a record in both stores was exported already, so the live copy is the duplicate
+    stores = [
+        StoreChecker(f"{label}/attendance_history", os.path.join(data_dir, "attendance_history"), True,
+                     report, quarantine, repair),
+        StoreChecker(f"{label}/attendance_partitions", os.path.join(data_dir, "attendance_partitions"), False,
+                     report, quarantine, repair)
+    ]
+    misfiled = {}
+    for key in sorted(set().union(*(store.keys() for store in stores))):
+        first, last = app.month_bounds(key)
+        month_start, month_end = app.local_epoch(first), app.local_epoch(last + 1)
+        seen = {}
+        for store in stores:
+            items = store.load(key)
+            if items is None:
+                continue
+            kept = []
+            for item in items:
+                parsed = parse_record(item)
+                if parsed is None:
+                    report.problem('malformed record', f"{store.label} {key}: {item!r}")
+                    quarantine.add(f"{store.label}/{key}", item)
+                    continue
+                user_id, user_name, time_in, time_out = parsed
+                duration = time_out - time_in
+                # Sessions can stay open over a weekend, so only a time out before the time in is invalid
+                if duration < 0:
+                    report.problem('invalid duration', f"{store.label} {key}: {user_id} {duration} s")
+                    quarantine.add(f"{store.label}/{key}", item)
+                    continue
+                if not month_start <= time_in < month_end:
+                    report.problem('misfiled record', f"{store.label} {key}: {user_id} on {epoch_date(time_in)}")
+                    target = app.month_key(app.local_day_seconds(time_in)[0])
+                    misfiled.setdefault((store, target), []).append(item)
+                    continue
+                record_key = (user_id.lower(), time_in)
+                fingerprint = (user_name, time_out)
+                if record_key in seen:
+                    if seen[record_key] == fingerprint:
+                        report.problem('duplicate record', f"{store.label} {key}: {user_id} on {epoch_date(time_in)}")
+                    else:
+                        report.problem('conflicting duplicate record',
+                                       f"{store.label} {key}: {user_id} at {app.format_timestamp(time_in)}")
+                        quarantine.add(f"{store.label}/{key}", item)
+                    continue
+                seen[record_key] = fingerprint
+                if record_key in session_keys:
+                    report.problem('session already recorded', f"{label}: {session_keys[record_key]}")
+                    recorded_sessions.add(session_keys[record_key])
+                if record_key[0] not in users:
+                    report.problem('record of unknown user', f"{store.label} {key}: {user_id}")
+                elif users[record_key[0]] != department:
+                    report.problem('record in another department',
+                                   f"{store.label} {key}: {user_id} (user is in {users[record_key[0]]})")
+                kept.append(item)
+            removed = len(items) - len(kept)
+            totals['records'] += len(kept)
+            store.store(key, kept, rewrite=removed > 0)
+            if repair and removed:
+                report.fixed('records removed or moved', removed)
+
+    # Misfiled records go into their own month, unless that month already has them
+    for (store, key), items in misfiled.items():
+        if not repair:
+            continue
+        existing = store.load(key) or []
+        known = set()
+        for item in existing:
+            parsed = parse_record(item)
+            if parsed:
+                known.add((parsed[0].lower(), parsed[2]))
+        for item in items:
+            parsed = parse_record(item)
+            if (parsed[0].lower(), parsed[2]) not in known:
+                known.add((parsed[0].lower(), parsed[2]))
+                existing.append(item)
+        store.store(key, existing, rewrite=True)
+    for store in stores:
+        store.save_manifest()
+
+    if repair and (recorded_sessions or len(kept_sessions) != len(sessions)):
+        app.write_data_file(sessions_file, [s for s in kept_sessions if s['session_id'] not in recorded_sessions])
+        report.fixed('sessions removed', len(sessions) - len(kept_sessions) + len(recorded_sessions))
+
+    # Roles exports
+    exports_dir = os.path.join(data_dir, "roles_exports")
+    manifest_file = os.path.join(exports_dir, "manifest.json")
+    entries = read_list(manifest_file, report, 'unreadable file')
+    if entries is None:
+        entries = []
+    kept_entries = []
+    for entry in entries:
+        if entry.get('object'):
+            path = os.path.join(exports_dir, "objects", entry['object'])
+        else:
+            path = os.path.join(exports_dir, entry.get('file', ''))
+        if not os.path.isfile(path):
+            report.problem('missing export file', f"{label}: {entry.get('file')}")
+            continue
+        if verify_exports and entry.get('object'):
+            if app.file_sha256(path) != app.split_export_extension(entry['object'])[0]:
+                report.problem('corrupt export file', f"{label}: {entry.get('file')} ({entry['object']})")
+        kept_entries.append(entry)
+    totals['exports'] += len(kept_entries)
+    if repair and len(kept_entries) != len(entries):
+        app.write_data_file(manifest_file, kept_entries)
+        report.fixed('export entries removed', len(entries) - len(kept_entries))
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data-dir', default='.', help="the app's data directory (default: current directory)")
+    parser.add_argument('--repair', action='store_true', help="fix what can be fixed (close the app first)")
+    parser.add_argument('--verify-exports', action='store_true', help="also check the hash of every stored export")
+    parser.add_argument('--show', type=int, default=5, help="examples to print per problem")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    report = Report(args.show)
+    quarantine = Quarantine(args.data_dir)
+
+    # Users: {lower-case user ID: department}
+    users = {}
+    registered = read_list(os.path.join(args.data_dir, "registered_users.json"), report, 'unreadable file') or []
+    for user in registered:
+        try:
+            user_id = user['user_id'].lower()
+        except (KeyError, TypeError, AttributeError):
+            report.problem('malformed user', repr(user))
+            continue
+        if user_id in users:
+            report.problem('duplicate user ID', user['user_id'])
+        users[user_id] = user.get('department') or app.DEFAULT_DEPARTMENT
+    users.setdefault('admin', app.DEFAULT_DEPARTMENT)
+    for filename in ("admin_users.json", "roles_users.json"):
+        path = os.path.join(args.data_dir, filename)
+        entries = read_list(path, report, 'unreadable file')
+        if not entries:
+            continue
+        kept = [entry for entry in entries if str(entry.get('user_id', '')).lower() in users]
+        for entry in entries:
+            if entry not in kept:
+                report.problem('orphaned role entry', f"{filename}: {entry.get('user_id')}")
+        if args.repair and len(kept) != len(entries):
+            for entry in entries:
+                if entry not in kept:
+                    quarantine.add(filename, entry)
+            app.write_data_file(path, kept)
+            report.fixed('role entries removed', len(entries) - len(kept))
+
+    # Departments: the default one in the data directory, the others under departments/
+    shards = app.DepartmentShards(args.data_dir)
+    departments = [(app.DEFAULT_DEPARTMENT, args.data_dir)]
+    for department in shards.departments()[1:]:
+        departments.append((department, shards.shard_dir(department)))
+    if os.path.isdir(shards.departments_dir):
+        known = {os.path.abspath(directory) for _, directory in departments}
+        for entry in os.scandir(shards.departments_dir):
+            if entry.is_dir() and os.path.abspath(entry.path) not in known:
+                report.problem('department folder without department.json', entry.path)
+
+    totals = Counter()
+    for department, directory in departments:
+        totals += check_department(department, directory, users, report, quarantine, args.repair, args.verify_exports)
+    if args.repair:
+        quarantine.save()
+
+    elapsed = time.perf_counter() - started
+    print(f"Checked {len(departments)} departments, {len(users)} users, {totals['records']} records, "
+          f"{totals['sessions']} active sessions and {totals['exports']} roles exports in {elapsed:.1f} s")
+    if not report.counts:
+        print("\nOK")
+        sys.exit(0)
+
+    print(f"\n  {'problem':<44}{'count':>8}" + ("" if args.repair else "  repairable"))
+    for check, count in sorted(report.counts.items()):
+        flag = "" if args.repair else ("  yes" if check in REPAIRABLE else "  no")
+        print(f"  {check:<44}{count:>8}{flag}")
+        for example in report.examples[check]:
+            print(f"      {example}")
+    if args.repair:
+        print("\nRepairs:")
+        for change, count in sorted(report.repaired.items()):
+            print(f"  {change:<44}{count:>8}")
+        if quarantine.entries or os.path.isdir(quarantine.directory):
+            print(f"Removed entries were saved to {quarantine.directory}")
+        remaining = {check for check in report.counts if check not in REPAIRABLE}
+        print("Needs review: " + ", ".join(sorted(remaining)) if remaining else "All problems repaired")
+        sys.exit(1 if remaining else 0)
+    print("\nPROBLEMS FOUND" + (" (run with --repair to fix the repairable ones)"
+                                if any(check in REPAIRABLE for check in report.counts) else ""))
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+"""Simulate many employees clocking in and out at the same time.
+
+Usage: python tools/load_generator.py [--users 300] [--rate 200] [--duration 10]
+                                      [--force-ratio 0.05] [--export-interval 2]
+                                      [--data-dir DIR]
+
+Each simulated employee is a thread that alternates time in and time out
+(occasionally a forced time out) with exponentially distributed pauses,
+so all employees together arrive at about --rate operations per second.
+A roles thread exports and clears the records every --export-interval
+seconds. All operations go through AttendanceService against a scratch
+data directory, never the real data files.
+
+Afterwards the data files are re-read from disk and compared with what
+the generator did: every closed session must be either stored or
+exported exactly once, and the active sessions file must hold exactly
+the sessions still open. The script exits with status 1 if it finds
+lost, duplicated or unexpected records or sessions.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import wfh_attendance as app
+
+
+class VirtualClock:
+    """Strictly increasing epoch seconds, so every time in and time out is distinct"""
+
+    def __init__(self, start: int):
+        self.lock = threading.Lock()
+        self.current = start
+
+    def tick(self) -> int:
+        with self.lock:
+            self.current += 1
+            return self.current
+
+
+class Ledger:
+    """What the generator did, to check the data files against afterwards"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = Counter()
+        self.closed = []
+        self.open_sessions = {}
+        self.export_files = []
+
+    def record(self, operation: str, seconds: float):
+        with self.lock:
+            self.latencies.setdefault(operation, []).append(seconds)
+
+    def error(self, operation: str, error: Exception):
+        with self.lock:
+            self.errors[f"{operation}: {type(error).__name__}: {error}"] += 1
+
+
+def employee(service, clock, ledger, user_id, stop, rate, force_ratio, seed):
+    rng = random.Random(seed)
+    session = None
+    while not stop.wait(rng.expovariate(rate)):
+        if session is None:
+            operation = 'time_in'
+        else:
+            operation = 'force_time_out' if rng.random() < force_ratio else 'time_out'
+        start = time.perf_counter()
+        try:
+            if session is None:
+                session = service.clock_in(user_id, f"Employee {user_id}", clock.tick())
+                with ledger.lock:
+                    ledger.open_sessions[session['session_id']] = session
+            else:
+                service.clock_out(session['session_id'], clock.tick())
+                with ledger.lock:
+                    del ledger.open_sessions[session['session_id']]
+                    ledger.closed.append((user_id, session['time_in']))
+                session = None
+        except Exception as e:
+            ledger.error(operation, e)
+            continue
+        ledger.record(operation, time.perf_counter() - start)
+
+
+def exporter(service, ledger, export_dir, stop, interval):
+    number = 0
+    while not stop.wait(interval):
+        number += 1
+        destination = os.path.join(export_dir, f"export_{number:04d}.csv")
+        start = time.perf_counter()
+        try:
+            service.export_records(destination)
+        except Exception as e:
+            ledger.error('export', e)
+            continue
+        ledger.record('export', time.perf_counter() - start)
+        ledger.export_files.append(destination)
+
+
+def percentile(values, fraction: float) -> float:
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def check_consistency(data_dir: str, ledger: Ledger) -> dict:
+    """Compare the data files on disk with the generator's ledger"""
+    service = app.AttendanceService.open(data_dir)
+    found = Counter((record.user_id, record.time_in_epoch) for record in service.store.iter_records())
+    for path in ledger.export_files:
+        for row in app.read_export_rows(path):
+            found[(row['user_id'], app.parse_timestamp(f"{row['date']} {row['time_in']}"))] += 1
+    expected = Counter(ledger.closed)
+
+    disk_sessions = {session['session_id'] for session in service.sessions}
+    open_sessions = set(ledger.open_sessions)
+    return {
+        'records expected': sum(expected.values()),
+        'records found': sum(found.values()),
+        'lost records': sum((expected - found).values()),
+        'duplicated records': sum(count - 1 for count in found.values() if count > 1),
+        'unexpected records': sum(1 for key in found if key not in expected),
+        'sessions open': len(open_sessions),
+        'sessions missing from file': len(open_sessions - disk_sessions),
+        'stale sessions in file': len(disk_sessions - open_sessions),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=300, help="simulated employees (one thread each)")
+    parser.add_argument('--rate', type=float, default=200.0, help="target operations per second across all employees")
+    parser.add_argument('--duration', type=float, default=10.0, help="seconds to generate load for")
+    parser.add_argument('--force-ratio', type=float, default=0.05, help="share of time outs done as forced time outs")
+    parser.add_argument('--export-interval', type=float, default=2.0, help="seconds between exports, 0 to disable")
+    parser.add_argument('--data-dir', help="scratch data directory (default: a new temporary directory)")
+    args = parser.parse_args()
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="wfh_load_")
+    export_dir = os.path.join(data_dir, "load_exports")
+    os.makedirs(export_dir, exist_ok=True)
+    print(f"Data directory: {data_dir}")
+
+    service = app.AttendanceService.open(data_dir)
+    clock = VirtualClock(int(time.time()))
+    ledger = Ledger()
+    stop = threading.Event()
+    per_user_rate = args.rate / args.users
+
+    threads = [
+        threading.Thread(
+            target=employee,
+            args=(service, clock, ledger, f"EMP{i:04d}", stop, per_user_rate, args.force_ratio, i),
+            daemon=True
+        )
+        for i in range(args.users)
+    ]
+    if args.export_interval > 0:
+        threads.append(threading.Thread(
+            target=exporter, args=(service, ledger, export_dir, stop, args.export_interval), daemon=True
+        ))
+
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    total = sum(len(values) for values in ledger.latencies.values())
+    print(f"\n{total} operations in {elapsed:.1f} s: {total / elapsed:.1f} ops/s "
+          f"({args.users} employees, target {args.rate:g} ops/s)")
+    print(f"\n  {'operation':<16}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for operation in ('time_in', 'time_out', 'force_time_out', 'export'):
+        values = ledger.latencies.get(operation)
+        if not values:
+            continue
+        print(f"  {operation:<16}{len(values):>8}"
+              f"{percentile(values, 0.50) * 1000:>10.1f}{percentile(values, 0.95) * 1000:>10.1f}"
+              f"{percentile(values, 0.99) * 1000:>10.1f}{max(values) * 1000:>10.1f}")
+    if ledger.errors:
+        print("\nErrors:")
+        for message, count in ledger.errors.most_common():
+            print(f"  {count} x {message}")
+
+    report = check_consistency(data_dir, ledger)
+    print("\nConsistency check:")
+    for name, value in report.items():
+        print(f"  {name:<28}{value}")
+
+    problems = sum(report[name] for name in (
+        'lost records', 'duplicated records', 'unexpected records',
+        'sessions missing from file', 'stale sessions in file'
+    ))
+    print("\nOK" if problems == 0 and not ledger.errors else "\nINCONSISTENT")
+    sys.exit(0 if problems == 0 and not ledger.errors else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,16 +2,2404 @@ import tkinter as tk
 from tkinter import ttk, messagebox
 import json
 import os
-from datetime import datetime
+from datetime import datetime, date
 import pandas as pd
+import numpy as np
 from typing import Dict, List, Optional
 import subprocess
 import sys
 import zipfile
 import shutil
 import stat
+import hashlib
+import threading
+import csv
+import gzip
+import lzma
+import sqlite3
+import time
+import bisect
+import heapq
+import tracemalloc
+import functools
+import cProfile
+import pstats
+import io
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+def time_to_seconds(value: str) -> int:
+    """Convert an HH:MM:SS string to seconds since midnight"""
+    hours, minutes, seconds = value.split(':')
+    return int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+
+
+def seconds_to_time(value: int) -> str:
+    """Convert seconds since midnight to an HH:MM:SS string"""
+    hours, remainder = divmod(value, 3600)
+    minutes, seconds = divmod(remainder, 60)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+
+
+SECONDS_PER_DAY = 86400
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def local_epoch(day: int, seconds: int = 0) -> int:
+    """Epoch seconds of a local wall-clock time, given a day ordinal and seconds since midnight"""
+    midnight = datetime.combine(date.fromordinal(day), datetime.min.time())
+    return int((midnight + timedelta(seconds=seconds)).timestamp())
+
+
+def local_day_seconds(epoch: int) -> tuple:
+    """Local day ordinal and seconds since midnight of an epoch time"""
+    moment = datetime.fromtimestamp(epoch)
+    return moment.toordinal(), moment.hour * 3600 + moment.minute * 60 + moment.second
+
+
+def parse_timestamp(value, fmt: str = TIMESTAMP_FORMAT) -> int:
+    """Epoch seconds of a local time string; numbers are returned unchanged"""
+    if isinstance(value, (int, float)):
+        return int(value)
+    return int(datetime.strptime(value, fmt).timestamp())
+
+
+def format_timestamp(value, fmt: str = TIMESTAMP_FORMAT) -> str:
+    """Local time string of an epoch timestamp, for display and export only"""
+    if value is None or value == "":
+        return ""
+    return datetime.fromtimestamp(parse_timestamp(value)).strftime(fmt)
+
+
+# Version 2 stores timestamps as epoch seconds instead of date/time strings
+STORAGE_VERSION = 2
+
+
+def legacy_session_time_in(session: Dict) -> Optional[int]:
+    """Epoch time in of a version 1 session, or None if it cannot be recovered.
+
+    The date normally comes from the 'date' key; without it the clock-in
+    time is read from the session ID ("<user id>_YYYYmmddHHMMSS").
+    """
+    try:
+        if 'date' in session:
+            return parse_timestamp(f"{session['date']} {session['time_in']}")
+        return parse_timestamp(str(session.get('session_id', '')).rpartition('_')[2], '%Y%m%d%H%M%S')
+    except (TypeError, ValueError):
+        return None
+
+
+def format_day_range(start_day: Optional[int], end_day: Optional[int]) -> str:
+    """Describe an inclusive day ordinal range with open ends (None), e.g. '2024-01-01 to 2024-01-31'"""
+    start = date.fromordinal(start_day).isoformat() if start_day is not None else None
+    end = date.fromordinal(end_day).isoformat() if end_day is not None else None
+    if start and end:
+        return f"{start} to {end}"
+    if start:
+        return f"since {start}"
+    if end:
+        return f"up to {end}"
+    return "all dates"
+
+
+def format_duration(total_seconds: float) -> str:
+    """Format a duration in seconds as HH:MM"""
+    hours, remainder = divmod(total_seconds, 3600)
+    minutes, seconds = divmod(remainder, 60)
+    return f"{int(hours):02d}:{int(minutes):02d}"
+
+
+class AttendanceRecord:
+    """Compact in-memory attendance record.
+
+    User keys are interned so thousands of records share one string per user,
+    the date is kept as a day ordinal and times as seconds since midnight of
+    that day. The time out is not wrapped at midnight, so a session left
+    open over a weekend keeps its full length; a time out earlier than the
+    time in is rejected with ValueError. On disk a record stores its
+    time in and time out as epoch seconds; date and time strings are
+    produced only for display and export.
+    """
+    __slots__ = ('user_id', 'user_name', 'day', 'time_in', 'time_out')
+
+    def __init__(self, user_id: str, user_name: str, day: int, time_in: int, time_out: int):
+        self.user_id = sys.intern(user_id)
+        self.user_name = sys.intern(user_name)
+        self.day = day
+        if time_out < time_in:
+            raise ValueError(f"time out {time_out} is earlier than time in {time_in}")
+        self.time_in = time_in
+        self.time_out = time_out
+
+    @classmethod
+    def from_epochs(cls, user_id: str, user_name: str, time_in: int, time_out: int) -> 'AttendanceRecord':
+        """Build a record from epoch time in/out"""
+        day, seconds_in = local_day_seconds(time_in)
+        return cls(user_id, user_name, day, seconds_in, seconds_in + time_out - time_in)
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'AttendanceRecord':
+        """Build a record from its JSON dict form (epoch times, or date/time strings from older files)"""
+        if isinstance(data['time_in'], str):
+            time_in = time_to_seconds(data['time_in'])
+            time_out = time_to_seconds(data['time_out'])
+            # Older files kept only the time of day, so a time out before the time in crossed midnight
+            if time_out < time_in:
+                time_out += SECONDS_PER_DAY
+            return cls(
+                data['user_id'],
+                data['user_name'],
+                date.fromisoformat(data['date']).toordinal(),
+                time_in,
+                time_out
+            )
+        return cls.from_epochs(data['user_id'], data['user_name'], data['time_in'], data['time_out'])
+
+    def to_dict(self) -> Dict:
+        """Convert the record to its JSON dict form"""
+        return {
+            'user_id': self.user_id,
+            'user_name': self.user_name,
+            'time_in': self.time_in_epoch,
+            'time_out': self.time_out_epoch
+        }
+
+    def export_row(self) -> Dict:
+        """Formatted values for the EXPORT_COLUMNS of an export file"""
+        return {
+            'user_id': self.user_id,
+            'user_name': self.user_name,
+            'date': self.date_str,
+            'time_in': self.time_in_str,
+            'time_out': self.time_out_str,
+            'duration': self.duration_str
+        }
+
+    @property
+    def time_in_epoch(self) -> int:
+        return local_epoch(self.day, self.time_in)
+
+    @property
+    def time_out_epoch(self) -> int:
+        return self.time_in_epoch + self.duration_seconds
+
+    @property
+    def date_str(self) -> str:
+        return date.fromordinal(self.day).isoformat()
+
+    @property
+    def time_in_str(self) -> str:
+        return seconds_to_time(self.time_in)
+
+    @property
+    def time_out_str(self) -> str:
+        return seconds_to_time(self.time_out % SECONDS_PER_DAY)
+
+    @property
+    def duration_seconds(self) -> int:
+        return self.time_out - self.time_in
+
+    @property
+    def duration_str(self) -> str:
+        return format_duration(self.duration_seconds)
+
+    def display_values(self) -> tuple:
+        """Values shown in the records treeview"""
+        return (
+            self.user_id,
+            self.user_name,
+            self.date_str,
+            self.time_in_str,
+            self.time_out_str,
+            self.duration_str
+        )
+
+
+# Sort keys for the records columns, used by AttendanceStore.query
+RECORD_SORT_KEYS = {
+    'user_id': lambda record: record.user_id.lower(),
+    'user_name': lambda record: record.user_name.lower(),
+    'date': lambda record: (record.day, record.time_in),
+    'time_in': lambda record: record.time_in,
+    'time_out': lambda record: record.time_out % SECONDS_PER_DAY,
+    'duration': lambda record: record.duration_seconds
+}
+
+
+def parse_records(data: List[Dict], source: str) -> List[AttendanceRecord]:
+    """Convert JSON dicts to records, skipping entries that cannot be parsed"""
+    records = []
+    for item in data:
+        try:
+            records.append(AttendanceRecord.from_dict(item))
+        except (KeyError, ValueError, TypeError, AttributeError) as e:
+            print(f"Skipping invalid attendance record in {source} {item!r}: {e}")
+    return records
+
+
+def json_dumps(data) -> bytes:
+    """Compact JSON, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(',', ':')).encode('utf-8')
+
+
+def json_loads(raw):
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def msgpack_dumps(data) -> bytes:
+    return msgpack.packb(data, use_bin_type=True)
+
+
+def msgpack_loads(raw: bytes):
+    if msgpack is None:
+        raise ValueError("data is msgpack-encoded but msgpack is not installed")
+    return msgpack.unpackb(raw, raw=False)
+
+
+# Encoders for the data files. JSON stays the default so the files remain
+# readable; WFH_SERIALIZER=msgpack selects the binary encoding when installed.
+SERIALIZERS = {'json': json_dumps}
+if msgpack is not None:
+    SERIALIZERS['msgpack'] = msgpack_dumps
+SERIALIZER = os.environ.get('WFH_SERIALIZER', 'json')
+if SERIALIZER not in SERIALIZERS:
+    print(f"Serializer {SERIALIZER!r} is not available, using json")
+    SERIALIZER = 'json'
+
+
+def decode_data(raw: bytes):
+    """Decode a data file's contents; JSON documents start with [ or {, anything else is msgpack"""
+    stripped = raw.lstrip()
+    if not stripped:
+        raise ValueError("empty data file")
+    if stripped[:1] in (b'[', b'{'):
+        return json_loads(raw)
+    return msgpack_loads(raw)
+
+
+# Data files with this suffix are lzma-compressed (the cold tier of the attendance stores)
+COLD_SUFFIX = ".xz"
+
+
+def read_data_file(filepath: str):
+    """Read a data file written by any serializer, decompressing cold files"""
+    with open(filepath, 'rb') as f:
+        raw = f.read()
+    if filepath.endswith(COLD_SUFFIX):
+        raw = lzma.decompress(raw)
+    return decode_data(raw)
+
+
+def write_data_file(filepath: str, data, serializer: Optional[str] = None):
+    """Encode data, write it to a temporary file and move it into place"""
+    encoded = SERIALIZERS[serializer or SERIALIZER](data)
+    if filepath.endswith(COLD_SUFFIX):
+        encoded = lzma.compress(encoded)
+    temp_path = f"{filepath}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(encoded)
+    os.replace(temp_path, filepath)
+
+
+def month_key(day: int) -> str:
+    """Partition key (YYYY-MM) for a day ordinal"""
+    return date.fromordinal(day).strftime("%Y-%m")
+
+
+def month_bounds(key: str) -> tuple:
+    """First and last day ordinals of a YYYY-MM partition key"""
+    year, month = (int(part) for part in key.split('-'))
+    first = date(year, month, 1)
+    if month == 12:
+        following = date(year + 1, 1, 1)
+    else:
+        following = date(year, month + 1, 1)
+    return first.toordinal(), following.toordinal() - 1
+
+
+class AttendanceStore:
+    """Attendance history partitioned into one JSON file per month.
+
+    A small manifest records each partition's file, record count and date
+    span, so callers only load the partitions overlapping the date range
+    they ask for. Only partitions changed since the last save are rewritten.
+    
+    Partitions are hot (plain files) or cold (lzma-compressed .json.xz).
+    freeze() moves closed months to the cold tier; a cold partition is only
+    decompressed when a query touches its month, and goes back to the hot
+    tier if it is changed. With compress_all every partition is cold.
+    """
+
+    def __init__(self, partition_dir: str, legacy_file: Optional[str] = None, compress_all: bool = False):
+        self.partition_dir = partition_dir
+        self.manifest_file = os.path.join(partition_dir, "manifest.json")
+        self.legacy_file = legacy_file
+        self.compress_all = compress_all
+        self.manifest: Dict[str, Dict] = {}
+        self.partitions: Dict[str, List[AttendanceRecord]] = {}
+        self.dirty = set()
+        # Partitions to write to the cold tier on the next save
+        self.freezing = set()
+        # Per-partition indexes of record positions, built on first query
+        self.user_indexes: Dict[str, Dict[str, List[int]]] = {}
+        self.day_indexes: Dict[str, Dict[int, List[int]]] = {}
+        # Incremented on every change so views can tell when cached results are stale
+        self.version = 0
+        # The same, per user (lower-case ID): only changes to that user's records count
+        self.user_versions: Dict[str, int] = {}
+
+    def load(self, preload_day: Optional[int] = None):
+        """Read the manifest, migrating the single-file history if needed"""
+        os.makedirs(self.partition_dir, exist_ok=True)
+        if os.path.exists(self.manifest_file):
+            self.manifest = read_data_file(self.manifest_file)
+        elif self.legacy_file and os.path.exists(self.legacy_file):
+            self.migrate_legacy_file()
+        if preload_day is not None:
+            self.load_partition(month_key(preload_day))
+
+    def migrate_legacy_file(self):
+        """Split the single attendance_data.json history into monthly partitions"""
+        records = parse_records(read_data_file(self.legacy_file), self.legacy_file)
+        for record in records:
+            self.append(record)
+        self.save()
+        os.replace(self.legacy_file, f"{self.legacy_file}.migrated")
+        print(f"Migrated {len(records)} records into {len(self.manifest)} monthly partitions")
+
+    def partition_path(self, key: str, cold: bool = False) -> str:
+        return os.path.join(self.partition_dir, f"{key}.json{COLD_SUFFIX if cold else ''}")
+
+    def is_cold(self, key: str) -> bool:
+        entry = self.manifest.get(key)
+        return bool(entry) and entry.get('tier') == 'cold'
+
+    def rewrite(self):
+        """Write every partition back in the current record format, one partition at a time"""
+        for key in sorted(self.manifest):
+            if self.is_cold(key):
+                self.freezing.add(key)
+            self.rewrite_partition(key)
+
+    def rewrite_partition(self, key: str):
+        """Load, save and (if it was not loaded before) release one partition"""
+        loaded = key in self.partitions
+        self.load_partition(key)
+        self.dirty.add(key)
+        self.save()
+        if not loaded:
+            self.partitions.pop(key, None)
+            self.drop_indexes(key)
+
+    def freeze(self, before_day: int) -> int:
+        """Compress the hot partitions of months ending before before_day; returns how many"""
+        frozen = 0
+        for key in sorted(self.manifest):
+            if self.is_cold(key) or key in self.dirty or month_bounds(key)[1] >= before_day:
+                continue
+            self.freezing.add(key)
+            self.rewrite_partition(key)
+            frozen += 1
+        return frozen
+
+    def release(self):
+        """Drop loaded partitions that have no unsaved changes"""
+        for key in list(self.partitions):
+            if key not in self.dirty:
+                del self.partitions[key]
+                self.drop_indexes(key)
+
+    def load_partition(self, key: str) -> List[AttendanceRecord]:
+        """Return a partition's records, reading (and for cold partitions decompressing) its file on first use"""
+        if key not in self.partitions:
+            records = []
+            if key in self.manifest:
+                path = os.path.join(self.partition_dir, self.manifest[key]['file'])
+                try:
+                    records = parse_records(read_data_file(path), path)
+                except Exception as e:
+                    print(f"Error loading partition {key}: {e}")
+            self.partitions[key] = records
+        return self.partitions[key]
+
+    def partition_keys(self, start_day: Optional[int] = None, end_day: Optional[int] = None) -> List[str]:
+        """Partition keys whose records may fall inside the date range"""
+        keys = set(self.manifest) | set(self.partitions)
+        selected = []
+        for key in sorted(keys):
+            first, last = month_bounds(key)
+            entry = self.manifest.get(key)
+            if entry and key not in self.dirty:
+                first = date.fromisoformat(entry['first_date']).toordinal()
+                last = date.fromisoformat(entry['last_date']).toordinal()
+            if start_day is not None and last < start_day:
+                continue
+            if end_day is not None and first > end_day:
+                continue
+            selected.append(key)
+        return selected
+
+    def records(self, start_day: Optional[int] = None, end_day: Optional[int] = None) -> List[AttendanceRecord]:
+        """Records within the inclusive day range, oldest partition first"""
+        result = []
+        for key in self.partition_keys(start_day, end_day):
+            first, last = month_bounds(key)
+            records = self.load_partition(key)
+            if (start_day is None or start_day <= first) and (end_day is None or last <= end_day):
+                result.extend(records)
+            else:
+                result.extend(
+                    record for record in records
+                    if (start_day is None or record.day >= start_day)
+                    and (end_day is None or record.day <= end_day)
+                )
+        return result
+
+    def iter_records(self, start_day: Optional[int] = None, end_day: Optional[int] = None):
+        """Yield records within the day range one partition at a time"""
+        for key in self.partition_keys(start_day, end_day):
+            for record in self.load_partition(key):
+                if (start_day is None or record.day >= start_day) and (end_day is None or record.day <= end_day):
+                    yield record
+
+    def user_version(self, user_id: str) -> int:
+        return self.user_versions.get(user_id.lower(), 0)
+
+    def touch_user(self, user_id: str):
+        user_id = user_id.lower()
+        self.user_versions[user_id] = self.user_versions.get(user_id, 0) + 1
+
+    def append(self, record: AttendanceRecord):
+        key = month_key(record.day)
+        records = self.load_partition(key)
+        records.append(record)
+        self.dirty.add(key)
+        self.version += 1
+        self.touch_user(record.user_id)
+        if key in self.user_indexes:
+            position = len(records) - 1
+            self.user_indexes[key].setdefault(record.user_id.lower(), []).append(position)
+            self.day_indexes[key].setdefault(record.day, []).append(position)
+
+    def build_indexes(self, key: str):
+        """Index a partition's record positions by user and by day"""
+        if key in self.user_indexes:
+            return
+        by_user: Dict[str, List[int]] = {}
+        by_day: Dict[int, List[int]] = {}
+        for position, record in enumerate(self.load_partition(key)):
+            by_user.setdefault(record.user_id.lower(), []).append(position)
+            by_day.setdefault(record.day, []).append(position)
+        self.user_indexes[key] = by_user
+        self.day_indexes[key] = by_day
+
+    def drop_indexes(self, key: str):
+        self.user_indexes.pop(key, None)
+        self.day_indexes.pop(key, None)
+
+    def query(self, user_ids=None, start_day: Optional[int] = None, end_day: Optional[int] = None,
+              min_duration: Optional[int] = None, sort_key: Optional[str] = None,
+              descending: bool = False) -> List[AttendanceRecord]:
+        """Filter and sort records using the per-user and per-day indexes.
+
+        user_ids is an optional collection of user IDs (case-insensitive),
+        the day range is inclusive and min_duration is in seconds. Without a
+        sort key records come back in the order they were recorded.
+        """
+        wanted_users = None
+        if user_ids is not None:
+            wanted_users = {user_id.lower() for user_id in user_ids}
+        result = []
+        for key in self.partition_keys(start_day, end_day):
+            records = self.load_partition(key)
+            first, last = month_bounds(key)
+            whole_month = (start_day is None or start_day <= first) and (end_day is None or last <= end_day)
+            if wanted_users is None and whole_month:
+                candidates = records
+            else:
+                self.build_indexes(key)
+                if wanted_users is not None:
+                    by_user = self.user_indexes[key]
+                    positions = [p for user in wanted_users for p in by_user.get(user, ())]
+                else:
+                    by_day = self.day_indexes[key]
+                    positions = [
+                        p for day in range(max(first, start_day or first), min(last, end_day or last) + 1)
+                        for p in by_day.get(day, ())
+                    ]
+                if wanted_users is None or len(wanted_users) > 1:
+                    positions.sort()
+                candidates = [records[p] for p in positions]
+                if wanted_users is not None and not whole_month:
+                    candidates = [
+                        record for record in candidates
+                        if (start_day is None or record.day >= start_day)
+                        and (end_day is None or record.day <= end_day)
+                    ]
+            if min_duration is not None:
+                candidates = [record for record in candidates if record.duration_seconds >= min_duration]
+            result.extend(candidates)
+        if sort_key:
+            result.sort(key=RECORD_SORT_KEYS[sort_key], reverse=descending)
+        elif descending:
+            result.reverse()
+        return result
+
+    def remove_range(self, start_day: Optional[int] = None, end_day: Optional[int] = None) -> int:
+        """Drop all records in the day range and return how many were removed"""
+        removed = 0
+        for key in self.partition_keys(start_day, end_day):
+            records = self.load_partition(key)
+            kept = [
+                record for record in records
+                if (start_day is not None and record.day < start_day)
+                or (end_day is not None and record.day > end_day)
+            ]
+            if len(kept) != len(records):
+                removed += len(records) - len(kept)
+                kept_ids = set(map(id, kept))
+                for user_id in {record.user_id for record in records if id(record) not in kept_ids}:
+                    self.touch_user(user_id)
+                self.partitions[key] = kept
+                self.dirty.add(key)
+                self.drop_indexes(key)
+                self.version += 1
+        return removed
+
+    def save(self):
+        """Write changed partitions and the manifest"""
+        os.makedirs(self.partition_dir, exist_ok=True)
+        for key in sorted(self.dirty):
+            records = self.partitions.get(key, [])
+            cold = self.compress_all or key in self.freezing
+            path = self.partition_path(key, cold)
+            # The copy in the other tier, if any, is removed once the new file is in place
+            stale_path = self.partition_path(key, not cold)
+            if records:
+                write_data_file(path, [record.to_dict() for record in records])
+                days = [record.day for record in records]
+                self.manifest[key] = {
+                    'file': os.path.basename(path),
+                    'tier': 'cold' if cold else 'hot',
+                    'count': len(records),
+                    'first_date': date.fromordinal(min(days)).isoformat(),
+                    'last_date': date.fromordinal(max(days)).isoformat()
+                }
+            else:
+                if os.path.exists(path):
+                    os.remove(path)
+                self.manifest.pop(key, None)
+                self.partitions.pop(key, None)
+                self.drop_indexes(key)
+            if os.path.exists(stale_path):
+                os.remove(stale_path)
+        self.dirty.clear()
+        self.freezing.clear()
+        write_data_file(self.manifest_file, self.manifest)
+
+    def partition_count(self, key: str) -> int:
+        """Number of records in a partition, without loading it when it is unchanged"""
+        if key in self.dirty or key not in self.manifest:
+            return len(self.partitions.get(key, []))
+        return self.manifest[key]['count']
+
+    def count(self) -> int:
+        """Total number of stored records, taken from the manifest where possible"""
+        return sum(self.partition_count(key) for key in set(self.manifest) | self.dirty)
+
+
+class AttendanceService:
+    """Time in, time out and export operations without any UI.
+
+    Every operation runs under one re-entrant lock and saves its changes
+    before returning, so the service can be driven from many threads at
+    once (see tools/load_generator.py). The app calls it from the Tk
+    thread and adds the dialogs around it. Exported records are moved to
+    the history store (all cold) when one is given, so clearing them after
+    an export does not lose them.
+    """
+
+    def __init__(self, store: AttendanceStore, sessions: List[Dict], sessions_file: str,
+                 history: Optional[AttendanceStore] = None):
+        self.store = store
+        self.sessions = sessions
+        self.sessions_file = sessions_file
+        self.history = history
+        self.lock = threading.RLock()
+
+    @classmethod
+    def open(cls, data_dir: str) -> 'AttendanceService':
+        """Load the attendance store, exported history and active sessions kept in data_dir"""
+        store = AttendanceStore(
+            os.path.join(data_dir, "attendance_partitions"),
+            legacy_file=os.path.join(data_dir, "attendance_data.json")
+        )
+        store.load(preload_day=date.today().toordinal())
+        store.freeze(date.today().replace(day=1).toordinal())
+        history = AttendanceStore(os.path.join(data_dir, "attendance_history"), compress_all=True)
+        history.load()
+        sessions_file = os.path.join(data_dir, "active_sessions.json")
+        sessions = read_data_file(sessions_file) if os.path.exists(sessions_file) else []
+        return cls(store, sessions, sessions_file, history)
+
+    def save_sessions(self):
+        write_data_file(self.sessions_file, self.sessions)
+
+    def find_session(self, session_id: str) -> Optional[int]:
+        for i, session in enumerate(self.sessions):
+            if session['session_id'] == session_id:
+                return i
+        return None
+
+    def user_session(self, user_id: str) -> Optional[Dict]:
+        for session in self.sessions:
+            if session['user_id'] == user_id:
+                return session
+        return None
+
+    def clock_in(self, user_id: str, user_name: str, now: Optional[int] = None) -> Dict:
+        """Open a session for the user; raises ValueError if one is already active"""
+        with self.lock:
+            if self.user_session(user_id) is not None:
+                raise ValueError("You already have an active session!")
+            now = int(time.time()) if now is None else now
+            session = {
+                'session_id': f"{user_id}_{format_timestamp(now, '%Y%m%d%H%M%S')}",
+                'user_id': user_id,
+                'user_name': user_name,
+                'time_in': now
+            }
+            self.sessions.append(session)
+            self.save_sessions()
+            return session
+
+    def clock_out(self, session_id: str, now: Optional[int] = None) -> AttendanceRecord:
+        """Close a session into an attendance record; raises KeyError if it is not active"""
+        with self.lock:
+            index = self.find_session(session_id)
+            if index is None:
+                raise KeyError(session_id)
+            session = self.sessions[index]
+            now = int(time.time()) if now is None else now
+            # A clock set back since the time in closes the session at zero length
+            record = AttendanceRecord.from_epochs(
+                session['user_id'],
+                session['user_name'],
+                session['time_in'],
+                max(now, session['time_in'])
+            )
+            self.store.append(record)
+            self.sessions.pop(index)
+            self.store.save()
+            self.save_sessions()
+            return record
+
+    def export_records(self, destination: str, start_day: Optional[int] = None,
+                       end_day: Optional[int] = None) -> int:
+        """Write the records in the day range to destination and clear them in one step.
+
+        Holding the lock across both steps means a record saved meanwhile
+        cannot be cleared without having been exported. The history is
+        saved before the store, so a crash in between can only leave a
+        record in both, never in neither.
+        """
+        with self.lock:
+            exported = []
+            
+            def rows():
+                for record in self.store.iter_records(start_day, end_day):
+                    exported.append(record)
+                    yield record.export_row()
+            
+            count = write_export_file(rows(), destination)
+            if self.history is not None and exported:
+                for record in exported:
+                    self.history.append(record)
+                self.history.save()
+                self.history.release()
+            self.store.remove_range(start_day, end_day)
+            self.store.save()
+            return count
+
+
+def format_file_size(size: int) -> str:
+    """Human readable file size"""
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# Export formats offered in the export card, by label
+EXPORT_FORMATS = {
+    "Excel (.xlsx)": '.xlsx',
+    "CSV (.csv)": '.csv',
+    "NDJSON (.ndjson.gz)": '.ndjson.gz',
+    "SQLite (.sqlite)": '.sqlite'
+}
+EXPORT_COLUMNS = ('user_id', 'user_name', 'date', 'time_in', 'time_out', 'duration')
+
+
+def split_export_extension(filename: str) -> tuple:
+    """Split a file name into stem and extension, keeping multi-part extensions like .ndjson.gz"""
+    for extension in EXPORT_FORMATS.values():
+        if filename.lower().endswith(extension):
+            return filename[:-len(extension)], extension
+    return os.path.splitext(filename)
+
+
+def write_export_file(rows, filepath: str, columns=EXPORT_COLUMNS, table: str = "attendance") -> int:
+    """Write row dicts to filepath in the format given by its extension and return the row count.
+
+    CSV, gzip NDJSON and SQLite are written row by row from the iterable;
+    only the Excel writer needs the rows in memory.
+    """
+    extension = split_export_extension(filepath)[1]
+    count = 0
+    if extension == '.csv':
+        with open(filepath, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=columns, extrasaction='ignore')
+            writer.writeheader()
+            for row in rows:
+                writer.writerow(row)
+                count += 1
+    elif extension == '.ndjson.gz':
+        with gzip.open(filepath, 'wt', encoding='utf-8') as f:
+            for row in rows:
+                f.write(json.dumps(row, separators=(',', ':')))
+                f.write('\n')
+                count += 1
+    elif extension == '.sqlite':
+        if os.path.exists(filepath):
+            os.remove(filepath)
+        connection = sqlite3.connect(filepath)
+        try:
+            quoted = ", ".join(f'"{column}"' for column in columns)
+            connection.execute(f"CREATE TABLE {table} ({quoted})")
+            cursor = connection.executemany(
+                f"INSERT INTO {table} ({quoted}) VALUES ({', '.join('?' for _ in columns)})",
+                ([row.get(column) for column in columns] for row in rows)
+            )
+            count = cursor.rowcount
+            connection.commit()
+        finally:
+            connection.close()
+    else:
+        frame = pd.DataFrame(list(rows), columns=list(columns))
+        frame.to_excel(filepath, index=False, engine='openpyxl')
+        count = len(frame)
+    return count
+
+
+def fast_copy(src: str, dst: str):
+    """Copy a file in the kernel where possible, falling back to a chunked copy.
+
+    Tries os.copy_file_range (which can reflink on copy-on-write file
+    systems), then os.sendfile, then shutil.copyfileobj in 1 MB chunks,
+    continuing from wherever the previous method stopped.
+    """
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        size = os.fstat(fsrc.fileno()).st_size
+        offset = 0
+        copy_file_range = getattr(os, 'copy_file_range', None)
+        if copy_file_range is not None:
+            try:
+                while offset < size:
+                    sent = copy_file_range(fsrc.fileno(), fdst.fileno(), size - offset, offset, offset)
+                    if sent == 0:
+                        break
+                    offset += sent
+            except OSError:
+                pass
+        if offset < size and hasattr(os, 'sendfile') and sys.platform.startswith('linux'):
+            try:
+                os.lseek(fdst.fileno(), offset, os.SEEK_SET)
+                while offset < size:
+                    sent = os.sendfile(fdst.fileno(), fsrc.fileno(), offset, min(size - offset, COPY_CHUNK_SIZE))
+                    if sent == 0:
+                        break
+                    offset += sent
+            except OSError:
+                pass
+        if offset < size:
+            fsrc.seek(offset)
+            fdst.seek(offset)
+            shutil.copyfileobj(fsrc, fdst, COPY_CHUNK_SIZE)
+
+
+def link_or_copy(src: str, dst: str) -> bool:
+    """Hardlink src to dst, or copy it when linking is not possible. Returns True if linked"""
+    if os.path.lexists(dst):
+        os.chmod(dst, stat.S_IRUSR | stat.S_IWUSR)
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+        return True
+    except (OSError, NotImplementedError):
+        fast_copy(src, dst)
+        return False
+
+
+# Already-compressed formats are stored as-is in zip archives
+ZIP_STORED_EXTENSIONS = ('.xlsx', '.gz', '.zip', '.xz')
+
+
+def write_zip_archive(files: List[tuple], destination: str, progress=None):
+    """Stream (source path, archive name) pairs into a zip file chunk by chunk.
+
+    Memory use is bounded by the chunk size. progress(done_bytes,
+    total_bytes) is called after each chunk. The archive is written to a
+    .part file and renamed once complete.
+    """
+    total = sum(os.path.getsize(src) for src, _ in files)
+    done = 0
+    temp_path = f"{destination}.part"
+    try:
+        with zipfile.ZipFile(temp_path, 'w', allowZip64=True) as archive:
+            for src, arcname in files:
+                info = zipfile.ZipInfo.from_file(src, arcname)
+                if src.lower().endswith(ZIP_STORED_EXTENSIONS):
+                    info.compress_type = zipfile.ZIP_STORED
+                else:
+                    info.compress_type = zipfile.ZIP_DEFLATED
+                info.external_attr = (stat.S_IFREG | 0o644) << 16
+                with open(src, 'rb') as fsrc, archive.open(info, 'w', force_zip64=True) as fdst:
+                    for chunk in iter(lambda: fsrc.read(COPY_CHUNK_SIZE), b''):
+                        fdst.write(chunk)
+                        done += len(chunk)
+                        if progress:
+                            progress(done, total)
+        os.replace(temp_path, destination)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return destination
+
+
+def read_export_rows(filepath: str) -> List[Dict]:
+    """Read an exported workbook's rows as dicts keyed by the header row.
+
+    Module level so it can run in a worker process. CSV, gzip NDJSON and
+    SQLite exports are read as well.
+    """
+    extension = split_export_extension(filepath)[1]
+    if extension == '.csv':
+        with open(filepath, 'r', newline='', encoding='utf-8') as f:
+            return list(csv.DictReader(f))
+    if extension == '.ndjson.gz':
+        with gzip.open(filepath, 'rt', encoding='utf-8') as f:
+            return [json.loads(line) for line in f if line.strip()]
+    if extension == '.sqlite':
+        connection = sqlite3.connect(f"file:{filepath}?mode=ro", uri=True)
+        try:
+            connection.row_factory = sqlite3.Row
+            return [dict(row) for row in connection.execute("SELECT * FROM attendance")]
+        finally:
+            connection.close()
+    
+    from openpyxl import load_workbook
+    workbook = load_workbook(filepath, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if not header:
+            return []
+        columns = [str(name) for name in header]
+        result = []
+        for row in rows:
+            if row is None or all(value is None for value in row):
+                continue
+            result.append({
+                column: (value.isoformat() if hasattr(value, 'isoformat') else value)
+                for column, value in zip(columns, row)
+            })
+        return result
+    finally:
+        workbook.close()
+
+
+# Rows describing the same attendance session are merged on this key
+CONSOLIDATION_KEY = ('user_id', 'date', 'time_in')
+
+
+def consolidate_exports(sources: List[tuple], destination: str, cache_dir: str, progress=None) -> Dict:
+    """Merge exported files into one deduplicated .xlsx or .sqlite report.
+
+    sources are (path, content hash or None) pairs. Parsed rows are cached
+    per content hash in cache_dir, so only files not seen before are read,
+    in parallel worker processes. Rows are deduplicated on
+    (user_id, date, time_in), keeping the first occurrence.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    
+    os.makedirs(cache_dir, exist_ok=True)
+    parsed = {}
+    to_read = []
+    for path, digest in sources:
+        digest = digest or file_sha256(path)
+        cache_path = os.path.join(cache_dir, f"{digest}.json")
+        if os.path.exists(cache_path):
+            try:
+                parsed[path] = read_data_file(cache_path)
+                continue
+            except Exception as e:
+                print(f"Ignoring unreadable consolidation cache {cache_path}: {e}")
+        to_read.append((path, cache_path))
+    
+    total = len(sources)
+    if progress:
+        progress(len(parsed), total)
+    if to_read:
+        workers = max(1, min(len(to_read), os.cpu_count() or 1))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            paths = [path for path, _ in to_read]
+            for (path, cache_path), rows in zip(to_read, pool.map(read_export_rows, paths)):
+                parsed[path] = rows
+                write_data_file(cache_path, rows)
+                if progress:
+                    progress(len(parsed), total)
+    
+    seen = set()
+    merged = []
+    columns = []
+    for path, _ in sources:
+        for row in parsed[path]:
+            for column in row:
+                if column not in columns:
+                    columns.append(column)
+            if all(column in row for column in CONSOLIDATION_KEY):
+                key = tuple(str(row[column]) for column in CONSOLIDATION_KEY)
+            else:
+                key = tuple(sorted((column, str(value)) for column, value in row.items()))
+            if key in seen:
+                continue
+            seen.add(key)
+            merged.append(row)
+    merged.sort(key=lambda row: tuple(str(row.get(column, '')) for column in ('date', 'time_in', 'user_id')))
+    
+    write_export_file(merged, destination, columns)
+    
+    return {
+        'files': total,
+        'read': len(to_read),
+        'cached': total - len(to_read),
+        'rows': len(merged),
+        'duplicates': sum(len(parsed[path]) for path, _ in sources) - len(merged)
+    }
+
+
+def file_sha256(filepath: str) -> str:
+    """SHA-256 of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(COPY_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ExportArtifactStore:
+    """Content-addressed store for export files.
+
+    Each export is written once into roles_exports/objects and renamed to
+    its SHA-256, so identical exports share one file. Objects are kept
+    read-only. Per-user copies are hardlinked or copied out of the store
+    with fast_copy, and each copy gets its own permissions.
+    """
+
+    def __init__(self, export_dir: str):
+        self.objects_dir = os.path.join(export_dir, "objects")
+
+    def temp_path(self, extension: str) -> str:
+        """Path to write a new export to before it is ingested"""
+        os.makedirs(self.objects_dir, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        return os.path.join(self.objects_dir, f".incoming_{stamp}_{os.getpid()}{extension}")
+
+    def object_path(self, object_name: str) -> str:
+        return os.path.join(self.objects_dir, object_name)
+
+    def ingest(self, filepath: str) -> str:
+        """Move a written export into the store under its hash and return the object path"""
+        extension = split_export_extension(filepath)[1]
+        object_name = f"{file_sha256(filepath)}{extension}"
+        object_path = self.object_path(object_name)
+        if os.path.exists(object_path):
+            os.remove(filepath)
+        elif os.path.dirname(os.path.abspath(filepath)) == os.path.abspath(self.objects_dir):
+            os.replace(filepath, object_path)
+        else:
+            link_or_copy(filepath, object_path)
+        return object_path
+
+
+class ExportManifest:
+    """Metadata index of the export files kept in roles_exports.
+
+    Entries (file, size, record count, exporting user, timestamp) are
+    written when an export is saved. Listing the exports reads the
+    manifest and only rescans the directory with os.scandir when the
+    directory's mtime has changed, picking up files added or removed by
+    hand.
+    """
+    EXPORT_EXTENSIONS = tuple(EXPORT_FORMATS.values())
+    SORT_KEYS = {
+        "Newest": (lambda entry: entry['timestamp'], True),
+        "Oldest": (lambda entry: entry['timestamp'], False),
+        "User": (lambda entry: (entry['user_id'].lower(), entry['timestamp']), False),
+        "Records": (lambda entry: entry['record_count'] or 0, True),
+        "Size": (lambda entry: entry['size'], True)
+    }
+
+    def __init__(self, export_dir: str, artifacts: Optional[ExportArtifactStore] = None):
+        self.export_dir = export_dir
+        self.artifacts = artifacts
+        self.manifest_file = os.path.join(export_dir, "manifest.json")
+        self.entries: Dict[str, Dict] = {}
+        self.manifest_mtime = None
+        self.dir_mtime = None
+
+    def load(self):
+        """Re-read the manifest file if it changed since the last read"""
+        try:
+            mtime = os.stat(self.manifest_file).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self.manifest_mtime:
+            return
+        try:
+            self.entries = {entry['file']: entry for entry in read_data_file(self.manifest_file)}
+            for entry in self.entries.values():
+                # Manifests written before epoch timestamps carry local time strings
+                entry['timestamp'] = parse_timestamp(entry.get('timestamp') or 0)
+            self.manifest_mtime = mtime
+        except Exception as e:
+            print(f"Error loading export manifest: {e}")
+
+    def save(self):
+        write_data_file(self.manifest_file, list(self.entries.values()))
+        self.manifest_mtime = os.stat(self.manifest_file).st_mtime_ns
+        # Writing the manifest touches the directory; don't treat that as a change
+        self.dir_mtime = self.directory_mtime()
+
+    def directory_mtime(self) -> tuple:
+        """Modification times of the export directory and the object store"""
+        mtimes = [os.stat(self.export_dir).st_mtime_ns]
+        if self.artifacts and os.path.isdir(self.artifacts.objects_dir):
+            mtimes.append(os.stat(self.artifacts.objects_dir).st_mtime_ns)
+        return tuple(mtimes)
+
+    def resolve(self, entry: Dict) -> str:
+        """Path of the file holding an entry's content"""
+        if entry.get('object') and self.artifacts:
+            return self.artifacts.object_path(entry['object'])
+        return os.path.join(self.export_dir, entry['file'])
+
+    @staticmethod
+    def parse_filename(filename: str) -> tuple:
+        """Exporting user and epoch timestamp from roles_export_<user>_<YYYYmmdd>_<HHMMSS>.<ext>"""
+        stem = split_export_extension(filename)[0]
+        if stem.startswith("roles_export_"):
+            parts = stem[len("roles_export_"):].rsplit('_', 2)
+            if len(parts) == 3:
+                try:
+                    return parts[0], parse_timestamp(f"{parts[1]}_{parts[2]}", "%Y%m%d_%H%M%S")
+                except ValueError:
+                    pass
+        return "", None
+
+    def add(self, filename: str, filepath: str, record_count: Optional[int], user_id: str, timestamp: int):
+        """Record a newly saved export; filepath is a store object or a file in the export directory"""
+        self.load()
+        entry = {
+            'file': filename,
+            'size': os.path.getsize(filepath),
+            'record_count': record_count,
+            'user_id': user_id,
+            'timestamp': timestamp
+        }
+        if self.artifacts and os.path.dirname(os.path.abspath(filepath)) == os.path.abspath(self.artifacts.objects_dir):
+            entry['object'] = os.path.basename(filepath)
+        self.entries[filename] = entry
+        self.save()
+
+    def reconcile(self):
+        """Sync the manifest with the directory contents when the directory changed"""
+        self.load()
+        try:
+            dir_mtime = self.directory_mtime()
+        except FileNotFoundError:
+            return
+        if dir_mtime == self.dir_mtime:
+            return
+        
+        found = {}
+        with os.scandir(self.export_dir) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name.endswith(self.EXPORT_EXTENSIONS):
+                    found[entry.name] = entry.stat()
+        objects = set()
+        if self.artifacts and os.path.isdir(self.artifacts.objects_dir):
+            with os.scandir(self.artifacts.objects_dir) as entries:
+                objects = {entry.name for entry in entries if not entry.name.startswith('.')}
+        
+        changed = False
+        for filename, entry in list(self.entries.items()):
+            if entry.get('object'):
+                if entry['object'] not in objects:
+                    del self.entries[filename]
+                    changed = True
+            elif filename not in found:
+                del self.entries[filename]
+                changed = True
+        for filename, file_stat in found.items():
+            entry = self.entries.get(filename)
+            if entry is not None and entry.get('object'):
+                continue
+            if entry is None:
+                user_id, timestamp = self.parse_filename(filename)
+                if timestamp is None:
+                    timestamp = int(file_stat.st_mtime)
+                self.entries[filename] = {
+                    'file': filename,
+                    'size': file_stat.st_size,
+                    'record_count': None,
+                    'user_id': user_id,
+                    'timestamp': timestamp
+                }
+                changed = True
+            elif entry['size'] != file_stat.st_size:
+                entry['size'] = file_stat.st_size
+                changed = True
+        
+        if changed:
+            self.save()
+        else:
+            self.dir_mtime = dir_mtime
+
+    def list(self, sort_by: str = "Newest", filter_text: str = "") -> List[Dict]:
+        """Entries matching filter_text (file name or user), in the requested order"""
+        self.reconcile()
+        filter_text = filter_text.strip().lower()
+        entries = [
+            entry for entry in self.entries.values()
+            if not filter_text
+            or filter_text in entry['file'].lower()
+            or filter_text in entry['user_id'].lower()
+        ]
+        key, reverse = self.SORT_KEYS.get(sort_by, self.SORT_KEYS["Newest"])
+        entries.sort(key=key, reverse=reverse)
+        return entries
+
+
+class ExportHistoryLog:
+    """Append-only export history with per-user and per-date indexes.
+
+    Each export is one JSON line appended to the log, so recording an
+    export never rewrites earlier entries. Entries older than
+    retention_days are left out when the log is loaded and when it is
+    queried; compact() removes them from the file once they make up a
+    noticeable share of it.
+    """
+
+    def __init__(self, log_file: str, legacy_file: Optional[str] = None, retention_days: int = 365):
+        self.log_file = log_file
+        self.legacy_file = legacy_file
+        self.retention_days = retention_days
+        self.entries: List[Dict] = []
+        self.by_user: Dict[str, List[int]] = {}
+        self.by_date: Dict[int, List[int]] = {}
+
+    def load(self):
+        """Stream the log into memory, migrating export_history.json and compacting if needed"""
+        if not os.path.exists(self.log_file) and self.legacy_file and os.path.exists(self.legacy_file):
+            legacy = read_data_file(self.legacy_file)
+            with open(self.log_file, 'ab') as f:
+                for entry in legacy:
+                    f.write(json_dumps(entry) + b'\n')
+            os.replace(self.legacy_file, f"{self.legacy_file}.migrated")
+            print(f"Migrated {len(legacy)} export history entries to {self.log_file}")
+        
+        self.entries = []
+        self.by_user = {}
+        self.by_date = {}
+        cutoff = self.cutoff()
+        expired = 0
+        if os.path.exists(self.log_file):
+            with open(self.log_file, 'rb') as f:
+                for line_number, line in enumerate(f, 1):
+                    if not line.strip():
+                        continue
+                    try:
+                        if not self.index_entry(json_loads(line), cutoff):
+                            expired += 1
+                    except (ValueError, TypeError, AttributeError) as e:
+                        # A torn final line from an interrupted write, or a line that is not an entry, is skipped
+                        print(f"Skipping unreadable export history line {line_number}: {e}")
+        
+        if expired and (expired * 10 >= expired + len(self.entries) or expired > 1000):
+            self.compact()
+
+    def cutoff(self) -> int:
+        """Epoch time before which entries are past the retention period"""
+        return local_epoch(date.today().toordinal() - self.retention_days)
+
+    def index_entry(self, entry: Dict, cutoff: Optional[int] = None) -> bool:
+        """Index an entry unless it is past the retention period; returns False if it is"""
+        # Entries from before epoch timestamps carry local time strings
+        entry['timestamp'] = parse_timestamp(entry.get('timestamp') or 0)
+        if entry['timestamp'] < (self.cutoff() if cutoff is None else cutoff):
+            return False
+        user_id = entry.get('user_id') or ''
+        day = local_day_seconds(entry['timestamp'])[0]
+        position = len(self.entries)
+        self.by_user.setdefault(user_id, []).append(position)
+        self.by_date.setdefault(day, []).append(position)
+        self.entries.append(entry)
+        return True
+
+    def append(self, entry: Dict):
+        """Append one entry to the log"""
+        with open(self.log_file, 'ab') as f:
+            f.write(json_dumps(entry) + b'\n')
+        self.index_entry(entry)
+
+    def retained_entries(self) -> List[Dict]:
+        cutoff = self.cutoff()
+        return [entry for entry in self.entries if entry['timestamp'] >= cutoff]
+
+    def compact(self):
+        """Rewrite the log without entries past the retention period"""
+        kept = self.retained_entries()
+        temp_path = f"{self.log_file}.tmp"
+        with open(temp_path, 'wb') as f:
+            for entry in kept:
+                f.write(json_dumps(entry) + b'\n')
+        os.replace(temp_path, self.log_file)
+        print(f"Compacted export history: kept {len(kept)} of {len(self.entries)} entries")
+        self.entries = []
+        self.by_user = {}
+        self.by_date = {}
+        for entry in kept:
+            self.index_entry(entry, 0)
+
+    def query(self, user_id: Optional[str] = None, start_day: Optional[int] = None,
+              end_day: Optional[int] = None) -> List[Dict]:
+        """Retained entries for a user and/or an inclusive day ordinal range, oldest first"""
+        # Entries can pass the retention period while the app is running
+        first_day = date.today().toordinal() - self.retention_days
+        start_day = first_day if start_day is None else max(start_day, first_day)
+        if user_id is not None:
+            positions = self.by_user.get(user_id, [])
+        else:
+            positions = [
+                position
+                for day, day_positions in self.by_date.items()
+                if (start_day is None or day >= start_day) and (end_day is None or day <= end_day)
+                for position in day_positions
+            ]
+            positions.sort()
+        entries = [self.entries[position] for position in positions]
+        if user_id is not None and (start_day is not None or end_day is not None):
+            start = local_epoch(start_day) if start_day is not None else None
+            end = local_epoch(end_day + 1) if end_day is not None else None
+            entries = [
+                entry for entry in entries
+                if (start is None or entry['timestamp'] >= start) and (end is None or entry['timestamp'] < end)
+            ]
+        return entries
+
+    def summary_by_user(self) -> List[Dict]:
+        """Export count, record totals and durations per user"""
+        summary = []
+        cutoff = self.cutoff()
+        for user_id, positions in self.by_user.items():
+            entries = [self.entries[position] for position in positions if self.entries[position]['timestamp'] >= cutoff]
+            if not entries:
+                continue
+            durations = [entry['duration_ms'] for entry in entries if entry.get('duration_ms') is not None]
+            summary.append({
+                'user_id': user_id,
+                'exports': len(entries),
+                'records': sum(entry.get('record_count') or 0 for entry in entries),
+                'avg_duration_ms': sum(durations) / len(durations) if durations else None,
+                'max_duration_ms': max(durations) if durations else None,
+                'last_export': format_timestamp(max(entry['timestamp'] for entry in entries))
+            })
+        summary.sort(key=lambda item: item['exports'], reverse=True)
+        return summary
+
+    def summary_by_date(self) -> List[Dict]:
+        """Export count and record totals per day, newest first"""
+        summary = []
+        first_day = date.today().toordinal() - self.retention_days
+        for day, positions in self.by_date.items():
+            if day < first_day:
+                continue
+            entries = [self.entries[position] for position in positions]
+            summary.append({
+                'date': date.fromordinal(day).isoformat(),
+                'exports': len(entries),
+                'records': sum(entry.get('record_count') or 0 for entry in entries),
+                'users': len({entry.get('user_id') for entry in entries})
+            })
+        summary.sort(key=lambda item: item['date'], reverse=True)
+        return summary
+
+
+PAYROLL_COLUMNS = (
+    'user_id', 'user_name', 'department', 'period', 'days_worked', 'sessions', 'total_hours', 'regular_hours', 'overtime_hours'
+)
+
+
+class PayrollEngine:
+    """Regular and overtime hours per user for monthly pay periods.
+
+    Hours come from the records' numeric times and are summed with numpy
+    over a users x days grid, so a whole period is a handful of array
+    operations. Overtime is time past daily_hours on a day plus regular
+    time past weekly_hours in a Monday-Sunday week (weeks are cut at the
+    period boundary). Sessions that run past midnight count in full
+    towards the day they started. Reports for months that have ended are
+    cached in cache_dir and reused while the month's record count and the
+    limits are unchanged.
+    """
+
+    def __init__(self, cache_dir: str, daily_hours: float = 8.0, weekly_hours: float = 40.0):
+        self.cache_dir = cache_dir
+        self.daily_hours = daily_hours
+        self.weekly_hours = weekly_hours
+
+    def cache_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def signature(self, store: AttendanceStore, key: str, history: Optional[AttendanceStore] = None) -> Dict:
+        return {
+            'records': store.partition_count(key),
+            'exported': history.partition_count(key) if history is not None else 0,
+            'daily_hours': self.daily_hours,
+            'weekly_hours': self.weekly_hours
+        }
+
+    def report(self, store: AttendanceStore, key: str, history: Optional[AttendanceStore] = None) -> List[Dict]:
+        """Payroll rows for the month key (YYYY-MM), from the cache when the month is closed.
+
+        Records already exported are read from history, which is only
+        decompressed when the cached report is missing or out of date.
+        """
+        first_day, last_day = month_bounds(key)
+        closed = last_day < date.today().toordinal()
+        signature = self.signature(store, key, history)
+        path = self.cache_path(key)
+        
+        if closed and os.path.exists(path):
+            try:
+                cached = read_data_file(path)
+                if cached.get('signature') == signature:
+                    return cached['rows']
+            except Exception as e:
+                print(f"Error reading payroll cache {path}: {e}")
+        
+        records = store.load_partition(key)
+        if history is not None and history.partition_count(key):
+            records = records + history.load_partition(key)
+        rows = self.compute(records, first_day, last_day, key)
+        if closed:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            write_data_file(path, {'signature': signature, 'rows': rows})
+        return rows
+
+    def compute(self, records: List[AttendanceRecord], first_day: int, last_day: int, period: str) -> List[Dict]:
+        """Payroll rows for records dated within the inclusive day range"""
+        records = [record for record in records if first_day <= record.day <= last_day]
+        if not records:
+            return []
+        
+        count = len(records)
+        user_ids, codes = np.unique(np.array([record.user_id for record in records]), return_inverse=True)
+        names = {record.user_id: record.user_name for record in records}
+        days = np.fromiter((record.day for record in records), dtype=np.int64, count=count)
+        time_in = np.fromiter((record.time_in for record in records), dtype=np.int64, count=count)
+        time_out = np.fromiter((record.time_out for record in records), dtype=np.int64, count=count)
+        durations = time_out - time_in
+        
+        user_count = len(user_ids)
+        day_count = last_day - first_day + 1
+        daily = np.bincount(
+            codes * day_count + (days - first_day), weights=durations, minlength=user_count * day_count
+        ).reshape(user_count, day_count)
+        
+        regular = np.minimum(daily, self.daily_hours * 3600)
+        overtime = daily - regular
+        
+        # Cap regular time per Monday-Sunday week; day ordinal 1 is a Monday
+        week = (np.arange(first_day, last_day + 1) - 1) // 7
+        week_starts = np.concatenate(([True], week[1:] != week[:-1]))
+        week_group = np.cumsum(week_starts) - 1
+        earlier = np.cumsum(regular, axis=1) - regular
+        earlier_in_week = earlier - earlier[:, week_starts][:, week_group]
+        weekly_regular = np.minimum(regular, np.maximum(self.weekly_hours * 3600 - earlier_in_week, 0))
+        overtime += regular - weekly_regular
+        regular = weekly_regular
+        
+        sessions = np.bincount(codes, minlength=user_count)
+        days_worked = (daily > 0).sum(axis=1)
+        total_hours = daily.sum(axis=1) / 3600
+        regular_hours = regular.sum(axis=1) / 3600
+        overtime_hours = overtime.sum(axis=1) / 3600
+        
+        return [
+            {
+                'user_id': str(user_id),
+                'user_name': names[str(user_id)],
+                'period': period,
+                'days_worked': int(days_worked[i]),
+                'sessions': int(sessions[i]),
+                'total_hours': round(float(total_hours[i]), 2),
+                'regular_hours': round(float(regular_hours[i]), 2),
+                'overtime_hours': round(float(overtime_hours[i]), 2)
+            }
+            for i, user_id in enumerate(user_ids)
+        ]
+
+
+class OccupancyEngine:
+    """Peak number of concurrent sessions per hour, computed with a sweep line.
+
+    Closed sessions are kept as a sorted list of (time, +1/-1) events with
+    times in absolute seconds (day ordinal * 86400 + seconds). One pass over
+    the events yields the concurrency at every instant, so a date range
+    costs O(n) after the O(n log n) sort instead of O(records x hours).
+    Per-day results are cached; adding a session only invalidates the days
+    it spans. Open sessions are passed in per call and never cached.
+    Records of several stores (one per department) can be loaded together.
+    """
+
+    def __init__(self, bucket_seconds: int = 3600):
+        self.bucket_seconds = bucket_seconds
+        # Ends (-1) sort before starts (+1) at the same time, so back-to-back sessions don't overlap
+        self.events: List[tuple] = []
+        self.loaded_months = set()
+        self.day_cache: Dict[int, List[int]] = {}
+
+    @staticmethod
+    def record_interval(record: AttendanceRecord) -> tuple:
+        """Absolute start/end seconds of a record; sessions past midnight end on a later day"""
+        start = record.day * SECONDS_PER_DAY + record.time_in
+        return start, start + record.duration_seconds
+
+    def reset(self):
+        self.events = []
+        self.loaded_months = set()
+        self.day_cache = {}
+
+    def load_months(self, store: AttendanceStore, start_day: int, end_day: int):
+        """Add the records of any partitions in the range that are not loaded yet"""
+        # Sessions that started the day before can run into the range
+        for key in store.partition_keys(start_day - 1, end_day):
+            if (store.partition_dir, key) in self.loaded_months:
+                continue
+            self.loaded_months.add((store.partition_dir, key))
+            new_events = []
+            for record in store.load_partition(key):
+                start, end = self.record_interval(record)
+                if end > start:
+                    new_events.append((start, 1))
+                    new_events.append((end, -1))
+                    self.invalidate(start, end)
+            new_events.sort()
+            self.events = list(heapq.merge(self.events, new_events))
+
+    def add_record(self, store: AttendanceStore, record: AttendanceRecord):
+        """Add a newly closed session of store if its month is loaded"""
+        if (store.partition_dir, month_key(record.day)) not in self.loaded_months:
+            return
+        start, end = self.record_interval(record)
+        if end <= start:
+            return
+        bisect.insort(self.events, (start, 1))
+        bisect.insort(self.events, (end, -1))
+        self.invalidate(start, end)
+
+    def invalidate(self, start: int, end: int):
+        for day in range(start // SECONDS_PER_DAY, end // SECONDS_PER_DAY + 1):
+            self.day_cache.pop(day, None)
+
+    def profile(self, start_day: int, end_day: int, open_intervals=()) -> Dict[int, List[int]]:
+        """Peak concurrency per bucket for each day of the inclusive range"""
+        buckets_per_day = SECONDS_PER_DAY // self.bucket_seconds
+        extra_events = []
+        extra_days = set()
+        for start, end in open_intervals:
+            if end > start:
+                extra_events.append((start, 1))
+                extra_events.append((end, -1))
+                extra_days.update(range(start // SECONDS_PER_DAY, end // SECONDS_PER_DAY + 1))
+        extra_events.sort()
+        
+        days = range(start_day, end_day + 1)
+        missing = [day for day in days if day in extra_days or day not in self.day_cache]
+        computed = {}
+        if missing:
+            events = list(heapq.merge(self.events, extra_events)) if extra_events else self.events
+            range_start = missing[0] * SECONDS_PER_DAY
+            range_end = (missing[-1] + 1) * SECONDS_PER_DAY
+            
+            count = 0
+            index = bisect.bisect_left(events, (range_start, -1))
+            for _, delta in events[:index]:
+                count += delta
+            
+            total = len(events)
+            peaks = []
+            for bucket_start in range(range_start, range_end, self.bucket_seconds):
+                bucket_end = bucket_start + self.bucket_seconds
+                # Apply everything happening exactly at the bucket start before reading the count
+                while index < total and events[index][0] == bucket_start:
+                    count += events[index][1]
+                    index += 1
+                peak = count
+                while index < total and events[index][0] < bucket_end:
+                    count += events[index][1]
+                    if count > peak:
+                        peak = count
+                    index += 1
+                peaks.append(peak)
+            
+            for offset, day in enumerate(range(missing[0], missing[-1] + 1)):
+                computed[day] = peaks[offset * buckets_per_day:(offset + 1) * buckets_per_day]
+                if day not in extra_days:
+                    self.day_cache[day] = computed[day]
+        
+        return {day: computed[day] if day in computed else self.day_cache[day] for day in days}
+
+
+DEFAULT_DEPARTMENT = "General"
+
+
+def department_slug(department: str) -> str:
+    """Directory name for a department: lower case letters and digits joined by '-'"""
+    words = ''.join(ch if ch.isalnum() else ' ' for ch in department.lower()).split()
+    return '-'.join(words) or 'department'
+
+
+class DepartmentShard:
+    """One department's attendance records, active sessions, roles exports and payroll reports"""
+
+    def __init__(self, department: str, data_dir: str, service: AttendanceService):
+        self.department = department
+        self.data_dir = data_dir
+        self.service = service
+        self.roles_exports_dir = os.path.join(data_dir, "roles_exports")
+        os.makedirs(self.roles_exports_dir, exist_ok=True)
+        self.export_artifacts = ExportArtifactStore(self.roles_exports_dir)
+        self.export_manifest = ExportManifest(self.roles_exports_dir, self.export_artifacts)
+        self.payroll = PayrollEngine(os.path.join(data_dir, "payroll_cache"))
+
+    @property
+    def store(self) -> AttendanceStore:
+        return self.service.store
+
+    @property
+    def sessions(self) -> List[Dict]:
+        return self.service.sessions
+
+    @property
+    def history(self) -> Optional[AttendanceStore]:
+        return self.service.history
+
+
+class DepartmentShards:
+    """Attendance data sharded by department.
+
+    The default department keeps the original files in data_dir, so an
+    install with one department is unchanged; every other department has
+    the same layout under departments/<slug>/ and is opened on first use.
+    map() runs a function on several shards in parallel, each under its
+    service lock, for admin views that span all departments.
+    """
+
+    def __init__(self, data_dir: str = "."):
+        self.data_dir = data_dir
+        self.departments_dir = os.path.join(data_dir, "departments")
+        self.shards: Dict[str, DepartmentShard] = {}
+        self.lock = threading.Lock()
+        self.executor = None
+
+    def shard_dir(self, department: str) -> str:
+        if department == DEFAULT_DEPARTMENT:
+            return self.data_dir
+        return os.path.join(self.departments_dir, department_slug(department))
+
+    def add(self, shard: DepartmentShard):
+        self.shards[shard.department] = shard
+
+    def department_conflict(self, department: str, known: tuple = ()) -> Optional[str]:
+        """Another department (open, on disk or among known names) whose directory this name maps to"""
+        if department == DEFAULT_DEPARTMENT:
+            return None
+        slug = department_slug(department)
+        if slug == department_slug(DEFAULT_DEPARTMENT):
+            return DEFAULT_DEPARTMENT
+        for name in list(self.shards) + list(known):
+            if name not in (department, DEFAULT_DEPARTMENT) and department_slug(name) == slug:
+                return name
+        info_file = os.path.join(self.departments_dir, slug, "department.json")
+        try:
+            owner = read_data_file(info_file)['department']
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Error reading {info_file}: {e}")
+            return None
+        return owner if owner != department else None
+
+    def shard(self, department: Optional[str] = None) -> DepartmentShard:
+        """The department's shard, creating its directory the first time"""
+        department = department or DEFAULT_DEPARTMENT
+        with self.lock:
+            if department not in self.shards:
+                # Departments never share a directory, or they would see each other's data
+                conflict = self.department_conflict(department)
+                if conflict:
+                    raise ValueError(f"Department '{department}' would share its data folder with '{conflict}'")
+                data_dir = self.shard_dir(department)
+                os.makedirs(data_dir, exist_ok=True)
+                info_file = os.path.join(data_dir, "department.json")
+                if department != DEFAULT_DEPARTMENT and not os.path.exists(info_file):
+                    write_data_file(info_file, {'department': department, 'created': int(time.time())})
+                self.shards[department] = DepartmentShard(department, data_dir, AttendanceService.open(data_dir))
+            return self.shards[department]
+
+    def service_locks(self) -> list:
+        """Service locks of the open shards in a fixed order, read under the shards lock for other threads"""
+        with self.lock:
+            return [self.shards[department].service.lock for department in sorted(self.shards)]
+
+    def departments(self) -> List[str]:
+        """The default department followed by every other department on disk, by name"""
+        names = {department for department in self.shards if department != DEFAULT_DEPARTMENT}
+        if os.path.isdir(self.departments_dir):
+            with os.scandir(self.departments_dir) as entries:
+                for entry in entries:
+                    info_file = os.path.join(entry.path, "department.json")
+                    if entry.is_dir() and os.path.exists(info_file):
+                        try:
+                            names.add(read_data_file(info_file)['department'])
+                        except Exception as e:
+                            print(f"Error reading {info_file}: {e}")
+        return [DEFAULT_DEPARTMENT] + sorted(names, key=str.lower)
+
+    def map(self, func, departments=None) -> List[tuple]:
+        """(department, func(shard)) for each department, run in parallel when there are several"""
+        shards = [self.shard(department) for department in (departments or self.departments())]
+        
+        def run(shard):
+            with shard.service.lock:
+                return func(shard)
+        
+        if len(shards) == 1:
+            return [(shards[0].department, run(shards[0]))]
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="shard")
+        return list(zip((shard.department for shard in shards), self.executor.map(run, shards)))
+
+    def query(self, departments=None, sort_key: Optional[str] = None, descending: bool = False,
+              **filters) -> List[AttendanceRecord]:
+        """AttendanceStore.query over several departments, merged into one ordering"""
+        results = self.map(
+            lambda shard: shard.store.query(sort_key=sort_key, descending=descending, **filters), departments
+        )
+        if len(results) == 1:
+            return results[0][1]
+        merged = [record for _, records in results for record in records]
+        merged.sort(key=RECORD_SORT_KEYS[sort_key or 'date'], reverse=descending)
+        return merged
+
+    def sessions(self, departments=None) -> List[tuple]:
+        """(department, session) for the active sessions of the departments"""
+        return [
+            (department, session)
+            for department, sessions in self.map(lambda shard: list(shard.sessions), departments)
+            for session in sessions
+        ]
+
+    def versions(self, departments=None) -> tuple:
+        """Store versions of the departments, for telling when merged results are stale"""
+        return tuple(self.shard(department).store.version for department in (departments or self.departments()))
+
+    def find_session(self, session_id: str) -> Optional[DepartmentShard]:
+        """Shard holding an active session, or None"""
+        for department in self.departments():
+            shard = self.shard(department)
+            if shard.service.find_session(session_id) is not None:
+                return shard
+        return None
+
+
+class BackupManager:
+    """Incremental, deduplicated snapshots of the data files.
+
+    Files are cut into fixed-size chunks kept once under chunks/ by their
+    SHA-256; a snapshot is a small manifest listing each file's chunks. A
+    file with the same size and mtime as in the previous snapshot is not
+    read again, and a changed file only adds the chunks that differ (an
+    appended log adds its last chunk or two). Only the newest keep
+    snapshots are kept, and chunks no snapshot uses are deleted.
+    
+    To be consistent without stopping clock-ins, snapshot() hard links
+    every file into a staging directory while the given locks are held,
+    which takes milliseconds; hashing and copying run after they are
+    released. Data files are replaced atomically, so a link keeps the
+    version that was current, and append-only logs are read up to the size
+    they had. Read-only files (stored export objects) never change and are
+    read in place.
+    """
+    DATA_PATHS = (
+        "attendance_partitions", "attendance_history", "active_sessions.json", "registered_users.json",
+        "admin_users.json", "roles_users.json", "deleted_users_archive.json", "export_history.log",
+        "storage_version.json", "roles_exports", "departments"
+    )
+    # Caches that are rebuilt on demand
+    SKIP_DIRS = {"payroll_cache", "consolidation_cache"}
+
+    def __init__(self, data_dir: str, backup_dir: str, keep: int = 14, chunk_size: int = 1 << 20):
+        self.data_dir = data_dir
+        self.backup_dir = backup_dir
+        self.chunks_dir = os.path.join(backup_dir, "chunks")
+        self.snapshots_dir = os.path.join(backup_dir, "snapshots")
+        self.keep = keep
+        self.chunk_size = chunk_size
+        self.lock = threading.Lock()
+
+    def data_files(self, root: str) -> List[str]:
+        """Paths, relative to root, of the data files to back up"""
+        files = []
+        for name in self.DATA_PATHS:
+            path = os.path.join(root, name)
+            if os.path.isfile(path):
+                files.append(name)
+                continue
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames[:] = sorted(d for d in dirnames if d not in self.SKIP_DIRS)
+                for filename in sorted(filenames):
+                    if filename.endswith('.tmp') or filename.startswith('.incoming_'):
+                        continue
+                    files.append(os.path.relpath(os.path.join(dirpath, filename), root))
+        return files
+
+    def snapshot_ids(self) -> List[str]:
+        """Snapshot IDs, oldest first"""
+        if not os.path.isdir(self.snapshots_dir):
+            return []
+        return sorted(name[:-len(".json")] for name in os.listdir(self.snapshots_dir) if name.endswith(".json"))
+
+    def load_snapshot(self, snapshot_id: str) -> Dict:
+        return read_data_file(os.path.join(self.snapshots_dir, f"{snapshot_id}.json"))
+
+    def chunk_path(self, digest: str) -> str:
+        return os.path.join(self.chunks_dir, digest[:2], digest)
+
+    def store_chunk(self, digest: str, data: bytes) -> bool:
+        """Write a chunk unless it is already stored; returns whether it was new"""
+        path = self.chunk_path(digest)
+        if os.path.exists(path):
+            return False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f"{path}.tmp", 'wb') as f:
+            f.write(data)
+        os.replace(f"{path}.tmp", path)
+        return True
+
+    def freeze(self, locks) -> Dict[str, tuple]:
+        """Link the data files into a staging directory under the locks: {path: (source, size, mtime_ns, mode)}"""
+        staging = os.path.join(self.backup_dir, "staging")
+        shutil.rmtree(staging, ignore_errors=True)
+        frozen = {}
+        for lock in locks:
+            lock.acquire()
+        try:
+            for rel in self.data_files(self.data_dir):
+                source = os.path.join(self.data_dir, rel)
+                try:
+                    file_stat = os.stat(source)
+                except FileNotFoundError:
+                    continue
+                if file_stat.st_mode & stat.S_IWRITE:
+                    staged = os.path.join(staging, rel)
+                    os.makedirs(os.path.dirname(staged), exist_ok=True)
+                    try:
+                        os.link(source, staged)
+                    except OSError:
+                        shutil.copyfile(source, staged)
+                    source = staged
+                frozen[rel] = (source, file_stat.st_size, file_stat.st_mtime_ns, stat.S_IMODE(file_stat.st_mode))
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+        return frozen
+
+    def snapshot(self, locks=(), progress=None) -> Dict:
+        """Take a snapshot, prune old ones and return its manifest"""
+        with self.lock:
+            os.makedirs(self.snapshots_dir, exist_ok=True)
+            stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            existing = self.snapshot_ids()
+            snapshot_id = stamp
+            sequence = 1
+            # Several snapshots in one second get numbered IDs that still sort in order
+            while existing and existing[-1] >= snapshot_id:
+                snapshot_id = f"{stamp}_{sequence:02d}"
+                sequence += 1
+            previous = self.load_snapshot(existing[-1])['files'] if existing else {}
+            
+            started = time.perf_counter()
+            frozen = self.freeze(list(locks))
+            total = sum(size for _, size, _, _ in frozen.values())
+            done = 0
+            new_bytes = 0
+            files = {}
+            for rel, (source, size, mtime_ns, mode) in sorted(frozen.items()):
+                entry = previous.get(rel)
+                if not (entry and entry['size'] == size and entry['mtime_ns'] == mtime_ns):
+                    chunks = []
+                    with open(source, 'rb') as f:
+                        remaining = size
+                        while remaining > 0:
+                            data = f.read(min(self.chunk_size, remaining))
+                            if not data:
+                                break
+                            remaining -= len(data)
+                            digest = hashlib.sha256(data).hexdigest()
+                            if self.store_chunk(digest, data):
+                                new_bytes += len(data)
+                            chunks.append(digest)
+                    entry = {'size': size, 'mtime_ns': mtime_ns, 'chunks': chunks}
+                entry['mode'] = mode
+                files[rel] = entry
+                done += size
+                if progress:
+                    progress(done, total)
+            shutil.rmtree(os.path.join(self.backup_dir, "staging"), ignore_errors=True)
+            
+            manifest = {
+                'id': snapshot_id,
+                'created': int(time.time()),
+                'files': files,
+                'size': total,
+                'new_bytes': new_bytes,
+                'duration_ms': round((time.perf_counter() - started) * 1000, 1)
+            }
+            write_data_file(os.path.join(self.snapshots_dir, f"{snapshot_id}.json"), manifest)
+            self.prune()
+            return manifest
+
+    def prune(self) -> int:
+        """Delete snapshots beyond the newest keep and the chunks only they used"""
+        ids = self.snapshot_ids()
+        expired = ids[:-self.keep] if self.keep > 0 else []
+        if not expired:
+            return 0
+        for snapshot_id in expired:
+            os.remove(os.path.join(self.snapshots_dir, f"{snapshot_id}.json"))
+        used = set()
+        for snapshot_id in self.snapshot_ids():
+            for entry in self.load_snapshot(snapshot_id)['files'].values():
+                used.update(entry['chunks'])
+        for dirpath, _, filenames in os.walk(self.chunks_dir):
+            for filename in filenames:
+                if filename not in used:
+                    os.remove(os.path.join(dirpath, filename))
+        return len(expired)
+
+    def restore(self, snapshot_id: str, target_dir: str, progress=None) -> Dict:
+        """Make target_dir's data files match a snapshot.
+
+        Files whose size and mtime already match are skipped, data files
+        missing from the snapshot are deleted, and every chunk is checked
+        against its hash before a file is moved into place.
+        """
+        files = self.load_snapshot(snapshot_id)['files']
+        total = sum(entry['size'] for entry in files.values())
+        done = 0
+        restored = skipped = 0
+        for rel, entry in sorted(files.items()):
+            target = os.path.join(target_dir, rel)
+            try:
+                current = os.stat(target)
+                if current.st_size == entry['size'] and current.st_mtime_ns == entry['mtime_ns']:
+                    skipped += 1
+                    done += entry['size']
+                    continue
+            except FileNotFoundError:
+                pass
+            os.makedirs(os.path.dirname(target) or '.', exist_ok=True)
+            temp_path = f"{target}.tmp"
+            with open(temp_path, 'wb') as f:
+                for digest in entry['chunks']:
+                    with open(self.chunk_path(digest), 'rb') as chunk:
+                        data = chunk.read()
+                    if hashlib.sha256(data).hexdigest() != digest:
+                        raise ValueError(f"Backup chunk {digest} is corrupt")
+                    f.write(data)
+                    done += len(data)
+                    if progress:
+                        progress(done, total)
+            if os.path.exists(target):
+                os.chmod(target, stat.S_IREAD | stat.S_IWRITE)
+            os.replace(temp_path, target)
+            os.utime(target, ns=(entry['mtime_ns'], entry['mtime_ns']))
+            os.chmod(target, entry.get('mode', 0o644))
+            restored += 1
+        
+        removed = 0
+        for rel in self.data_files(target_dir):
+            if rel not in files:
+                path = os.path.join(target_dir, rel)
+                os.chmod(path, stat.S_IREAD | stat.S_IWRITE)
+                os.remove(path)
+                removed += 1
+        return {'restored': restored, 'skipped': skipped, 'removed': removed}
+
+    def run_schedule(self, interval: float, stop: threading.Event, locks=lambda: ()):
+        """Take a snapshot every interval seconds until stop is set (run on a daemon thread)"""
+        while True:
+            ids = self.snapshot_ids()
+            last = self.load_snapshot(ids[-1])['created'] if ids else 0
+            # Never right at startup, so the first one does not compete with loading the data
+            if stop.wait(max(60.0, last + interval - time.time())):
+                return
+            try:
+                manifest = self.snapshot(locks())
+                print(f"Backup {manifest['id']}: {len(manifest['files'])} files, "
+                      f"{format_file_size(manifest['new_bytes'])} new")
+            except Exception as e:
+                print(f"Error taking backup: {e}")
+                if stop.wait(interval):
+                    return
+
+
+class MemoryProfiler:
+    """Opt-in tracemalloc profiling of selected operations.
+
+    install() replaces methods on an object with wrappers that snapshot
+    traced memory before and after each call, and record the peak, the net
+    change and the top allocation sites by line. Results are appended to
+    log_file as JSON lines and kept in memory for the admin view. Calls
+    nested inside a profiled call are counted in the outer one.
+    """
+
+    def __init__(self, log_file: str, top: int = 10, keep: int = 200):
+        self.log_file = log_file
+        self.top = top
+        self.keep = keep
+        self.entries: List[Dict] = []
+        self.depth = 0
+        self.filters = [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+            tracemalloc.Filter(False, "<unknown>")
+        ]
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def install(self, target, names):
+        for name in names:
+            setattr(target, name, self.wrap(name, getattr(target, name)))
+
+    def wrap(self, name: str, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if self.depth:
+                return func(*args, **kwargs)
+            self.depth += 1
+            try:
+                before = tracemalloc.take_snapshot().filter_traces(self.filters)
+                start_size = tracemalloc.get_traced_memory()[0]
+                if hasattr(tracemalloc, 'reset_peak'):  # Python 3.9+
+                    tracemalloc.reset_peak()
+                started = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.record(name, before, start_size, (time.perf_counter() - started) * 1000)
+            finally:
+                self.depth -= 1
+        return wrapper
+
+    def record(self, name: str, before, start_size: int, duration_ms: float):
+        end_size, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot().filter_traces(self.filters)
+        top = [
+            {
+                'site': f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                'size_kb': round(stat.size_diff / 1024, 1),
+                'count': stat.count_diff
+            }
+            for stat in after.compare_to(before, 'lineno')[:self.top]
+        ]
+        entry = {
+            'timestamp': int(time.time()),
+            'operation': name,
+            'duration_ms': round(duration_ms, 1),
+            'peak_kb': round((peak - start_size) / 1024, 1),
+            'net_kb': round((end_size - start_size) / 1024, 1),
+            'traced_kb': round(end_size / 1024, 1),
+            'top': top
+        }
+        self.entries.append(entry)
+        del self.entries[:-self.keep]
+        try:
+            with open(self.log_file, 'ab') as f:
+                f.write(json_dumps(entry) + b'\n')
+        except Exception as e:
+            print(f"Error writing memory profile: {e}")
+
+
+class ActionProfiler:
+    """cProfile capture of the next N action calls.
+
+    install() wraps the action methods once at startup; while nothing is
+    armed a wrapper only checks a counter before calling through. arm(n)
+    profiles the next n outermost action calls, each saved to its own
+    .pstats file in output_dir.
+    """
+
+    def __init__(self, output_dir: str):
+        self.output_dir = output_dir
+        self.remaining = 0
+        self.depth = 0
+        self.captured: List[str] = []
+
+    def install(self, target, names):
+        for name in names:
+            setattr(target, name, self.wrap(name, getattr(target, name)))
+
+    def arm(self, count: int):
+        self.remaining = count
+
+    def wrap(self, name: str, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not self.remaining or self.depth:
+                return func(*args, **kwargs)
+            self.remaining -= 1
+            self.depth += 1
+            profile = cProfile.Profile()
+            try:
+                return profile.runcall(func, *args, **kwargs)
+            finally:
+                self.depth -= 1
+                self.save(name, profile)
+        return wrapper
+
+    def save(self, name: str, profile: cProfile.Profile):
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            stamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+            path = os.path.join(self.output_dir, f"{stamp}_{name}.pstats")
+            profile.dump_stats(path)
+            self.captured.append(path)
+        except Exception as e:
+            print(f"Error saving profile for {name}: {e}")
+
+    @staticmethod
+    def summary(path: str, limit: int = 25) -> str:
+        """Top functions of a saved profile by cumulative time"""
+        stream = io.StringIO()
+        pstats.Stats(path, stream=stream).sort_stats('cumulative').print_stats(limit)
+        return stream.getvalue()
+
+
+class StackSampler(threading.Thread):
+    """Background sampler of every thread's stack, written as collapsed stacks.
+
+    The output has one "thread;outer;...;inner count" line per distinct
+    stack, the input format of flamegraph.pl and speedscope. Nothing runs
+    unless a sampler is started.
+    """
+
+    def __init__(self, output_dir: str, interval: float = 0.005):
+        super().__init__(name="stack-sampler", daemon=True)
+        self.output_dir = output_dir
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.stop_event = threading.Event()
+        self.output_path: Optional[str] = None
+
+    def run(self):
+        own_id = threading.get_ident()
+        while not self.stop_event.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self) -> str:
+        """Stop sampling and write the collapsed stacks; returns the output path"""
+        self.stop_event.set()
+        self.join()
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.output_path = os.path.join(self.output_dir, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_samples.folded")
+        with open(self.output_path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return self.output_path
+
+
+class PrefixIndex:
+    """Case-insensitive prefix trie over search terms.
+
+    Every node keeps the set of keys whose terms pass through it, so a
+    lookup costs one dict step per typed character regardless of how many
+    keys are indexed. Keys can be added and removed incrementally.
+    """
+
+    class Node:
+        __slots__ = ('children', 'keys')
+
+        def __init__(self):
+            self.children: Dict[str, 'PrefixIndex.Node'] = {}
+            self.keys = set()
+
+    def __init__(self):
+        self.root = self.Node()
+        self.terms: Dict[str, set] = {}
+
+    @staticmethod
+    def split_terms(values) -> set:
+        """Index each value as a whole and word by word"""
+        terms = set()
+        for value in values:
+            value = value.strip().lower()
+            if value:
+                terms.add(value)
+                terms.update(value.split())
+        return terms
+
+    def add(self, key: str, *values: str):
+        """Index key under the given values (e.g. user ID and name)"""
+        if key in self.terms:
+            self.remove(key)
+        terms = self.split_terms(values)
+        self.terms[key] = terms
+        for term in terms:
+            node = self.root
+            for char in term:
+                node = node.children.setdefault(char, self.Node())
+                node.keys.add(key)
+
+    def remove(self, key: str):
+        """Remove key from every node on its terms' paths, pruning empty nodes"""
+        for term in self.terms.pop(key, ()):
+            path = []
+            node = self.root
+            for char in term:
+                child = node.children.get(char)
+                if child is None:
+                    break
+                path.append((node, char, child))
+                child.keys.discard(key)
+                node = child
+            for parent, char, child in reversed(path):
+                if child.keys or child.children:
+                    break
+                del parent.children[char]
+
+    def search(self, prefix: str) -> set:
+        """Keys with a term starting with prefix; an empty prefix matches everything"""
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return set(self.terms)
+        node = self.root
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return set()
+        return set(node.keys)
+
+
+class UserListView:
+    """Sorted, searchable list of registered users, read one window of rows at a time.
+
+    Users are kept as (sort value, user ID) entries in sorted lists, one
+    for all users and one for those matching the current search, so a
+    registration or deletion is a bisect insert or removal instead of a
+    re-sort, and showing a window of rows only formats those rows.
+    Descending order reads the same lists from the end.
+    """
+
+    COLUMNS = ('user_id', 'user_name', 'role', 'department', 'registered_date')
+
+    def __init__(self, users: List[Dict]):
+        self.sort_column = 'user_id'
+        self.descending = False
+        self.query = ""
+        self.matches: Optional[set] = None
+        self.load(users)
+
+    def sort_value(self, user: Dict):
+        if self.sort_column == 'registered_date':
+            try:
+                return parse_timestamp(user.get('registered_date') or 0)
+            except (ValueError, TypeError):
+                return 0
+        if self.sort_column == 'role':
+            return user.get('role', 'regular').lower()
+        if self.sort_column == 'department':
+            return (user.get('department') or DEFAULT_DEPARTMENT).lower()
+        return user[self.sort_column].lower()
+
+    def load(self, users: List[Dict]):
+        """Rebuild from the full user list"""
+        self.users = {user['user_id'].lower(): user for user in users}
+        self.entries = {key: (self.sort_value(user), key) for key, user in self.users.items()}
+        self.order = sorted(self.entries.values())
+        self.apply_filter()
+
+    def apply_filter(self):
+        if self.matches is None:
+            self.rows = list(self.order)
+        else:
+            self.rows = [entry for entry in self.order if entry[1] in self.matches]
+
+    def sort_by(self, column: str):
+        """Sort by a column, toggling direction on repeated clicks"""
+        if self.sort_column == column:
+            self.descending = not self.descending
+            return
+        self.sort_column = column
+        self.descending = False
+        self.load(list(self.users.values()))
+
+    def filter(self, query: str, matches: Optional[set]):
+        """Show only the user IDs (lower case) matching the search text, or everyone for None"""
+        self.query = query
+        self.matches = matches
+        self.apply_filter()
+
+    def add(self, user: Dict, matches_search: bool = True):
+        key = user['user_id'].lower()
+        if key in self.users:
+            self.remove(key)
+        entry = (self.sort_value(user), key)
+        self.users[key] = user
+        self.entries[key] = entry
+        bisect.insort(self.order, entry)
+        if self.matches is None or matches_search:
+            if self.matches is not None:
+                self.matches.add(key)
+            bisect.insort(self.rows, entry)
+
+    def remove(self, user_id: str):
+        key = user_id.lower()
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        del self.users[key]
+        del self.order[bisect.bisect_left(self.order, entry)]
+        position = bisect.bisect_left(self.rows, entry)
+        if position < len(self.rows) and self.rows[position] == entry:
+            del self.rows[position]
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def window(self, start: int, count: int) -> List[Dict]:
+        """Users at display positions start .. start + count - 1"""
+        if self.descending:
+            end = len(self.rows) - start
+            entries = reversed(self.rows[max(0, end - count):max(0, end)])
+        else:
+            entries = self.rows[start:start + count]
+        return [self.users[key] for _, key in entries]
+
+    def position(self, user_id: str) -> Optional[int]:
+        """Display position of a user, or None if not shown"""
+        entry = self.entries.get(user_id.lower())
+        if entry is None:
+            return None
+        position = bisect.bisect_left(self.rows, entry)
+        if position == len(self.rows) or self.rows[position] != entry:
+            return None
+        return len(self.rows) - 1 - position if self.descending else position
+
+
+class RecordViewCache:
+    """Bounded LRU cache of per-user record query results.
+
+    Each entry remembers the store's version counter for its user when it
+    was computed. Adding or removing one of that user's records bumps the
+    counter, so exactly that user's views go stale while everyone else's
+    stay cached. The least recently used entries are dropped beyond
+    capacity.
+    """
+
+    def __init__(self, capacity: int = 64):
+        self.capacity = capacity
+        self.entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, store: AttendanceStore, user_id: str, query_key, compute) -> List[AttendanceRecord]:
+        """Cached result for the user's query, calling compute() when missing or stale"""
+        key = (store.partition_dir, user_id.lower(), query_key)
+        version = store.user_version(user_id)
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] == version:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        result = compute()
+        self.entries[key] = (version, result)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+        return result
+
 
 class WFHAttendanceApp:
+    # Views that can be marked dirty, in the order they are re-rendered
+    REFRESH_VIEWS = ('records', 'sessions', 'heatmap', 'roles_downloads')
+    
+    # User actions that the admin can capture with cProfile
+    PROFILED_ACTIONS = (
+        'handle_login', 'handle_logout', 'time_in', 'auto_new_session', 'time_out', 'force_time_out',
+        'export_data', 'export_to_excel', 'manage_users', 'apply_records_filters', 'clear_records_filters',
+        'sort_records_by', 'flush_dirty_views', 'refresh_heatmap', 'refresh_roles_downloads',
+        'download_roles_export', 'download_roles_exports_zip', 'consolidate_roles_exports',
+        'show_export_history', 'show_payroll_report'
+    )
+
     def __init__(self, root):
         self.root = root
         self.root.title("WFH Attendance System")
@@ -28,15 +2416,34 @@ class WFHAttendanceApp:
         self.center_window()
         
         # Initialize data storage
-        self.data_file = "attendance_data.json"
+        self.data_file = "attendance_data.json"  # Legacy single-file history, migrated on first start
+        self.partition_dir = "attendance_partitions"
+        self.history_dir = "attendance_history"  # Exported records, lzma-compressed
         self.sessions_file = "active_sessions.json"
-        self.export_history_file = "export_history.json"
+        self.export_history_file = "export_history.json"  # Legacy format, migrated to the log on first start
+        self.export_log_file = "export_history.log"
         self.users_file = "registered_users.json"
         self.archive_file = "deleted_users_archive.json"
         self.admin_file = "admin_users.json"
         self.roles_file = "roles_users.json"
         self.roles_exports_dir = "roles_exports"  # Changed from admin_exports to roles_exports
-        self.attendance_data = self.load_data()
+        self.storage_version_file = "storage_version.json"
+        
+        # Opt-in memory profiling; wrappers go on before anything is loaded or bound to widgets
+        self.memory_profiler = None
+        if os.environ.get('WFH_MEMORY_PROFILE'):
+            self.memory_profiler = MemoryProfiler("memory_profile.log")
+            self.memory_profiler.install(
+                self, ('load_data', 'update_records_display', 'export_data', 'export_to_excel', 'manage_users')
+            )
+        
+        # On-demand cProfile capture of actions and the optional stack sampler (Admin)
+        self.action_profiler = ActionProfiler("profiles")
+        self.action_profiler.install(self, self.PROFILED_ACTIONS)
+        self.stack_sampler = None
+        
+        self.migrate_storage()
+        self.attendance_store = self.load_data()
         self.active_sessions = self.load_sessions()
         self.export_history = self.load_export_history()
         self.registered_users = self.load_registered_users()
@@ -44,14 +2451,55 @@ class WFHAttendanceApp:
         self.admin_users = self.load_admin_users()
         self.roles_users = self.load_roles_users()
         
+        # Prefix index over user IDs and names for search-as-you-type
+        self.user_index = PrefixIndex()
+        for user in self.registered_users:
+            self.user_index.add(user['user_id'].lower(), user['user_id'], user['user_name'])
+        self.search_after_ids = {}
+        
+        # User management list and window, built on first open and kept up to date from then on
+        self.user_list: Optional[UserListView] = None
+        self.users_window = None
+        self.render_user_list = None
+        
+        # Regular users' record views, so repeat logins and refreshes on a shared machine reuse them
+        self.record_views = RecordViewCache(capacity=64)
+        
         # Create roles exports directory if it doesn't exist
         self.create_roles_exports_dir()
+        self.roles_downloads_entries = []
+        
+        # Time in/out and export operations shared with the load generator
+        self.attendance_service = AttendanceService(
+            self.attendance_store, self.active_sessions, self.sessions_file, self.load_history()
+        )
+        
+        # Records, sessions and roles exports per department; the default department uses the files above
+        self.shards = DepartmentShards(".")
+        self.shards.add(DepartmentShard(DEFAULT_DEPARTMENT, ".", self.attendance_service))
+        
+        # Snapshots of the data files, taken in the background every WFH_BACKUP_HOURS (0 turns them off)
+        self.backups = BackupManager(".", "backups", keep=int(os.environ.get('WFH_BACKUP_KEEP', 14)))
+        self.backup_stop = threading.Event()
+        backup_hours = float(os.environ.get('WFH_BACKUP_HOURS', 24))
+        if backup_hours > 0:
+            threading.Thread(
+                target=self.backups.run_schedule,
+                args=(backup_hours * 3600, self.backup_stop, self.backup_locks),
+                name="backup-scheduler",
+                daemon=True
+            ).start()
         
         # Current user session
         self.current_user_id = None
+        self.current_department = DEFAULT_DEPARTMENT
         self.current_session_id = None
         self.user_role = None  # 'admin', 'roles', 'regular'
         
+        # Views waiting to be re-rendered on the next idle pass, see mark_dirty
+        self.dirty_views = set()
+        self.refresh_after_id = None
+        
         # Configure modern styles with pastel colors
         self.setup_pastel_styles()
         
@@ -59,12 +2507,53 @@ class WFHAttendanceApp:
         self.create_modern_ui()
         
         # Update records display
-        self.update_records_display()
-        self.update_sessions_display()
+        self.mark_dirty('records', 'sessions')
         
         # Initially hide features based on role
         self.toggle_features_based_on_role()
 
+    def mark_dirty(self, *views):
+        """Queue views for re-rendering; one idle pass renders each dirty view once"""
+        self.dirty_views.update(views)
+        if self.refresh_after_id is None:
+            self.refresh_after_id = self.root.after_idle(self.flush_dirty_views)
+
+    def flush_dirty_views(self):
+        """Re-render the views marked dirty since the last pass"""
+        self.refresh_after_id = None
+        dirty, self.dirty_views = self.dirty_views, set()
+        renderers = {
+            'records': self.update_records_display,
+            'sessions': self.update_sessions_display,
+            'heatmap': self.refresh_heatmap,
+            'roles_downloads': self.refresh_roles_downloads
+        }
+        error = None
+        for view in self.REFRESH_VIEWS:
+            if view in dirty:
+                try:
+                    renderers[view]()
+                except Exception as e:
+                    error = error or e
+        # Render the other views first, then let Tk report the error; a failed view
+        # is not re-marked (that would retry every idle pass) but renders again when next marked dirty
+        if error is not None:
+            raise error
+
+    def current_shard(self) -> DepartmentShard:
+        """Shard of the logged in user's department"""
+        return self.shards.shard(self.current_department)
+
+    def visible_departments(self) -> List[str]:
+        """Departments whose data the logged in user sees: all for admins, their own otherwise"""
+        if self.user_role == 'admin':
+            return self.shards.departments()
+        return [self.current_department]
+
+    def backup_locks(self) -> list:
+        """Service locks of the open departments, held while a backup links the data files"""
+        return self.shards.service_locks()
+
     def create_roles_exports_dir(self):
         """Create directory for roles user export files"""
         if not os.path.exists(self.roles_exports_dir):
@@ -325,6 +2814,9 @@ class WFHAttendanceApp:
         
         # Sessions tab
         self.create_sessions_tab()
+        
+        # Occupancy heatmap tab (Admin only)
+        self.create_heatmap_tab()
 
     def create_dashboard_tab(self):
         """Create compact dashboard tab"""
@@ -525,14 +3017,27 @@ class WFHAttendanceApp:
         content_frame = ttk.Frame(self.export_card, style='Card.TFrame')
         content_frame.pack(fill=tk.X, padx=20, pady=15)
         
-        # Export Button (Roles only) - UPDATED: Admin users won't see this button
+        # Export Button and format (Roles only) - UPDATED: Admin users won't see this button
+        self.export_controls = ttk.Frame(content_frame, style='Card.TFrame')
+        
+        self.export_format_var = tk.StringVar(value="Excel (.xlsx)")
+        ttk.Combobox(
+            self.export_controls,
+            textvariable=self.export_format_var,
+            values=list(EXPORT_FORMATS),
+            state="readonly",
+            width=18,
+            style='Modern.TCombobox'
+        ).pack(side=tk.RIGHT, padx=(8, 0))
+        
         self.export_btn = ttk.Button(
-            content_frame,
-            text="💾 Export to Excel",
-            command=self.export_to_excel,
+            self.export_controls,
+            text="💾 Export Data",
+            command=self.export_data,
             style='Info.TButton'
         )
-        # Button will be shown/hidden based on role in toggle_features_based_on_role method
+        self.export_btn.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        # Controls will be shown/hidden based on role in toggle_features_based_on_role method
         
         # Roles Downloads Section (Admin only)
         self.roles_downloads_frame = ttk.Frame(content_frame, style='Card.TFrame')
@@ -545,6 +3050,31 @@ class WFHAttendanceApp:
         )
         roles_downloads_label.pack(anchor=tk.W, pady=(10, 5))
         
+        # Filter and sort controls for the export list
+        list_controls = ttk.Frame(self.roles_downloads_frame, style='Card.TFrame')
+        list_controls.pack(fill=tk.X, pady=(0, 5))
+        
+        ttk.Label(list_controls, text="Filter:", style='Modern.TLabel').pack(side=tk.LEFT, padx=(0, 6))
+        self.roles_filter_var = tk.StringVar()
+        roles_filter_entry = ttk.Entry(list_controls, textvariable=self.roles_filter_var, width=18, font=('Segoe UI', 9), style='Modern.TEntry')
+        roles_filter_entry.pack(side=tk.LEFT, padx=(0, 12))
+        self.roles_filter_var.trace_add(
+            'write', lambda *args: self.debounce_search('roles_exports', self.refresh_roles_downloads)
+        )
+        
+        ttk.Label(list_controls, text="Sort:", style='Modern.TLabel').pack(side=tk.LEFT, padx=(0, 6))
+        self.roles_sort_var = tk.StringVar(value="Newest")
+        roles_sort_combo = ttk.Combobox(
+            list_controls,
+            textvariable=self.roles_sort_var,
+            values=list(ExportManifest.SORT_KEYS),
+            state="readonly",
+            width=9,
+            style='Modern.TCombobox'
+        )
+        roles_sort_combo.pack(side=tk.LEFT)
+        roles_sort_combo.bind('<<ComboboxSelected>>', lambda event: self.refresh_roles_downloads())
+        
         # Roles downloads listbox with scrollbar
         listbox_frame = ttk.Frame(self.roles_downloads_frame, style='Card.TFrame')
         listbox_frame.pack(fill=tk.X, pady=(0, 10))
@@ -557,6 +3087,7 @@ class WFHAttendanceApp:
         self.roles_downloads_listbox = tk.Listbox(
             listbox_frame,
             yscrollcommand=scrollbar.set,
+            selectmode=tk.EXTENDED,
             height=4,
             font=('Segoe UI', 9),
             bg='white',
@@ -584,6 +3115,92 @@ class WFHAttendanceApp:
         )
         self.roles_refresh_btn.pack(fill=tk.X, pady=(5, 0))
         
+        # Bulk zip download of the selected exports
+        self.roles_zip_btn = ttk.Button(
+            self.roles_downloads_frame,
+            text="📦 Download Selected as Zip",
+            command=self.download_roles_exports_zip,
+            style='Info.TButton'
+        )
+        self.roles_zip_btn.pack(fill=tk.X, pady=(5, 0))
+        
+        # Consolidation of the selected (or all) exports into one master report
+        consolidate_frame = ttk.Frame(self.roles_downloads_frame, style='Card.TFrame')
+        consolidate_frame.pack(fill=tk.X, pady=(5, 0))
+        
+        self.consolidate_format_var = tk.StringVar(value="xlsx")
+        ttk.Combobox(
+            consolidate_frame,
+            textvariable=self.consolidate_format_var,
+            values=["xlsx", "sqlite"],
+            state="readonly",
+            width=7,
+            style='Modern.TCombobox'
+        ).pack(side=tk.RIGHT, padx=(6, 0))
+        
+        self.roles_consolidate_btn = ttk.Button(
+            consolidate_frame,
+            text="🧩 Consolidate Exports",
+            command=self.consolidate_roles_exports,
+            style='Primary.TButton'
+        )
+        self.roles_consolidate_btn.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        
+        self.export_history_btn = ttk.Button(
+            self.roles_downloads_frame,
+            text="📈 Export History",
+            command=self.show_export_history,
+            style='Secondary.TButton'
+        )
+        self.export_history_btn.pack(fill=tk.X, pady=(5, 0))
+        
+        self.payroll_btn = ttk.Button(
+            self.roles_downloads_frame,
+            text="🧾 Payroll Report",
+            command=self.show_payroll_report,
+            style='Secondary.TButton'
+        )
+        self.payroll_btn.pack(fill=tk.X, pady=(5, 0))
+        
+        ttk.Button(
+            self.roles_downloads_frame,
+            text="🗄 Backups",
+            command=self.show_backups,
+            style='Secondary.TButton'
+        ).pack(fill=tk.X, pady=(5, 0))
+        
+        ttk.Button(
+            self.roles_downloads_frame,
+            text="⏱ Profiling",
+            command=self.show_profiling,
+            style='Secondary.TButton'
+        ).pack(fill=tk.X, pady=(5, 0))
+        
+        if self.memory_profiler:
+            ttk.Button(
+                self.roles_downloads_frame,
+                text="🧠 Memory Profile",
+                command=self.show_memory_profile,
+                style='Secondary.TButton'
+            ).pack(fill=tk.X, pady=(5, 0))
+        
+        # Progress of background admin jobs (zip download, consolidation)
+        self.admin_job_progress_var = tk.DoubleVar(value=0)
+        self.admin_job_progress = ttk.Progressbar(
+            self.roles_downloads_frame,
+            variable=self.admin_job_progress_var,
+            maximum=100,
+            mode='determinate'
+        )
+        self.admin_job_status_var = tk.StringVar(value="")
+        self.admin_job_status_label = ttk.Label(
+            self.roles_downloads_frame,
+            textvariable=self.admin_job_status_var,
+            style='Small.TLabel'
+        )
+        self.admin_job = None
+        self.admin_job_buttons = [self.roles_zip_btn, self.roles_consolidate_btn]
+        
         # Export Path Label
         path_frame = ttk.Frame(content_frame, style='Card.TFrame')
         path_frame.pack(fill=tk.X, pady=(8, 0))
@@ -613,7 +3230,70 @@ class WFHAttendanceApp:
             header_frame,
             text="Attendance History",
             style='Section.TLabel'
-        ).pack(anchor=tk.W)
+        ).pack(side=tk.LEFT)
+        
+        # Period selector - fills the date range; only partitions overlapping it are loaded
+        self.records_period_var = tk.StringVar(value="This Month")
+        period_combo = ttk.Combobox(
+            header_frame,
+            textvariable=self.records_period_var,
+            values=["This Month", "Last 3 Months", "This Year", "All History", "Custom"],
+            state="readonly",
+            width=14,
+            style='Modern.TCombobox'
+        )
+        period_combo.pack(side=tk.RIGHT)
+        period_combo.bind('<<ComboboxSelected>>', lambda event: self.apply_records_period())
+        ttk.Label(header_frame, text="Period:", style='Modern.TLabel').pack(side=tk.RIGHT, padx=(0, 8))
+        
+        # Filter controls
+        filter_frame = ttk.Frame(content_frame, style='Card.TFrame')
+        filter_frame.pack(fill=tk.X, pady=(0, 10))
+        
+        self.records_user_filter_var = tk.StringVar()
+        self.records_from_var = tk.StringVar()
+        self.records_to_var = tk.StringVar()
+        self.records_min_duration_var = tk.StringVar()
+        
+        filter_fields = [
+            ("🔎 User:", self.records_user_filter_var, 14),
+            ("From:", self.records_from_var, 11),
+            ("To:", self.records_to_var, 11),
+            ("Min. minutes:", self.records_min_duration_var, 6)
+        ]
+        for column, (label, variable, width) in enumerate(filter_fields):
+            ttk.Label(filter_frame, text=label, style='Modern.TLabel').grid(
+                row=0, column=column * 2, padx=(0, 6), sticky=tk.W
+            )
+            entry = ttk.Entry(filter_frame, textvariable=variable, width=width, font=('Segoe UI', 9), style='Modern.TEntry')
+            entry.grid(row=0, column=column * 2 + 1, padx=(0, 12), sticky=tk.W)
+            entry.bind('<Return>', lambda event: self.apply_records_filters())
+            if variable is self.records_user_filter_var:
+                self.records_user_filter_entry = entry
+        
+        # Search as you type on user ID or name prefixes
+        self.records_user_filter_var.trace_add(
+            'write', lambda *args: self.debounce_search('records', self.apply_records_filters)
+        )
+        
+        ttk.Button(
+            filter_frame,
+            text="Apply",
+            command=self.apply_records_filters,
+            style='Primary.TButton'
+        ).grid(row=0, column=8, padx=(0, 6))
+        ttk.Button(
+            filter_frame,
+            text="Clear",
+            command=self.clear_records_filters,
+            style='Secondary.TButton'
+        ).grid(row=0, column=9)
+        
+        # Active filters and sort order; the last query result is kept for re-sorting
+        self.records_filters = {}
+        self.records_sort = (None, False)
+        self.records_result_key = None
+        self.records_result = []
         
         # Create compact treeview with scrollbar
         tree_frame = ttk.Frame(content_frame, style='Card.TFrame')
@@ -644,13 +3324,17 @@ class WFHAttendanceApp:
             ('duration', 'Duration', 80)
         ]
         
+        self.records_headings = {}
         for col, heading, width in column_configs:
-            self.records_tree.heading(col, text=heading)
+            self.records_headings[col] = heading
+            self.records_tree.heading(col, text=heading, command=lambda c=col: self.sort_records_by(c))
             self.records_tree.column(col, width=width, anchor=tk.CENTER)
         
         self.records_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         scrollbar.config(command=self.records_tree.yview)
         
+        self.apply_records_period(refresh=False)
+        
         # Add alternating row colors
         self.records_tree.tag_configure('evenrow', background=self.colors['light'])
         self.records_tree.tag_configure('oddrow', background='white')
@@ -683,7 +3367,7 @@ class WFHAttendanceApp:
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         
         # Compact treeview
-        columns = ('session_id', 'user_id', 'user_name', 'date', 'time_in')
+        columns = ('session_id', 'user_id', 'user_name', 'department', 'date', 'time_in')
         self.sessions_tree = ttk.Treeview(
             tree_frame,
             columns=columns,
@@ -698,6 +3382,7 @@ class WFHAttendanceApp:
             ('session_id', 'Session ID', 150),
             ('user_id', 'User ID', 90),
             ('user_name', 'Name', 120),
+            ('department', 'Department', 100),
             ('date', 'Date', 100),
             ('time_in', 'Time In', 80)
         ]
@@ -721,6 +3406,140 @@ class WFHAttendanceApp:
             style='Danger.TButton'
         )
 
+    def create_heatmap_tab(self):
+        """Create the concurrent-session heatmap tab (hidden unless an admin is logged in)"""
+        self.occupancy = OccupancyEngine()
+        self.heatmap_frame = ttk.Frame(self.main_notebook, style='Card.TFrame')
+        self.main_notebook.add(self.heatmap_frame, text="🔥 Occupancy")
+        
+        content_frame = ttk.Frame(self.heatmap_frame, style='Card.TFrame')
+        content_frame.pack(fill=tk.BOTH, expand=True, padx=15, pady=15)
+        
+        header_frame = ttk.Frame(content_frame, style='Card.TFrame')
+        header_frame.pack(fill=tk.X, pady=(0, 12))
+        
+        ttk.Label(
+            header_frame,
+            text="People Online by Hour (peak)",
+            style='Section.TLabel'
+        ).pack(side=tk.LEFT)
+        
+        today = date.today()
+        self.heatmap_from_var = tk.StringVar(value=(today - timedelta(days=13)).isoformat())
+        self.heatmap_to_var = tk.StringVar(value=today.isoformat())
+        
+        ttk.Button(
+            header_frame,
+            text="Show",
+            command=self.refresh_heatmap,
+            style='Primary.TButton'
+        ).pack(side=tk.RIGHT)
+        for label, variable in (("To:", self.heatmap_to_var), ("From:", self.heatmap_from_var)):
+            entry = ttk.Entry(header_frame, textvariable=variable, width=11, font=('Segoe UI', 9), style='Modern.TEntry')
+            entry.pack(side=tk.RIGHT, padx=(0, 10))
+            entry.bind('<Return>', lambda event: self.refresh_heatmap())
+            ttk.Label(header_frame, text=label, style='Modern.TLabel').pack(side=tk.RIGHT, padx=(0, 6))
+        
+        canvas_frame = ttk.Frame(content_frame, style='Card.TFrame')
+        canvas_frame.pack(fill=tk.BOTH, expand=True)
+        
+        scrollbar = ttk.Scrollbar(canvas_frame)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        
+        self.heatmap_canvas = tk.Canvas(
+            canvas_frame,
+            bg='white',
+            highlightthickness=0,
+            yscrollcommand=scrollbar.set
+        )
+        self.heatmap_canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.config(command=self.heatmap_canvas.yview)
+        
+        self.main_notebook.hide(self.heatmap_frame)
+
+    def refresh_heatmap(self):
+        """Redraw the occupancy heatmap; only days touched since the last draw are recomputed"""
+        if self.user_role != 'admin':
+            return
+        
+        try:
+            start_day = date.fromisoformat(self.heatmap_from_var.get().strip()).toordinal()
+            end_day = date.fromisoformat(self.heatmap_to_var.get().strip()).toordinal()
+        except ValueError:
+            messagebox.showerror("Invalid Date", "Please enter dates as YYYY-MM-DD.")
+            return
+        if end_day < start_day:
+            start_day, end_day = end_day, start_day
+        
+        # Read the departments' partitions in parallel, then merge their events
+        departments = self.shards.departments()
+        
+        def preload(shard):
+            for store in (shard.store, shard.history):
+                if store is None:
+                    continue
+                for key in store.partition_keys(start_day - 1, end_day):
+                    store.load_partition(key)
+        
+        self.shards.map(preload, departments)
+        for department in departments:
+            shard = self.shards.shard(department)
+            self.occupancy.load_months(shard.store, start_day, end_day)
+            if shard.history is not None:
+                # Exported sessions still count as people online; the cold months need not stay in memory
+                self.occupancy.load_months(shard.history, start_day, end_day)
+                shard.history.release()
+        
+        # Active sessions count as online until now
+        now = datetime.now()
+        now_abs = now.date().toordinal() * SECONDS_PER_DAY + now.hour * 3600 + now.minute * 60 + now.second
+        open_intervals = []
+        for _, session in self.shards.sessions(departments):
+            day, seconds = local_day_seconds(session['time_in'])
+            session_start = day * SECONDS_PER_DAY + seconds
+            open_intervals.append((session_start, max(session_start + 1, now_abs)))
+        
+        profile = self.occupancy.profile(start_day, end_day, open_intervals)
+        self.draw_heatmap(profile)
+
+    def draw_heatmap(self, profile: Dict[int, List[int]]):
+        """Draw one row per day and one cell per hour, shaded by peak concurrency"""
+        canvas = self.heatmap_canvas
+        canvas.delete('all')
+        
+        label_width, cell_width, cell_height, top = 90, 30, 20, 22
+        peak = max((max(values) for values in profile.values() if values), default=0)
+        
+        for hour in range(24):
+            canvas.create_text(
+                label_width + hour * cell_width + cell_width / 2, top / 2,
+                text=f"{hour:02d}", font=('Segoe UI', 8), fill=self.colors['text_secondary']
+            )
+        
+        # Shade from white to the primary dark colour
+        low = (255, 255, 255)
+        high = tuple(int(self.colors['primary_dark'][i:i + 2], 16) for i in (1, 3, 5))
+        
+        for row, day in enumerate(sorted(profile, reverse=True)):
+            y = top + row * cell_height
+            canvas.create_text(
+                label_width - 8, y + cell_height / 2, anchor='e',
+                text=date.fromordinal(day).strftime("%a %m-%d"), font=('Segoe UI', 8),
+                fill=self.colors['text_primary']
+            )
+            for hour, value in enumerate(profile[day]):
+                ratio = value / peak if peak else 0
+                color = '#%02x%02x%02x' % tuple(int(l + (h - l) * ratio) for l, h in zip(low, high))
+                x = label_width + hour * cell_width
+                canvas.create_rectangle(x, y, x + cell_width, y + cell_height, fill=color, outline=self.colors['border'])
+                if value:
+                    canvas.create_text(
+                        x + cell_width / 2, y + cell_height / 2, text=str(value),
+                        font=('Segoe UI', 8), fill=self.colors['text_primary']
+                    )
+        
+        canvas.config(scrollregion=(0, 0, label_width + 24 * cell_width, top + len(profile) * cell_height))
+
     def update_clock(self):
         """Update the current time display"""
         current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -729,103 +3548,818 @@ class WFHAttendanceApp:
 
     def toggle_features_based_on_role(self):
         """Show/hide features based on user role"""
+        # Which records and sessions are shown depends on the role and department
+        self.mark_dirty('records', 'sessions')
         if self.user_role == 'admin':
             self.export_card.pack(fill=tk.X, pady=(0, 10))
             self.manage_users_btn.config(state=tk.NORMAL)
             self.force_out_btn.pack(pady=(12, 0))
             self.auto_time_in_btn.pack_forget()
             self.roles_downloads_frame.pack(fill=tk.X, pady=(15, 0))
-            self.export_btn.pack_forget()  # UPDATED: Hide export button for admin
-            self.refresh_roles_downloads()
+            self.export_controls.pack_forget()  # UPDATED: Hide export button for admin
+            self.main_notebook.add(self.heatmap_frame)
+            self.mark_dirty('roles_downloads', 'heatmap')
         elif self.user_role == 'roles':
             self.export_card.pack(fill=tk.X, pady=(0, 10))
             self.manage_users_btn.config(state=tk.DISABLED)
             self.force_out_btn.pack_forget()
             self.auto_time_in_btn.pack(side=tk.LEFT, padx=(8, 0))
             self.roles_downloads_frame.pack_forget()
-            self.export_btn.pack(fill=tk.X)  # UPDATED: Show export button for roles users
+            self.export_controls.pack(fill=tk.X)  # UPDATED: Show export button for roles users
+            self.main_notebook.hide(self.heatmap_frame)
         elif self.user_role == 'regular':
             self.export_card.pack_forget()
             self.manage_users_btn.config(state=tk.DISABLED)
             self.force_out_btn.pack_forget()
             self.auto_time_in_btn.pack_forget()
             self.roles_downloads_frame.pack_forget()
-            self.export_btn.pack_forget()
+            self.export_controls.pack_forget()
+            self.main_notebook.hide(self.heatmap_frame)
         else:
             self.export_card.pack_forget()
             self.manage_users_btn.config(state=tk.DISABLED)
             self.force_out_btn.pack_forget()
             self.auto_time_in_btn.pack_forget()
             self.roles_downloads_frame.pack_forget()
-            self.export_btn.pack_forget()
+            self.export_controls.pack_forget()
+            self.main_notebook.hide(self.heatmap_frame)
+
+    def refresh_roles_downloads(self):
+        """Refresh the list of available roles user exports for admin download"""
+        if self.user_role != 'admin':
+            return
+            
+        self.roles_downloads_listbox.delete(0, tk.END)
+        self.roles_downloads_entries = []
+        
+        try:
+            self.roles_downloads_entries = self.list_roles_exports(self.roles_sort_var.get(), self.roles_filter_var.get())
+            rows = []
+            for entry in self.roles_downloads_entries:
+                records = entry['record_count'] if entry['record_count'] is not None else "?"
+                rows.append(
+                    f"{entry['file']}  •  {entry['user_id'] or '-'}  •  {entry['department']}  •  "
+                    f"{format_timestamp(entry['timestamp'])}  •  {records} records  •  {format_file_size(entry['size'])}"
+                )
+            if rows:
+                self.roles_downloads_listbox.insert(tk.END, *rows)
+                    
+            if self.roles_downloads_listbox.size() == 0:
+                self.roles_downloads_listbox.insert(tk.END, "No roles user exports available")
+                self.roles_download_btn.config(state=tk.DISABLED)
+                self.roles_zip_btn.config(state=tk.DISABLED)
+            else:
+                self.roles_download_btn.config(state=tk.NORMAL)
+                if self.admin_job is None:
+                    self.roles_zip_btn.config(state=tk.NORMAL)
+                
+        except Exception as e:
+            print(f"Error refreshing roles downloads: {e}")
+
+    def list_roles_exports(self, sort_by: str = "Newest", filter_text: str = "") -> List[Dict]:
+        """Roles export entries of every department, tagged with their department and merged in one order"""
+        results = self.shards.map(
+            lambda shard: [
+                dict(entry, department=shard.department)
+                for entry in shard.export_manifest.list(sort_by, filter_text)
+            ]
+        )
+        if len(results) == 1:
+            return results[0][1]
+        entries = [entry for _, department_entries in results for entry in department_entries]
+        key, reverse = ExportManifest.SORT_KEYS.get(sort_by, ExportManifest.SORT_KEYS["Newest"])
+        entries.sort(key=key, reverse=reverse)
+        return entries
+
+    def resolve_roles_export(self, entry: Dict) -> str:
+        """Path of the file holding a roles export entry's content"""
+        return self.shards.shard(entry['department']).export_manifest.resolve(entry)
+
+    def download_roles_export(self):
+        """Download selected roles user export file (for admin users)"""
+        if self.user_role != 'admin':
+            return
+            
+        selected = self.roles_downloads_listbox.curselection()
+        if not selected:
+            messagebox.showwarning("Warning", "Please select a file to download")
+            return
+            
+        entries = self.get_selected_roles_exports()
+        if not entries:
+            return
+        
+        try:
+            downloads_path = self.get_downloads_path()
+            
+            destinations = []
+            for entry in entries:
+                destination = os.path.join(downloads_path, entry['file'])
+                if os.path.lexists(destination):
+                    self.make_file_writable(destination)
+                    os.remove(destination)
+                # Never hardlink the admin copy: it must stay writable while the stored object is read-only
+                fast_copy(self.resolve_roles_export(entry), destination)
+                self.make_file_writable(destination)
+                destinations.append(destination)
+            
+            if len(destinations) > 1:
+                messagebox.showinfo("Success", f"{len(destinations)} roles user exports downloaded to:\n{downloads_path}")
+                return
+            
+            destination = destinations[0]
+            messagebox.showinfo("Success", f"Roles user export downloaded to:\n{destination}")
+            
+            if messagebox.askyesno("Open File", "Do you want to open the downloaded file?"):
+                self.open_file(destination)
+                
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to download file: {str(e)}")
+
+    def get_downloads_path(self) -> str:
+        """The user's Downloads folder"""
+        return os.path.join(os.path.expanduser("~"), "Downloads")
+
+    def get_selected_roles_exports(self) -> List[Dict]:
+        """Manifest entries for the rows selected in the roles downloads list"""
+        return [
+            self.roles_downloads_entries[index]
+            for index in self.roles_downloads_listbox.curselection()
+            if index < len(self.roles_downloads_entries)
+        ]
+
+    def download_roles_exports_zip(self):
+        """Bundle the selected roles user exports into one zip in a background thread"""
+        if self.user_role != 'admin':
+            return
+        
+        entries = self.get_selected_roles_exports()
+        if not entries:
+            messagebox.showwarning("Warning", "Please select one or more files to download")
+            return
+        
+        files = [(self.resolve_roles_export(entry), entry['file']) for entry in entries]
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        destination = os.path.join(self.get_downloads_path(), f"roles_exports_{timestamp}.zip")
+        
+        def worker(progress):
+            return write_zip_archive(
+                files, destination,
+                lambda done, total: progress(done, total, f"Zipping... {format_file_size(done)}")
+            )
+        
+        def on_success(result):
+            self.make_file_writable(result)
+            messagebox.showinfo("Success", f"Roles user exports downloaded to:\n{result}")
+        
+        self.start_admin_job(f"Zipping {len(files)} files...", worker, on_success, "create zip file")
+
+    def consolidate_roles_exports(self):
+        """Merge the selected (or all) roles user exports into one deduplicated report"""
+        if self.user_role != 'admin':
+            return
+        
+        entries = self.get_selected_roles_exports()
+        if not entries:
+            entries = self.list_roles_exports()
+            if not entries:
+                messagebox.showwarning("Warning", "No roles user exports available")
+                return
+            if not messagebox.askyesno(
+                "Consolidate Exports",
+                f"No files selected. Consolidate all {len(entries)} roles user exports?"
+            ):
+                return
+        
+        sources = [
+            (self.resolve_roles_export(entry), split_export_extension(entry.get('object', ''))[0] or None)
+            for entry in entries
+        ]
+        fmt = self.consolidate_format_var.get()
+        extension = '.sqlite' if fmt == 'sqlite' else '.xlsx'
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        destination = os.path.join(self.get_downloads_path(), f"consolidated_exports_{timestamp}{extension}")
+        cache_dir = os.path.join(self.roles_exports_dir, "consolidation_cache")
+        
+        def worker(progress):
+            return consolidate_exports(
+                sources, destination, cache_dir,
+                lambda done, total: progress(done, total, f"Reading exports... {done}/{total}")
+            )
+        
+        def on_success(result):
+            self.make_file_writable(destination)
+            messagebox.showinfo(
+                "Success",
+                f"Consolidated {result['files']} exports ({result['read']} read, {result['cached']} from cache).\n\n"
+                f"{result['rows']} unique records ({result['duplicates']} duplicates removed) saved to:\n{destination}"
+            )
+            if messagebox.askyesno("Open File", "Do you want to open the consolidated report?"):
+                self.open_file(destination)
+        
+        self.start_admin_job(f"Consolidating {len(sources)} exports...", worker, on_success, "consolidate exports")
+
+    def start_admin_job(self, label: str, worker, on_success, action: str):
+        """Run worker(progress) on a background thread with a progress bar in the admin card.
+
+        The worker reports through progress(done, total, message), which only
+        updates a dict; the UI thread polls that dict, so no widget is
+        touched off the main thread.
+        """
+        if self.admin_job is not None:
+            messagebox.showwarning("Warning", "Another background task is still running")
+            return
+        
+        job = {'done': 0, 'total': 0, 'message': label, 'finished': False,
+               'result': None, 'error': None, 'on_success': on_success, 'action': action}
+        self.admin_job = job
+        
+        def progress(done, total, message=None):
+            job['done'], job['total'] = done, total
+            if message:
+                job['message'] = message
+        
+        def run():
+            try:
+                job['result'] = worker(progress)
+            except Exception as e:
+                job['error'] = e
+            finally:
+                job['finished'] = True
+        
+        for button in self.admin_job_buttons:
+            button.config(state=tk.DISABLED)
+        self.admin_job_progress_var.set(0)
+        self.admin_job_status_var.set(label)
+        self.admin_job_progress.pack(fill=tk.X, pady=(5, 0))
+        self.admin_job_status_label.pack(anchor=tk.W)
+        
+        threading.Thread(target=run, name=f"admin-job-{action}", daemon=True).start()
+        self.poll_admin_job()
+
+    def poll_admin_job(self):
+        """Update the admin job progress bar until the background job finishes"""
+        job = self.admin_job
+        if job is None:
+            return
+        
+        if job['total']:
+            percent = 100.0 * job['done'] / job['total']
+            self.admin_job_progress_var.set(percent)
+            self.admin_job_status_var.set(f"{job['message']} ({percent:.0f}%)")
+        
+        if not job['finished']:
+            self.root.after(100, self.poll_admin_job)
+            return
+        
+        self.admin_job = None
+        for button in self.admin_job_buttons:
+            button.config(state=tk.NORMAL)
+        self.admin_job_progress.pack_forget()
+        self.admin_job_status_label.pack_forget()
+        
+        if job['error'] is not None:
+            messagebox.showerror("Error", f"Failed to {job['action']}: {job['error']}")
+            return
+        job['on_success'](job['result'])
+
+    def show_export_history(self):
+        """Show export frequency, record counts and durations per user and per day (Admin only)"""
+        if self.user_role != 'admin':
+            messagebox.showerror("Access Denied", "Only administrators can view export history.")
+            return
+        
+        history_window = tk.Toplevel(self.root)
+        history_window.title("Export History - Admin")
+        history_window.geometry("760x560")
+        history_window.configure(bg=self.colors['light'])
+        
+        main_container = ttk.Frame(history_window, style='Modern.TFrame')
+        main_container.pack(fill=tk.BOTH, expand=True, padx=20, pady=20)
+        
+        ttk.Label(
+            main_container,
+            text="📈 Export History",
+            style='Title.TLabel'
+        ).pack(pady=(0, 5))
+        
+        ttk.Label(
+            main_container,
+            text=f"{len(self.export_history.query())} exports kept for {self.export_history.retention_days} days",
+            style='Small.TLabel'
+        ).pack(pady=(0, 10))
+        
+        def add_table(title, columns, rows):
+            card = ttk.Frame(main_container, style='Card.TFrame')
+            card.pack(fill=tk.BOTH, expand=True, pady=(0, 10))
+            ttk.Label(card, text=title, style='Section.TLabel').pack(anchor=tk.W, padx=15, pady=(10, 5))
+            
+            tree_frame = ttk.Frame(card, style='Card.TFrame')
+            tree_frame.pack(fill=tk.BOTH, expand=True, padx=15, pady=(0, 10))
+            scrollbar = ttk.Scrollbar(tree_frame)
+            scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+            
+            tree = ttk.Treeview(
+                tree_frame,
+                columns=[col for col, _, _ in columns],
+                show='headings',
+                style='Modern.Treeview',
+                yscrollcommand=scrollbar.set,
+                height=6
+            )
+            for col, heading, width in columns:
+                tree.heading(col, text=heading)
+                tree.column(col, width=width, anchor=tk.CENTER)
+            tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+            scrollbar.config(command=tree.yview)
+            tree.tag_configure('evenrow', background=self.colors['light'])
+            tree.tag_configure('oddrow', background='white')
+            
+            for i, values in enumerate(rows):
+                tree.insert('', tk.END, values=values, tags=('evenrow' if i % 2 == 0 else 'oddrow',))
+        
+        def format_ms(value):
+            return "-" if value is None else f"{value / 1000:.2f} s"
+        
+        add_table(
+            "👤 Per User",
+            [('user_id', 'User ID', 100), ('exports', 'Exports', 70), ('records', 'Records', 80),
+             ('avg', 'Avg Duration', 100), ('max', 'Max Duration', 100), ('last', 'Last Export', 140)],
+            [
+                (item['user_id'] or '-', item['exports'], item['records'],
+                 format_ms(item['avg_duration_ms']), format_ms(item['max_duration_ms']), item['last_export'])
+                for item in self.export_history.summary_by_user()
+            ]
+        )
+        add_table(
+            "📅 Per Day",
+            [('date', 'Date', 120), ('exports', 'Exports', 80), ('records', 'Records', 90), ('users', 'Users', 80)],
+            [
+                (item['date'], item['exports'], item['records'], item['users'])
+                for item in self.export_history.summary_by_date()
+            ]
+        )
+        
+        ttk.Button(main_container, text="Close", command=history_window.destroy, style='Secondary.TButton').pack(pady=(5, 0))
+
+    def show_backups(self):
+        """List backup snapshots, take one now or restore one into a separate folder (Admin only)"""
+        if self.user_role != 'admin':
+            messagebox.showerror("Access Denied", "Only administrators can manage backups.")
+            return
+        
+        backups_window = tk.Toplevel(self.root)
+        backups_window.title("Backups - Admin")
+        backups_window.geometry("760x480")
+        backups_window.configure(bg=self.colors['light'])
+        
+        main_container = ttk.Frame(backups_window, style='Modern.TFrame')
+        main_container.pack(fill=tk.BOTH, expand=True, padx=20, pady=20)
+        
+        ttk.Label(
+            main_container,
+            text="🗄 Backups",
+            style='Title.TLabel'
+        ).pack(pady=(0, 5))
+        ttk.Label(
+            main_container,
+            text=f"Keeping the newest {self.backups.keep} snapshots in {os.path.abspath(self.backups.backup_dir)}",
+            style='Small.TLabel'
+        ).pack(anchor=tk.W, pady=(0, 10))
+        
+        tree_frame = ttk.Frame(main_container, style='Card.TFrame')
+        tree_frame.pack(fill=tk.BOTH, expand=True)
+        scrollbar = ttk.Scrollbar(tree_frame)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        
+        columns = [('id', 'Snapshot', 150), ('created', 'Taken', 150), ('files', 'Files', 70),
+                   ('size', 'Data Size', 100), ('new_bytes', 'New Data', 100), ('duration', 'Time', 80)]
+        tree = ttk.Treeview(
+            tree_frame,
+            columns=[col for col, _, _ in columns],
+            show='headings',
+            style='Modern.Treeview',
+            yscrollcommand=scrollbar.set
+        )
+        for col, heading, width in columns:
+            tree.heading(col, text=heading)
+            tree.column(col, width=width, anchor=tk.CENTER)
+        tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.config(command=tree.yview)
+        tree.tag_configure('evenrow', background=self.colors['light'])
+        tree.tag_configure('oddrow', background='white')
+        
+        def refresh():
+            tree.delete(*tree.get_children())
+            for i, snapshot_id in enumerate(reversed(self.backups.snapshot_ids())):
+                try:
+                    manifest = self.backups.load_snapshot(snapshot_id)
+                except Exception as e:
+                    print(f"Error reading backup {snapshot_id}: {e}")
+                    continue
+                tree.insert('', tk.END, iid=snapshot_id, values=(
+                    snapshot_id,
+                    format_timestamp(manifest['created']),
+                    len(manifest['files']),
+                    format_file_size(manifest['size']),
+                    format_file_size(manifest['new_bytes']),
+                    f"{manifest.get('duration_ms', 0) / 1000:.1f} s"
+                ), tags=('evenrow' if i % 2 == 0 else 'oddrow',))
+        
+        def back_up_now():
+            def on_success(manifest):
+                if backups_window.winfo_exists():
+                    refresh()
+                messagebox.showinfo(
+                    "Backup Complete",
+                    f"Snapshot {manifest['id']}: {len(manifest['files'])} files, "
+                    f"{format_file_size(manifest['new_bytes'])} of new data."
+                )
+            
+            self.start_admin_job(
+                "Backing up...",
+                lambda progress: self.backups.snapshot(
+                    self.backup_locks(), lambda done, total: progress(done, total, "Backing up...")
+                ),
+                on_success, "back up the data"
+            )
+        
+        def restore_selected():
+            selected = tree.selection()
+            if not selected:
+                messagebox.showwarning("Warning", "Please select a snapshot to restore")
+                return
+            snapshot_id = selected[0]
+            target_dir = os.path.join(self.backups.backup_dir, "restored", snapshot_id)
+            
+            def on_success(result):
+                messagebox.showinfo(
+                    "Restore Complete",
+                    f"Snapshot {snapshot_id} restored to:\n{os.path.abspath(target_dir)}\n\n"
+                    f"{result['restored']} files written, {result['skipped']} already up to date.\n"
+                    f"Close the app and copy these files over the data folder to switch to them, "
+                    f"or run tools/backup.py restore {snapshot_id} while the app is closed."
+                )
+            
+            self.start_admin_job(
+                "Restoring...",
+                lambda progress: self.backups.restore(
+                    snapshot_id, target_dir, lambda done, total: progress(done, total, "Restoring...")
+                ),
+                on_success, "restore the backup"
+            )
+        
+        buttons_frame = ttk.Frame(main_container, style='Modern.TFrame')
+        buttons_frame.pack(fill=tk.X, pady=(10, 0))
+        ttk.Button(buttons_frame, text="💾 Back Up Now", command=back_up_now, style='Primary.TButton').pack(side=tk.LEFT)
+        ttk.Button(buttons_frame, text="♻ Restore Selected", command=restore_selected,
+                   style='Secondary.TButton').pack(side=tk.LEFT, padx=(10, 0))
+        ttk.Button(buttons_frame, text="Refresh", command=refresh, style='Secondary.TButton').pack(side=tk.LEFT, padx=(10, 0))
+        ttk.Button(buttons_frame, text="Close", command=backups_window.destroy, style='Secondary.TButton').pack(side=tk.RIGHT)
+        
+        refresh()
 
-    def refresh_roles_downloads(self):
-        """Refresh the list of available roles user exports for admin download"""
+    def show_profiling(self):
+        """Arm cProfile capture of the next actions and start/stop the stack sampler (Admin only)"""
         if self.user_role != 'admin':
+            messagebox.showerror("Access Denied", "Only administrators can profile actions.")
             return
-            
-        self.roles_downloads_listbox.delete(0, tk.END)
         
-        try:
-            if os.path.exists(self.roles_exports_dir):
-                files = os.listdir(self.roles_exports_dir)
-                excel_files = [f for f in files if f.endswith('.xlsx')]
-                
-                for excel_file in sorted(excel_files, reverse=True):  # Show newest first
-                    self.roles_downloads_listbox.insert(tk.END, excel_file)
-                    
-            if self.roles_downloads_listbox.size() == 0:
-                self.roles_downloads_listbox.insert(tk.END, "No roles user exports available")
-                self.roles_download_btn.config(state=tk.DISABLED)
+        profiling_window = tk.Toplevel(self.root)
+        profiling_window.title("Profiling - Admin")
+        profiling_window.geometry("900x620")
+        profiling_window.configure(bg=self.colors['light'])
+        
+        main_container = ttk.Frame(profiling_window, style='Modern.TFrame')
+        main_container.pack(fill=tk.BOTH, expand=True, padx=20, pady=20)
+        
+        ttk.Label(
+            main_container,
+            text="⏱ Profiling",
+            style='Title.TLabel'
+        ).pack(pady=(0, 10))
+        
+        profiler = self.action_profiler
+        status_var = tk.StringVar()
+        count_var = tk.StringVar(value="5")
+        sampler_btn_var = tk.StringVar()
+        
+        def update_status():
+            status_var.set(
+                f"Next {profiler.remaining} actions will be profiled  •  {len(profiler.captured)} profiles saved "
+                f"to {profiler.output_dir}/"
+            )
+            sampler_btn_var.set("⏹ Stop Sampling" if self.stack_sampler else "▶ Start Sampling")
+        
+        def arm():
+            try:
+                count = int(count_var.get())
+                if count < 0:
+                    raise ValueError
+            except ValueError:
+                messagebox.showerror("Invalid Input", "Enter the number of actions to profile.")
+                return
+            profiler.arm(count)
+            update_status()
+        
+        def toggle_sampler():
+            if self.stack_sampler:
+                path = self.stack_sampler.stop()
+                samples = self.stack_sampler.samples
+                self.stack_sampler = None
+                messagebox.showinfo("Sampling Stopped", f"{samples} samples written to:\n{path}")
             else:
-                self.roles_download_btn.config(state=tk.NORMAL)
-                
-        except Exception as e:
-            print(f"Error refreshing roles downloads: {e}")
+                self.stack_sampler = StackSampler(profiler.output_dir)
+                self.stack_sampler.start()
+            update_status()
+        
+        controls_frame = ttk.Frame(main_container, style='Modern.TFrame')
+        controls_frame.pack(fill=tk.X, pady=(0, 5))
+        ttk.Label(controls_frame, text="Profile next", style='Modern.TLabel').pack(side=tk.LEFT, padx=(0, 6))
+        ttk.Entry(
+            controls_frame, textvariable=count_var, width=5, font=('Segoe UI', 9), style='Modern.TEntry'
+        ).pack(side=tk.LEFT, padx=(0, 6))
+        ttk.Label(controls_frame, text="actions", style='Modern.TLabel').pack(side=tk.LEFT, padx=(0, 10))
+        ttk.Button(controls_frame, text="Arm", command=arm, style='Primary.TButton').pack(side=tk.LEFT)
+        ttk.Button(
+            controls_frame, textvariable=sampler_btn_var, command=toggle_sampler, style='Secondary.TButton'
+        ).pack(side=tk.RIGHT)
+        
+        ttk.Label(main_container, textvariable=status_var, style='Small.TLabel').pack(anchor=tk.W, pady=(0, 10))
+        
+        list_frame = ttk.Frame(main_container, style='Card.TFrame')
+        list_frame.pack(fill=tk.X)
+        profiles_listbox = tk.Listbox(list_frame, height=6, font=('Segoe UI', 9), activestyle='none')
+        profiles_listbox.pack(fill=tk.X)
+        
+        summary_text = tk.Text(main_container, height=18, font=('Consolas', 9), wrap=tk.NONE)
+        summary_text.pack(fill=tk.BOTH, expand=True, pady=(10, 0))
+        
+        def refresh_list():
+            profiles_listbox.delete(0, tk.END)
+            for path in reversed(profiler.captured):
+                profiles_listbox.insert(tk.END, os.path.basename(path))
+            update_status()
+        
+        def show_summary(event=None):
+            selection = profiles_listbox.curselection()
+            summary_text.delete('1.0', tk.END)
+            if not selection:
+                return
+            path = list(reversed(profiler.captured))[selection[0]]
+            try:
+                summary_text.insert(tk.END, ActionProfiler.summary(path))
+            except Exception as e:
+                summary_text.insert(tk.END, f"Failed to read {path}: {e}")
+        
+        profiles_listbox.bind('<<ListboxSelect>>', show_summary)
+        
+        buttons_frame = ttk.Frame(main_container, style='Modern.TFrame')
+        buttons_frame.pack(fill=tk.X, pady=(10, 0))
+        ttk.Button(buttons_frame, text="Refresh", command=refresh_list, style='Secondary.TButton').pack(side=tk.LEFT)
+        ttk.Button(buttons_frame, text="Close", command=profiling_window.destroy, style='Secondary.TButton').pack(side=tk.RIGHT)
+        
+        refresh_list()
 
-    def download_roles_export(self):
-        """Download selected roles user export file (for admin users)"""
+    def show_memory_profile(self):
+        """Show peak memory and top allocation sites per profiled operation (Admin only)"""
         if self.user_role != 'admin':
+            messagebox.showerror("Access Denied", "Only administrators can view memory profiles.")
             return
-            
-        selected = self.roles_downloads_listbox.curselection()
-        if not selected:
-            messagebox.showwarning("Warning", "Please select a file to download")
+        
+        profile_window = tk.Toplevel(self.root)
+        profile_window.title("Memory Profile - Admin")
+        profile_window.geometry("860x600")
+        profile_window.configure(bg=self.colors['light'])
+        
+        main_container = ttk.Frame(profile_window, style='Modern.TFrame')
+        main_container.pack(fill=tk.BOTH, expand=True, padx=20, pady=20)
+        
+        ttk.Label(
+            main_container,
+            text="🧠 Memory Profile",
+            style='Title.TLabel'
+        ).pack(pady=(0, 5))
+        
+        current, peak = tracemalloc.get_traced_memory()
+        ttk.Label(
+            main_container,
+            text=f"Traced now: {format_file_size(current)}  •  Peak since last operation: {format_file_size(peak)}  "
+                 f"•  Log: {self.memory_profiler.log_file}",
+            style='Small.TLabel'
+        ).pack(pady=(0, 10))
+        
+        tree_frame = ttk.Frame(main_container, style='Card.TFrame')
+        tree_frame.pack(fill=tk.BOTH, expand=True)
+        scrollbar = ttk.Scrollbar(tree_frame)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        
+        columns = [('time', 'Time', 140), ('operation', 'Operation', 170), ('duration', 'Duration', 90),
+                   ('peak', 'Peak', 90), ('net', 'Net Change', 90), ('traced', 'Traced After', 100)]
+        tree = ttk.Treeview(
+            tree_frame,
+            columns=[col for col, _, _ in columns],
+            show='headings',
+            style='Modern.Treeview',
+            yscrollcommand=scrollbar.set,
+            height=10
+        )
+        for col, heading, width in columns:
+            tree.heading(col, text=heading)
+            tree.column(col, width=width, anchor=tk.CENTER)
+        tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.config(command=tree.yview)
+        tree.tag_configure('evenrow', background=self.colors['light'])
+        tree.tag_configure('oddrow', background='white')
+        
+        entries = list(reversed(self.memory_profiler.entries))
+        for i, entry in enumerate(entries):
+            tree.insert('', tk.END, iid=str(i), values=(
+                format_timestamp(entry['timestamp']),
+                entry['operation'],
+                f"{entry['duration_ms']:.0f} ms",
+                f"{entry['peak_kb']:.1f} KB",
+                f"{entry['net_kb']:+.1f} KB",
+                f"{entry['traced_kb']:.1f} KB"
+            ), tags=('evenrow' if i % 2 == 0 else 'oddrow',))
+        
+        ttk.Label(main_container, text="Top allocation sites (net change)", style='Section.TLabel').pack(
+            anchor=tk.W, pady=(10, 5)
+        )
+        sites_text = tk.Text(main_container, height=10, font=('Consolas', 9), wrap=tk.NONE)
+        sites_text.pack(fill=tk.BOTH, expand=True)
+        
+        def show_sites(event=None):
+            selected = tree.selection()
+            sites_text.delete('1.0', tk.END)
+            if not selected:
+                return
+            for site in entries[int(selected[0])]['top']:
+                sites_text.insert(tk.END, f"{site['size_kb']:>+10.1f} KB  {site['count']:>+8} blocks  {site['site']}\n")
+        
+        tree.bind('<<TreeviewSelect>>', show_sites)
+        if entries:
+            tree.selection_set('0')
+            show_sites()
+        
+        ttk.Button(main_container, text="Close", command=profile_window.destroy, style='Secondary.TButton').pack(pady=(10, 0))
+
+    def show_payroll_report(self):
+        """Show regular and overtime hours per user for a monthly pay period (Admin only)"""
+        if self.user_role != 'admin':
+            messagebox.showerror("Access Denied", "Only administrators can view payroll reports.")
             return
-            
-        excel_filename = self.roles_downloads_listbox.get(selected[0])
-        excel_filepath = os.path.join(self.roles_exports_dir, excel_filename)
         
-        try:
-            if sys.platform == "win32":
-                downloads_path = os.path.join(os.path.expanduser("~"), "Downloads")
-            elif sys.platform == "darwin":
-                downloads_path = os.path.join(os.path.expanduser("~"), "Downloads")
-            else:
-                downloads_path = os.path.join(os.path.expanduser("~"), "Downloads")
+        payroll_window = tk.Toplevel(self.root)
+        payroll_window.title("Payroll Report - Admin")
+        payroll_window.geometry("820x520")
+        payroll_window.configure(bg=self.colors['light'])
+        
+        main_container = ttk.Frame(payroll_window, style='Modern.TFrame')
+        main_container.pack(fill=tk.BOTH, expand=True, padx=20, pady=20)
+        
+        ttk.Label(
+            main_container,
+            text="🧾 Payroll Report",
+            style='Title.TLabel'
+        ).pack(pady=(0, 10))
+        
+        options_frame = ttk.Frame(main_container, style='Modern.TFrame')
+        options_frame.pack(fill=tk.X, pady=(0, 10))
+        
+        period_var = tk.StringVar(value=date.today().strftime("%Y-%m"))
+        payroll = self.current_shard().payroll
+        daily_var = tk.StringVar(value=f"{payroll.daily_hours:g}")
+        weekly_var = tk.StringVar(value=f"{payroll.weekly_hours:g}")
+        for label, variable, width in (("Month (YYYY-MM):", period_var, 9),
+                                       ("Daily hours:", daily_var, 5),
+                                       ("Weekly hours:", weekly_var, 5)):
+            ttk.Label(options_frame, text=label, style='Modern.TLabel').pack(side=tk.LEFT, padx=(0, 6))
+            ttk.Entry(
+                options_frame, textvariable=variable, width=width, font=('Segoe UI', 9), style='Modern.TEntry'
+            ).pack(side=tk.LEFT, padx=(0, 12))
+        
+        status_label = ttk.Label(main_container, text="", style='Small.TLabel')
+        status_label.pack(anchor=tk.W, pady=(0, 5))
+        
+        tree_frame = ttk.Frame(main_container, style='Card.TFrame')
+        tree_frame.pack(fill=tk.BOTH, expand=True)
+        scrollbar = ttk.Scrollbar(tree_frame)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        
+        columns = [('user_id', 'User ID', 90), ('user_name', 'Name', 140), ('department', 'Department', 100),
+                   ('days_worked', 'Days', 60),
+                   ('sessions', 'Sessions', 70), ('total_hours', 'Total Hours', 90),
+                   ('regular_hours', 'Regular', 90), ('overtime_hours', 'Overtime', 90)]
+        tree = ttk.Treeview(
+            tree_frame,
+            columns=[col for col, _, _ in columns],
+            show='headings',
+            style='Modern.Treeview',
+            yscrollcommand=scrollbar.set
+        )
+        for col, heading, width in columns:
+            tree.heading(col, text=heading)
+            tree.column(col, width=width, anchor=tk.CENTER)
+        tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.config(command=tree.yview)
+        tree.tag_configure('evenrow', background=self.colors['light'])
+        tree.tag_configure('oddrow', background='white')
+        
+        report = {'period': None, 'rows': []}
+        
+        def calculate():
+            try:
+                year, month = (int(part) for part in period_var.get().strip().split('-'))
+                period = date(year, month, 1).strftime("%Y-%m")
+                daily_hours = float(daily_var.get())
+                weekly_hours = float(weekly_var.get())
+            except ValueError:
+                messagebox.showerror("Invalid Input", "Enter the month as YYYY-MM and the hour limits as numbers.")
+                return
+            if daily_hours <= 0 or weekly_hours <= 0:
+                messagebox.showerror("Invalid Input", "Hour limits must be greater than zero.")
+                return
             
-            destination = os.path.join(downloads_path, excel_filename)
-            shutil.copy2(excel_filepath, destination)
+            def department_report(shard: DepartmentShard) -> List[Dict]:
+                # Each department's engine keeps the limits and its own cache of closed months
+                shard.payroll.daily_hours = daily_hours
+                shard.payroll.weekly_hours = weekly_hours
+                return shard.payroll.report(shard.store, period, shard.history)
             
-            messagebox.showinfo("Success", f"Roles user export downloaded to:\n{destination}")
+            start = time.perf_counter()
+            results = self.shards.map(department_report)
+            rows = [dict(row, department=department) for department, department_rows in results for row in department_rows]
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            report['period'], report['rows'] = period, rows
             
-            if messagebox.askyesno("Open File", "Do you want to open the downloaded Excel file?"):
-                self.open_file(destination)
-                
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to download file: {str(e)}")
+            tree.delete(*tree.get_children())
+            for i, row in enumerate(rows):
+                tree.insert('', tk.END, values=[row[col] for col, _, _ in columns],
+                            tags=('evenrow' if i % 2 == 0 else 'oddrow',))
+            overtime = sum(row['overtime_hours'] for row in rows)
+            status_label.config(
+                text=f"{len(rows)} users, {overtime:.2f} overtime hours ({elapsed_ms:.0f} ms)"
+            )
+        
+        def export():
+            if not report['rows']:
+                messagebox.showwarning("No Data", "Calculate a report with data first.")
+                return
+            extension = EXPORT_FORMATS[format_var.get()]
+            downloads_path = self.get_downloads_path()
+            os.makedirs(downloads_path, exist_ok=True)
+            filename = f"payroll_{report['period']}_{datetime.now().strftime('%Y%m%d_%H%M%S')}{extension}"
+            filepath = os.path.join(downloads_path, filename)
+            try:
+                write_export_file(report['rows'], filepath, PAYROLL_COLUMNS, table="payroll")
+            except Exception as e:
+                messagebox.showerror("Export Error", f"Failed to export payroll report: {str(e)}")
+                return
+            messagebox.showinfo("Success", f"Payroll report saved to:\n{filepath}")
+        
+        actions_frame = ttk.Frame(main_container, style='Modern.TFrame')
+        actions_frame.pack(fill=tk.X, pady=(10, 0))
+        
+        ttk.Button(actions_frame, text="Calculate", command=calculate, style='Primary.TButton').pack(side=tk.LEFT)
+        format_var = tk.StringVar(value=next(iter(EXPORT_FORMATS)))
+        ttk.Combobox(
+            actions_frame,
+            textvariable=format_var,
+            values=list(EXPORT_FORMATS),
+            state='readonly',
+            width=18,
+            font=('Segoe UI', 9),
+            style='Modern.TCombobox'
+        ).pack(side=tk.LEFT, padx=(10, 6))
+        ttk.Button(actions_frame, text="💾 Export", command=export, style='Secondary.TButton').pack(side=tk.LEFT)
+        ttk.Button(actions_frame, text="Close", command=payroll_window.destroy, style='Secondary.TButton').pack(side=tk.RIGHT)
+        
+        calculate()
 
-    def save_roles_export_copy(self, original_excel_path, roles_user_id):
-        """Save a copy of the Excel file to roles_exports directory for admin access"""
+    def save_roles_export_copy(self, original_excel_path, roles_user_id, record_count: Optional[int] = None,
+                               shard: Optional[DepartmentShard] = None):
+        """Store the exported file in the roles_exports artifact store for admin access.
+
+        The file is moved (not copied) into the store when it was written
+        there, and is named by its content hash.
+        """
         try:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            excel_filename = f"roles_export_{roles_user_id}_{timestamp}.xlsx"
-            excel_filepath = os.path.join(self.roles_exports_dir, excel_filename)
+            now = int(time.time())
+            timestamp = format_timestamp(now, "%Y%m%d_%H%M%S")
+            extension = split_export_extension(original_excel_path)[1]
+            excel_filename = f"roles_export_{roles_user_id}_{timestamp}{extension}"
             
-            # Copy the Excel file directly to roles_exports directory
-            shutil.copy2(original_excel_path, excel_filepath)
+            shard = shard or self.current_shard()
+            excel_filepath = shard.export_artifacts.ingest(original_excel_path)
+            self.make_file_read_only(excel_filepath)
             
-            print(f"Roles export copy saved: {excel_filepath}")
+            # Record the export's metadata for the admin download list
+            shard.export_manifest.add(
+                excel_filename, excel_filepath, record_count, roles_user_id, now
+            )
+            
+            print(f"Roles export stored: {excel_filename} -> {excel_filepath}")
             return excel_filepath
             
         except Exception as e:
@@ -868,11 +4402,6 @@ class WFHAttendanceApp:
                 return 'roles'
         return 'regular'
 
-    def generate_session_id(self, user_id: str) -> str:
-        """Generate unique session ID"""
-        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-        return f"{user_id}_{timestamp}"
-
     def check_duplicate_user(self, user_id: str, user_name: str) -> tuple:
         """Check if User ID or User Name already exists"""
         for user in self.registered_users:
@@ -882,22 +4411,30 @@ class WFHAttendanceApp:
                 return True, f"User Name '{user_name}' is already registered to User ID '{user['user_id']}'"
         return False, ""
 
-    def register_new_user(self, user_id: str, user_name: str, role: str = 'regular'):
-        """Register a new user with specific role"""
+    def register_new_user(self, user_id: str, user_name: str, role: str = 'regular',
+                          department: str = DEFAULT_DEPARTMENT):
+        """Register a new user with specific role and department"""
         new_user = {
             'user_id': user_id,
             'user_name': user_name,
-            'registered_date': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            'role': role
+            'registered_date': int(time.time()),
+            'role': role,
+            'department': department
         }
         self.registered_users.append(new_user)
         self.save_registered_users()
+        self.user_index.add(user_id.lower(), user_id, user_name)
+        if self.user_list is not None:
+            query = self.user_list.query
+            self.user_list.add(new_user, not query.strip() or user_id.lower() in self.user_index.search(query))
+            if self.users_window is not None and self.users_window.winfo_exists():
+                self.render_user_list()
         
         if role == 'admin':
             admin_user = {
                 'user_id': user_id,
                 'user_name': user_name,
-                'admin_since': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                'admin_since': int(time.time())
             }
             self.admin_users.append(admin_user)
             self.save_admin_users()
@@ -905,7 +4442,7 @@ class WFHAttendanceApp:
             roles_user = {
                 'user_id': user_id,
                 'user_name': user_name,
-                'roles_since': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                'roles_since': int(time.time())
             }
             self.roles_users.append(roles_user)
             self.save_roles_users()
@@ -946,9 +4483,12 @@ class WFHAttendanceApp:
             role_msg = "Admin" if self.user_role == 'admin' else "Roles User" if self.user_role == 'roles' else "Regular User"
             
             self.current_user_id = user_id
+            self.current_department = user_data.get('department') or DEFAULT_DEPARTMENT
             
             role_icon = "👑" if self.user_role == 'admin' else "⚡" if self.user_role == 'roles' else "👤"
-            self.login_status_var.set(f"{role_icon} Logged in as: {user_name} ({user_id}) - {role_msg}")
+            self.login_status_var.set(
+                f"{role_icon} Logged in as: {user_name} ({user_id}) - {role_msg}, {self.current_department}"
+            )
             self.login_status_label.configure(foreground=self.colors['success_dark'])
             
             self.login_btn.config(state=tk.DISABLED)
@@ -963,9 +4503,6 @@ class WFHAttendanceApp:
                 self.auto_time_in_btn.config(state=tk.NORMAL)
                 self.check_active_session()
             
-            if self.user_role != 'admin':
-                self.update_records_display()
-            
             messagebox.showinfo("Login Successful", f"Welcome {user_name}! ({role_msg})")
 
     def manage_users(self):
@@ -973,8 +4510,19 @@ class WFHAttendanceApp:
         if self.user_role != 'admin':
             messagebox.showerror("Access Denied", "Only administrators can manage users.")
             return
-            
+        
+        # The window is hidden rather than destroyed on close, so reopening it is instant
+        if self.users_window is not None and self.users_window.winfo_exists():
+            self.users_window.deiconify()
+            self.users_window.lift()
+            self.render_user_list()
+            return
+        
+        if self.user_list is None:
+            self.user_list = UserListView(self.registered_users)
+        
         users_window = tk.Toplevel(self.root)
+        self.users_window = users_window
         users_window.title("User Management - Admin")
         users_window.geometry("800x550")
         users_window.configure(bg=self.colors['light'])
@@ -1027,10 +4575,17 @@ class WFHAttendanceApp:
                                  state="readonly", width=8, style='Modern.TCombobox')
         role_combo.grid(row=0, column=5, padx=(0, 15), pady=5)
         
+        ttk.Label(form_frame, text="Department:", style='Modern.TLabel').grid(row=1, column=0, padx=(0, 8), pady=5, sticky=tk.W)
+        department_var = tk.StringVar(value=DEFAULT_DEPARTMENT)
+        department_combo = ttk.Combobox(form_frame, textvariable=department_var, values=self.shards.departments(),
+                                        width=15, style='Modern.TCombobox')
+        department_combo.grid(row=1, column=1, columnspan=3, padx=(0, 15), pady=5, sticky=tk.W)
+        
         def register_new_user_admin():
             user_id = new_user_id_var.get().strip()
             user_name = new_user_name_var.get().strip()
             role = role_var.get()
+            department = ' '.join(department_var.get().split()) or DEFAULT_DEPARTMENT
             
             if not user_id or not user_name:
                 messagebox.showerror("Error", "Please enter both User ID and User Name")
@@ -1041,6 +4596,17 @@ class WFHAttendanceApp:
                 messagebox.showerror("Duplicate User", error_message)
                 return
             
+            conflict = self.shards.department_conflict(
+                department, tuple(user.get('department') or DEFAULT_DEPARTMENT for user in self.registered_users)
+            )
+            if conflict:
+                messagebox.showerror(
+                    "Department Name Taken",
+                    f"'{department}' cannot be used: its data folder is the same as the department '{conflict}'.\n\n"
+                    f"Choose '{conflict}' or a more distinct name."
+                )
+                return
+            
             # Fix for admin role selection - show modal but keep dropdown as "regular"
             if role == 'admin':
                 confirm = messagebox.askyesno(
@@ -1061,7 +4627,8 @@ class WFHAttendanceApp:
             else:
                 actual_role = role
             
-            self.register_new_user(user_id, user_name, actual_role)
+            self.register_new_user(user_id, user_name, actual_role, department)
+            show_user(user_id)
             
             if actual_role == 'admin':
                 messagebox.showinfo("Success", f"Administrator '{user_name}' ({user_id}) registered successfully!")
@@ -1071,7 +4638,7 @@ class WFHAttendanceApp:
             new_user_id_var.set("")
             new_user_name_var.set("")
             role_var.set("regular")  # Reset to regular after registration
-            refresh_user_list()
+            department_combo.config(values=self.shards.departments())
         
         register_btn = ttk.Button(form_frame, text="Register", command=register_new_user_admin, style='Success.TButton')
         register_btn.grid(row=0, column=6, padx=(0, 10), pady=5)
@@ -1088,19 +4655,27 @@ class WFHAttendanceApp:
             style='Section.TLabel'
         ).pack(anchor=tk.W)
         
+        search_frame = ttk.Frame(list_card, style='Card.TFrame')
+        search_frame.pack(fill=tk.X, padx=20, pady=(10, 0))
+        
+        ttk.Label(search_frame, text="🔎 Search:", style='Modern.TLabel').pack(side=tk.LEFT, padx=(0, 8))
+        user_search_var = tk.StringVar()
+        user_search_entry = ttk.Entry(search_frame, textvariable=user_search_var, width=30, font=('Segoe UI', 9), style='Modern.TEntry')
+        user_search_entry.pack(side=tk.LEFT)
+        
         tree_frame = ttk.Frame(list_card, style='Card.TFrame')
         tree_frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=15)
         
         scrollbar = ttk.Scrollbar(tree_frame)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         
-        columns = ('user_id', 'user_name', 'role', 'registered_date')
+        # Only the rows that fit are inserted; scrolling moves a window over self.user_list
         users_tree = ttk.Treeview(
             tree_frame,
-            columns=columns,
+            columns=UserListView.COLUMNS,
             show='headings',
-            style='Modern.TTreeview',
-            yscrollcommand=scrollbar.set,
+            style='Modern.Treeview',
+            selectmode='browse',
             height=8
         )
         
@@ -1108,28 +4683,130 @@ class WFHAttendanceApp:
             ('user_id', 'User ID', 100),
             ('user_name', 'Name', 120),
             ('role', 'Role', 80),
+            ('department', 'Department', 110),
             ('registered_date', 'Registered', 120)
         ]
         
+        users_headings = {}
         for col, heading, width in column_configs:
-            users_tree.heading(col, text=heading)
+            users_headings[col] = heading
+            users_tree.heading(col, text=heading, command=lambda c=col: sort_users_by(c))
             users_tree.column(col, width=width, anchor=tk.CENTER)
         
         users_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        scrollbar.config(command=users_tree.yview)
-        
-        def refresh_user_list():
-            for item in users_tree.get_children():
-                users_tree.delete(item)
+        users_tree.tag_configure('evenrow', background=self.colors['light'])
+        users_tree.tag_configure('oddrow', background='white')
+        
+        row_height = int(ttk.Style().lookup('Modern.Treeview', 'rowheight') or 20)
+        list_state = {'offset': 0, 'rows': 8, 'selected': None}
+        page_var = tk.StringVar()
+        
+        def render_user_list():
+            total = len(self.user_list)
+            rows = list_state['rows']
+            offset = max(0, min(list_state['offset'], total - rows))
+            list_state['offset'] = offset
+            users = self.user_list.window(offset, rows)
+            keys = [user['user_id'].lower() for user in users]
             
-            for i, user in enumerate(self.registered_users):
-                tag = 'evenrow' if i % 2 == 0 else 'oddrow'
-                users_tree.insert('', tk.END, values=(
+            shown = set(keys)
+            stale = [item for item in users_tree.get_children() if item not in shown]
+            if stale:
+                users_tree.delete(*stale)
+            for i, (key, user) in enumerate(zip(keys, users)):
+                values = (
                     user['user_id'],
                     user['user_name'],
                     user.get('role', 'regular'),
-                    user['registered_date']
-                ), tags=(tag,))
+                    user.get('department') or DEFAULT_DEPARTMENT,
+                    format_timestamp(user.get('registered_date'))
+                )
+                tag = 'evenrow' if (offset + i) % 2 == 0 else 'oddrow'
+                if users_tree.exists(key):
+                    users_tree.item(key, values=values, tags=(tag,))
+                    users_tree.move(key, '', i)
+                else:
+                    users_tree.insert('', i, iid=key, values=values, tags=(tag,))
+            if list_state['selected'] in shown and users_tree.selection() != (list_state['selected'],):
+                users_tree.selection_set(list_state['selected'])
+            
+            if total:
+                scrollbar.set(offset / total, (offset + len(users)) / total)
+                page_var.set(f"{offset + 1}–{offset + len(users)} of {total}")
+            else:
+                scrollbar.set(0, 1)
+                page_var.set("No users")
+            prev_btn.config(state=tk.NORMAL if offset > 0 else tk.DISABLED)
+            next_btn.config(state=tk.NORMAL if offset + rows < total else tk.DISABLED)
+        
+        self.render_user_list = render_user_list
+        
+        def scroll_users(*args):
+            if args[0] == 'moveto':
+                list_state['offset'] = int(float(args[1]) * len(self.user_list))
+            elif args[0] == 'scroll':
+                step = list_state['rows'] if args[2] == 'pages' else 1
+                list_state['offset'] += int(args[1]) * step
+            render_user_list()
+        
+        def on_mouse_wheel(event):
+            direction = -1 if event.num == 4 or event.delta > 0 else 1
+            list_state['offset'] += 3 * direction
+            render_user_list()
+            return "break"
+        
+        def fit_rows(event):
+            # Header row plus as many whole rows as fit
+            rows = max(1, event.height // row_height - 1)
+            if rows != list_state['rows']:
+                list_state['rows'] = rows
+                render_user_list()
+        
+        def on_select(event):
+            selected = users_tree.selection()
+            if selected:
+                list_state['selected'] = selected[0]
+        
+        scrollbar.config(command=scroll_users)
+        users_tree.bind('<MouseWheel>', on_mouse_wheel)
+        users_tree.bind('<Button-4>', on_mouse_wheel)
+        users_tree.bind('<Button-5>', on_mouse_wheel)
+        users_tree.bind('<Configure>', fit_rows)
+        users_tree.bind('<<TreeviewSelect>>', on_select)
+        
+        def show_sort_headings():
+            for col, heading in users_headings.items():
+                if col == self.user_list.sort_column:
+                    heading += " ▼" if self.user_list.descending else " ▲"
+                users_tree.heading(col, text=heading)
+        
+        def show_user(user_id: str):
+            """Scroll to a user and select them"""
+            position = self.user_list.position(user_id)
+            if position is None:
+                return
+            list_state['selected'] = user_id.lower()
+            list_state['offset'] = position - list_state['rows'] // 2
+            render_user_list()
+        
+        def sort_users_by(column: str):
+            self.user_list.sort_by(column)
+            show_sort_headings()
+            list_state['offset'] = 0
+            if list_state['selected'] and self.user_list.position(list_state['selected']) is not None:
+                show_user(list_state['selected'])
+            else:
+                render_user_list()
+        
+        def search_users():
+            query = user_search_var.get()
+            self.user_list.filter(query, self.user_index.search(query) if query.strip() else None)
+            list_state['offset'] = 0
+            render_user_list()
+        
+        def reload_user_list():
+            self.user_list.load(self.registered_users)
+            search_users()
         
         def delete_selected_user():
             selected = users_tree.selection()
@@ -1137,10 +4814,10 @@ class WFHAttendanceApp:
                 messagebox.showwarning("Warning", "Please select a user to delete")
                 return
             
-            item = selected[0]
-            user_id = users_tree.item(item, 'values')[0]
-            user_name = users_tree.item(item, 'values')[1]
-            user_role = users_tree.item(item, 'values')[2]
+            user = self.user_list.users[selected[0]]
+            user_id = user['user_id']
+            user_name = user['user_name']
+            user_role = user.get('role', 'regular')
             
             # Prevent deletion of the permanent admin user
             if user_id == 'admin' and user_name == 'admin':
@@ -1175,7 +4852,10 @@ class WFHAttendanceApp:
                 self.roles_users = [r for r in self.roles_users if r['user_id'] != user_id]
                 self.save_roles_users()
                 
-                refresh_user_list()
+                self.user_index.remove(user_id.lower())
+                self.user_list.remove(user_id)
+                
+                render_user_list()
                 messagebox.showinfo("Success", f"User '{user_name}' deleted successfully")
         
         btn_frame = ttk.Frame(list_card, style='Card.TFrame')
@@ -1184,13 +4864,25 @@ class WFHAttendanceApp:
         delete_btn = ttk.Button(btn_frame, text="🗑️ Delete User", command=delete_selected_user, style='Danger.TButton')
         delete_btn.pack(side=tk.LEFT, padx=(0, 10))
         
-        refresh_btn = ttk.Button(btn_frame, text="🔄 Refresh", command=refresh_user_list, style='Primary.TButton')
+        refresh_btn = ttk.Button(btn_frame, text="🔄 Refresh", command=reload_user_list, style='Primary.TButton')
         refresh_btn.pack(side=tk.LEFT)
         
-        close_btn = ttk.Button(main_container, text="Close", command=users_window.destroy, style='Secondary.TButton')
+        next_btn = ttk.Button(btn_frame, text="▶", width=3, command=lambda: scroll_users('scroll', 1, 'pages'),
+                              style='Secondary.TButton')
+        next_btn.pack(side=tk.RIGHT)
+        ttk.Label(btn_frame, textvariable=page_var, style='Modern.TLabel').pack(side=tk.RIGHT, padx=8)
+        prev_btn = ttk.Button(btn_frame, text="◀", width=3, command=lambda: scroll_users('scroll', -1, 'pages'),
+                              style='Secondary.TButton')
+        prev_btn.pack(side=tk.RIGHT)
+        
+        close_btn = ttk.Button(main_container, text="Close", command=users_window.withdraw, style='Secondary.TButton')
         close_btn.pack(pady=10)
+        users_window.protocol("WM_DELETE_WINDOW", users_window.withdraw)
         
-        refresh_user_list()
+        user_search_var.trace_add('write', lambda *args: self.debounce_search('users', search_users))
+        
+        show_sort_headings()
+        search_users()
 
     def handle_logout(self):
         """Handle user logout"""
@@ -1204,9 +4896,13 @@ class WFHAttendanceApp:
                 return
         
         self.current_user_id = None
+        self.current_department = DEFAULT_DEPARTMENT
         self.current_session_id = None
         self.user_role = None
         
+        if self.users_window is not None and self.users_window.winfo_exists():
+            self.users_window.withdraw()
+        
         self.login_status_var.set("Please login to continue")
         self.login_status_label.configure(foreground=self.colors['text_secondary'])
         self.attendance_status_var.set("No active session")
@@ -1231,12 +4927,13 @@ class WFHAttendanceApp:
         if not self.current_user_id:
             return
             
-        user_sessions = [s for s in self.active_sessions if s['user_id'] == self.current_user_id]
+        session = self.current_shard().service.user_session(self.current_user_id)
         
-        if user_sessions:
-            session = user_sessions[0]
+        if session:
             self.current_session_id = session['session_id']
-            self.attendance_status_var.set(f"🟢 Active session: Time In at {session['time_in']}")
+            self.attendance_status_var.set(
+                f"🟢 Active session: Time In at {format_timestamp(session['time_in'], '%H:%M:%S')}"
+            )
             self.time_in_btn.config(state=tk.DISABLED)
             self.time_out_btn.config(state=tk.NORMAL)
             self.auto_time_in_btn.config(state=tk.DISABLED)
@@ -1253,8 +4950,7 @@ class WFHAttendanceApp:
             messagebox.showerror("Error", "Please login first")
             return
         
-        user_sessions = [s for s in self.active_sessions if s['user_id'] == self.current_user_id]
-        if user_sessions:
+        if self.current_shard().service.user_session(self.current_user_id):
             messagebox.showerror("Error", "You already have an active session!")
             return
         
@@ -1262,30 +4958,24 @@ class WFHAttendanceApp:
 
     def create_new_session(self):
         """Create a new time-in session for the current user"""
-        current_time = datetime.now().strftime("%H:%M:%S")
-        today = datetime.now().strftime("%Y-%m-%d")
-        
-        session_id = self.generate_session_id(self.current_user_id)
-        
-        session_record = {
-            'session_id': session_id,
-            'user_id': self.current_user_id,
-            'user_name': self.user_name_var.get(),
-            'date': today,
-            'time_in': current_time
-        }
-        
-        self.active_sessions.append(session_record)
-        self.current_session_id = session_id
+        try:
+            session_record = self.current_shard().service.clock_in(self.current_user_id, self.user_name_var.get())
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to save sessions: {str(e)}")
+            return
         
-        self.save_sessions()
+        current_time = format_timestamp(session_record['time_in'], "%H:%M:%S")
+        self.current_session_id = session_record['session_id']
         
         self.attendance_status_var.set(f"🟢 Time In recorded at {current_time}")
         self.time_in_btn.config(state=tk.DISABLED)
         self.time_out_btn.config(state=tk.NORMAL)
         self.auto_time_in_btn.config(state=tk.DISABLED)
         
-        self.update_sessions_display()
+        self.mark_dirty('sessions', 'heatmap')
         messagebox.showinfo("Success", "Time In recorded successfully!")
 
     def auto_new_session(self):
@@ -1298,8 +4988,7 @@ class WFHAttendanceApp:
             messagebox.showerror("Error", "Please login first")
             return
         
-        user_sessions = [s for s in self.active_sessions if s['user_id'] == self.current_user_id]
-        if user_sessions:
+        if self.current_shard().service.user_session(self.current_user_id):
             messagebox.showerror("Error", "You already have an active session!")
             return
         
@@ -1318,13 +5007,8 @@ class WFHAttendanceApp:
             messagebox.showerror("Error", "No active session found")
             return
         
-        session_index = None
-        session_data = None
-        for i, session in enumerate(self.active_sessions):
-            if session['session_id'] == self.current_session_id:
-                session_index = i
-                session_data = session
-                break
+        shard = self.current_shard()
+        session_index = shard.service.find_session(self.current_session_id)
         
         if session_index is None:
             messagebox.showerror("Error", "Session not found")
@@ -1333,6 +5017,7 @@ class WFHAttendanceApp:
         current_user_id = self.user_id_var.get().strip()
         current_user_name = self.user_name_var.get().strip()
         
+        session_data = shard.sessions[session_index]
         session_user_id = session_data['user_id']
         session_user_name = session_data['user_name']
         
@@ -1340,32 +5025,22 @@ class WFHAttendanceApp:
             self.show_validation_error(session_user_id, session_user_name)
             return
         
-        current_time = datetime.now().strftime("%H:%M:%S")
-        
-        record = {
-            'user_id': session_data['user_id'],
-            'user_name': session_data['user_name'],
-            'date': session_data['date'],
-            'time_in': session_data['time_in'],
-            'time_out': current_time,
-            'duration': self.calculate_duration(session_data['time_in'], current_time)
-        }
-        
-        self.attendance_data.append(record)
+        try:
+            record = shard.service.clock_out(self.current_session_id)
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to save data: {str(e)}")
+            return
         
-        self.active_sessions.pop(session_index)
+        self.occupancy.add_record(shard.store, record)
         self.current_session_id = None
-        
-        self.save_data()
-        self.save_sessions()
+        current_time = record.time_out_str
         
         self.attendance_status_var.set(f"🔴 Time Out recorded at {current_time}")
         self.time_in_btn.config(state=tk.NORMAL)
         self.time_out_btn.config(state=tk.DISABLED)
         self.auto_time_in_btn.config(state=tk.NORMAL)
         
-        self.update_records_display()
-        self.update_sessions_display()
+        self.mark_dirty('records', 'sessions', 'heatmap')
         messagebox.showinfo("Success", "Time Out recorded successfully!")
 
     def show_validation_error(self, session_user_id: str, session_user_name: str):
@@ -1394,184 +5069,158 @@ class WFHAttendanceApp:
         item = selected[0]
         session_id = self.sessions_tree.item(item, 'values')[0]
         
-        session_index = None
-        session_data = None
-        for i, session in enumerate(self.active_sessions):
-            if session['session_id'] == session_id:
-                session_index = i
-                session_data = session
-                break
-        
-        if session_index is None:
+        shard = self.shards.find_session(session_id)
+        if shard is None:
             messagebox.showerror("Error", "Session not found")
             return
         
-        current_time = datetime.now().strftime("%H:%M:%S")
-        
-        record = {
-            'user_id': session_data['user_id'],
-            'user_name': session_data['user_name'],
-            'date': session_data['date'],
-            'time_in': session_data['time_in'],
-            'time_out': current_time,
-            'duration': self.calculate_duration(session_data['time_in'], current_time)
-        }
-        
-        self.attendance_data.append(record)
-        
-        self.active_sessions.pop(session_index)
+        try:
+            record = shard.service.clock_out(session_id)
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to save data: {str(e)}")
+            return
         
-        self.save_data()
-        self.save_sessions()
+        self.occupancy.add_record(shard.store, record)
         
-        self.update_records_display()
-        self.update_sessions_display()
+        self.mark_dirty('records', 'sessions', 'heatmap')
         messagebox.showinfo("Success", "Session force timed out successfully!")
 
-    def calculate_duration(self, time_in: str, time_out: str) -> str:
-        """Calculate duration between time in and time out"""
-        time_in_dt = datetime.strptime(time_in, "%H:%M:%S")
-        time_out_dt = datetime.strptime(time_out, "%H:%M:%S")
-        duration = time_out_dt - time_in_dt
-        
-        hours, remainder = divmod(duration.total_seconds(), 3600)
-        minutes, seconds = divmod(remainder, 60)
-        return f"{int(hours):02d}:{int(minutes):02d}"
-
     def export_to_excel(self):
-        """Export attendance data to Excel (Roles only) - UPDATED: Admin users can no longer export"""
+        """Export attendance data to Excel (Roles only)"""
+        self.export_data('.xlsx')
+
+    def export_data(self, extension: Optional[str] = None):
+        """Export attendance data in the selected format (Roles only) - UPDATED: Admin users can no longer export"""
         if self.user_role != 'roles':  # UPDATED: Only roles users can export
-            messagebox.showerror("Access Denied", "Only Roles Users can export data to Excel.")
-            return
-            
-        if not self.attendance_data:
-            messagebox.showwarning("Warning", "No attendance data to export")
+            messagebox.showerror("Access Denied", "Only Roles Users can export data.")
             return
         
+        if extension is None:
+            extension = EXPORT_FORMATS.get(self.export_format_var.get(), '.xlsx')
+        start_day, end_day = self.get_records_range()
+        started = time.perf_counter()
+        shard = self.current_shard()
+        
         try:
-            # FIXED: Roles users should export ALL attendance data, not just filtered data
-            export_data = self.attendance_data  # Use all data directly
-            
-            if not export_data:
+            # FIXED: Roles users should export ALL attendance data of their department in the selected period
+            if not any(True for _ in shard.store.iter_records(start_day, end_day)):
                 messagebox.showwarning("Warning", "No attendance data to export")
                 return
             
-            df = pd.DataFrame(export_data)
+            # Only the records tab's date range is exported and cleared, so say which one
+            scope = f"{self.records_period_var.get()}, {format_day_range(start_day, end_day)}"
+            if not messagebox.askyesno(
+                "Confirm Export",
+                f"Export the attendance records for {scope}?\n\n"
+                f"The exported records will be cleared. Records outside this range are kept; "
+                f"change the period on the Records tab to export a different range."
+            ):
+                return
             
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"wfh_attendance_{timestamp}.xlsx"
+            filename = f"wfh_attendance_{timestamp}{extension}"
             
-            if sys.platform == "win32":
-                downloads_path = os.path.join(os.path.expanduser("~"), "Downloads")
-            elif sys.platform == "darwin":
-                downloads_path = os.path.join(os.path.expanduser("~"), "Downloads")
-            else:
-                downloads_path = os.path.join(os.path.expanduser("~"), "Downloads")
+            filepath = os.path.join(self.get_downloads_path(), filename)
             
-            filepath = os.path.join(downloads_path, filename)
+            # Write the export once, row by row from the record store, straight into the artifact store.
+            # The exported records are cleared in the same step.
+            temp_path = shard.export_artifacts.temp_path(extension)
+            record_count = shard.service.export_records(temp_path, start_day, end_day)
+            self.occupancy.reset()
             
-            df.to_excel(filepath, index=False, engine='openpyxl')
+            # Save the export to the department's roles_exports directory for admin access
+            roles_copy_path = self.save_roles_export_copy(temp_path, self.current_user_id, record_count, shard)
+            
+            # The user gets an independent copy (copied in the kernel where possible)
+            if roles_copy_path:
+                fast_copy(roles_copy_path, filepath)
+            else:
+                shutil.move(temp_path, filepath)
             
             # NEW: Make the exported file read-only for roles users
             self.make_file_read_only(filepath)
             
             self.export_path_var.set(f"📁 Exported to: {filepath} (Read-only)")
             
-            self.save_export_history(filepath, len(export_data))
-            
-            # Clear ALL attendance records for Roles users after export
-            records_before_clear = len(self.attendance_data)
-            self.attendance_data = []  # Clear all attendance records
-            self.save_data()
-            records_cleared = records_before_clear
-            
-            # Save a copy to roles_exports directory for admin access
-            roles_copy_path = self.save_roles_export_copy(filepath, self.current_user_id)
-            
-            # NEW: Make the admin copy writable for admin users
-            if roles_copy_path:
-                self.make_file_writable(roles_copy_path)
+            self.save_export_history(filepath, record_count, (time.perf_counter() - started) * 1000)
             
             messagebox.showinfo(
                 "Success", 
                 f"Data exported successfully!\n\n"
-                f"Exported {len(export_data)} records to:\n{filepath}\n\n"
+                f"Exported {record_count} records ({scope}) to:\n{filepath}\n\n"
                 f"📝 File is READ-ONLY to maintain data integrity.\n"
-                f"All attendance records have been cleared. Ready for new records.\n\n"
-                f"📤 A writable copy has been saved for Admin access."
+                f"All exported records ({scope}) have been cleared. Ready for new records.\n\n"
+                f"📤 The export has been saved for Admin access (admin downloads are writable)."
             )
             
             # Update display to show cleared records
-            self.update_records_display()
+            self.mark_dirty('records', 'heatmap')
             
-            print(f"Cleared {records_cleared} attendance records after export")
+            print(f"Cleared {record_count} attendance records after export")
             
-            if messagebox.askyesno("Open File", "Do you want to open the Excel file?"):
+            if messagebox.askyesno("Open File", "Do you want to open the exported file?"):
                 self.open_file(filepath)
                 
         except Exception as e:
             messagebox.showerror("Error", f"Failed to export data: {str(e)}")
 
-    def save_export_history(self, filepath: str, record_count: int):
-        """Save export history for tracking"""
+    def save_export_history(self, filepath: str, record_count: int, duration_ms: Optional[float] = None):
+        """Append the export to the export history log"""
         export_record = {
-            'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'timestamp': int(time.time()),
             'filepath': filepath,
             'record_count': record_count,
+            'format': split_export_extension(filepath)[1],
             'user_id': self.current_user_id,
-            'user_role': self.user_role
+            'user_role': self.user_role,
+            'department': self.current_department,
+            'duration_ms': round(duration_ms, 1) if duration_ms is not None else None
         }
         
-        self.export_history.append(export_record)
-        
         try:
-            with open(self.export_history_file, 'w') as f:
-                json.dump(self.export_history, f, indent=2)
+            self.export_history.append(export_record)
         except Exception as e:
             print(f"Error saving export history: {e}")
 
-    def load_export_history(self) -> List[Dict]:
-        """Load export history from JSON file"""
+    def load_export_history(self) -> ExportHistoryLog:
+        """Load the export history log, applying the retention policy"""
+        history = ExportHistoryLog(self.export_log_file, legacy_file=self.export_history_file)
         try:
-            if os.path.exists(self.export_history_file):
-                with open(self.export_history_file, 'r') as f:
-                    return json.load(f)
+            history.load()
         except Exception as e:
             print(f"Error loading export history: {e}")
-        return []
+        return history
 
     def load_registered_users(self) -> List[Dict]:
         """Load registered users from JSON file"""
         try:
             if os.path.exists(self.users_file):
-                with open(self.users_file, 'r') as f:
-                    data = json.load(f)
-                    # Add permanent admin user if not exists
-                    admin_exists = any(user['user_id'] == 'admin' for user in data)
-                    if not admin_exists:
-                        permanent_admin = {
-                            'user_id': 'admin',
-                            'user_name': 'admin',
-                            'registered_date': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                            'role': 'admin'
-                        }
-                        data.insert(0, permanent_admin)  # Add at beginning
-                    return data
+                data = read_data_file(self.users_file)
+                # Add permanent admin user if not exists
+                admin_exists = any(user['user_id'] == 'admin' for user in data)
+                if not admin_exists:
+                    permanent_admin = {
+                        'user_id': 'admin',
+                        'user_name': 'admin',
+                        'registered_date': int(time.time()),
+                        'role': 'admin'
+                    }
+                    data.insert(0, permanent_admin)  # Add at beginning
+                return data
         except Exception as e:
             print(f"Error loading registered users: {e}")
         # Return default with permanent admin if file doesn't exist or error
         return [{
             'user_id': 'admin',
             'user_name': 'admin',
-            'registered_date': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'registered_date': int(time.time()),
             'role': 'admin'
         }]
 
     def save_registered_users(self):
         """Save registered users to JSON file"""
         try:
-            with open(self.users_file, 'w') as f:
-                json.dump(self.registered_users, f, indent=2)
+            write_data_file(self.users_file, self.registered_users)
         except Exception as e:
             messagebox.showerror("Error", f"Failed to save user data: {str(e)}")
 
@@ -1579,32 +5228,30 @@ class WFHAttendanceApp:
         """Load admin users from JSON file"""
         try:
             if os.path.exists(self.admin_file):
-                with open(self.admin_file, 'r') as f:
-                    data = json.load(f)
-                    # Add permanent admin user if not exists
-                    admin_exists = any(user['user_id'] == 'admin' for user in data)
-                    if not admin_exists:
-                        permanent_admin = {
-                            'user_id': 'admin',
-                            'user_name': 'admin',
-                            'admin_since': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                        }
-                        data.insert(0, permanent_admin)  # Add at beginning
-                    return data
+                data = read_data_file(self.admin_file)
+                # Add permanent admin user if not exists
+                admin_exists = any(user['user_id'] == 'admin' for user in data)
+                if not admin_exists:
+                    permanent_admin = {
+                        'user_id': 'admin',
+                        'user_name': 'admin',
+                        'admin_since': int(time.time())
+                    }
+                    data.insert(0, permanent_admin)  # Add at beginning
+                return data
         except Exception as e:
             print(f"Error loading admin users: {e}")
         # Return default with permanent admin if file doesn't exist or error
         return [{
             'user_id': 'admin',
             'user_name': 'admin',
-            'admin_since': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            'admin_since': int(time.time())
         }]
 
     def save_admin_users(self):
         """Save admin users to JSON file"""
         try:
-            with open(self.admin_file, 'w') as f:
-                json.dump(self.admin_users, f, indent=2)
+            write_data_file(self.admin_file, self.admin_users)
         except Exception as e:
             messagebox.showerror("Error", f"Failed to save admin data: {str(e)}")
 
@@ -1612,8 +5259,7 @@ class WFHAttendanceApp:
         """Load roles users from JSON file"""
         try:
             if os.path.exists(self.roles_file):
-                with open(self.roles_file, 'r') as f:
-                    return json.load(f)
+                return read_data_file(self.roles_file)
         except Exception as e:
             print(f"Error loading roles users: {e}")
         return []
@@ -1621,8 +5267,7 @@ class WFHAttendanceApp:
     def save_roles_users(self):
         """Save roles users to JSON file"""
         try:
-            with open(self.roles_file, 'w') as f:
-                json.dump(self.roles_users, f, indent=2)
+            write_data_file(self.roles_file, self.roles_users)
         except Exception as e:
             messagebox.showerror("Error", f"Failed to save roles data: {str(e)}")
 
@@ -1630,8 +5275,7 @@ class WFHAttendanceApp:
         """Load deleted users archive from JSON file"""
         try:
             if os.path.exists(self.archive_file):
-                with open(self.archive_file, 'r') as f:
-                    return json.load(f)
+                return read_data_file(self.archive_file)
         except Exception as e:
             print(f"Error loading archive: {e}")
         return []
@@ -1639,8 +5283,7 @@ class WFHAttendanceApp:
     def save_archive(self):
         """Save deleted users archive to JSON file"""
         try:
-            with open(self.archive_file, 'w') as f:
-                json.dump(self.deleted_users_archive, f, indent=2)
+            write_data_file(self.archive_file, self.deleted_users_archive)
         except Exception as e:
             messagebox.showerror("Error", f"Failed to save archive: {str(e)}")
 
@@ -1656,38 +5299,155 @@ class WFHAttendanceApp:
         except Exception as e:
             messagebox.showerror("Error", f"Failed to open file: {str(e)}")
 
+    def apply_records_period(self, refresh: bool = True):
+        """Fill the From/To filters from the selected period"""
+        today = date.today()
+        period = self.records_period_var.get()
+        if period == "Custom":
+            return
+        if period == "This Month":
+            start = today.replace(day=1)
+        elif period == "Last 3 Months":
+            month_index = today.year * 12 + today.month - 1 - 2
+            start = date(month_index // 12, month_index % 12 + 1, 1)
+        elif period == "This Year":
+            start = date(today.year, 1, 1)
+        else:
+            start = None
+        self.records_from_var.set(start.isoformat() if start else "")
+        self.records_to_var.set("")
+        if refresh:
+            self.apply_records_filters()
+        else:
+            self.records_filters = self.parse_records_filters()
+
+    def parse_records_filters(self) -> Dict:
+        """Read the records filter controls, raising ValueError on bad input"""
+        filters = {}
+        user_filter = self.records_user_filter_var.get().strip()
+        if user_filter:
+            # Prefix matches on registered IDs/names, plus the text itself as an exact ID
+            filters['user_ids'] = sorted(self.user_index.search(user_filter) | {user_filter.lower()})
+        for name, variable in (('start_day', self.records_from_var), ('end_day', self.records_to_var)):
+            value = variable.get().strip()
+            if value:
+                try:
+                    filters[name] = date.fromisoformat(value).toordinal()
+                except ValueError:
+                    raise ValueError(f"Invalid date '{value}'. Please use YYYY-MM-DD.")
+        minutes = self.records_min_duration_var.get().strip()
+        if minutes:
+            try:
+                filters['min_duration'] = int(float(minutes) * 60)
+            except ValueError:
+                raise ValueError(f"Invalid minimum duration '{minutes}'. Please enter minutes.")
+        return filters
+
+    def debounce_search(self, name: str, callback, delay: int = 150):
+        """Run callback once typing pauses for delay milliseconds"""
+        pending = self.search_after_ids.pop(name, None)
+        if pending:
+            self.root.after_cancel(pending)
+        
+        def run():
+            self.search_after_ids.pop(name, None)
+            callback()
+        
+        self.search_after_ids[name] = self.root.after(delay, run)
+
+    def apply_records_filters(self):
+        """Apply the records filter controls and refresh the records view"""
+        try:
+            self.records_filters = self.parse_records_filters()
+        except ValueError as e:
+            messagebox.showerror("Invalid Filter", str(e))
+            return
+        self.mark_dirty('records')
+
+    def clear_records_filters(self):
+        """Reset the records filters to the current month"""
+        self.records_user_filter_var.set("")
+        self.records_min_duration_var.set("")
+        self.records_period_var.set("This Month")
+        self.apply_records_period()
+
+    def get_records_range(self) -> tuple:
+        """Day-ordinal range (inclusive) of the records filters, None for open ends"""
+        return self.records_filters.get('start_day'), self.records_filters.get('end_day')
+
+    def get_records_query(self) -> Dict:
+        """Query arguments for the records view, restricted by role"""
+        query = dict(self.records_filters)
+        if self.user_role not in ['admin', 'roles']:
+            # Regular users see only their own data
+            query['user_ids'] = [self.current_user_id] if self.current_user_id else []
+        return query
+
+    def sort_records_by(self, column: str):
+        """Sort the records view by a column, toggling direction on repeated clicks"""
+        sort_column, descending = self.records_sort
+        if sort_column == column:
+            self.records_sort = (column, not descending)
+        else:
+            self.records_sort = (column, False)
+        
+        for col, heading in self.records_headings.items():
+            if col == column:
+                heading += " ▼" if self.records_sort[1] else " ▲"
+            self.records_tree.heading(col, text=heading)
+        
+        self.mark_dirty('records')
+
     def update_records_display(self):
-        """Update the records treeview based on user role"""
+        """Update the records treeview based on user role, filters and sort order"""
+        query = self.get_records_query()
+        sort_column, descending = self.records_sort
+        # Newest first unless a column sort is selected
+        descending = descending if sort_column else True
+        departments = self.visible_departments()
+        
+        if self.user_role in ['admin', 'roles'] or not self.current_user_id:
+            display_data = self.shards.query(departments, sort_key=sort_column, descending=descending, **query)
+            versions = self.shards.versions(departments)
+        else:
+            store = self.current_shard().store
+            display_data = self.record_views.get(
+                store, self.current_user_id, (repr(sorted(query.items())), sort_column, descending),
+                lambda: store.query(sort_key=sort_column, descending=descending, **query)
+            )
+            versions = (store.user_version(self.current_user_id),)
+        
+        result_key = (repr(sorted(query.items())), tuple(departments), versions)
+        if result_key == self.records_result_key and len(display_data) == len(self.records_result):
+            # Same rows, new order: move the existing items instead of rebuilding them
+            for i, record in enumerate(display_data):
+                iid = str(id(record))
+                self.records_tree.move(iid, '', i)
+                self.records_tree.item(iid, tags=('evenrow' if i % 2 == 0 else 'oddrow',))
+            self.records_result = display_data
+            return
+        
         for item in self.records_tree.get_children():
             self.records_tree.delete(item)
         
-        # Admin and Roles users see all data, Regular users see only their data
-        if self.user_role in ['admin', 'roles']:
-            display_data = self.attendance_data
-        else:
-            display_data = [record for record in self.attendance_data if record['user_id'] == self.current_user_id]
-        
-        for i, record in enumerate(reversed(display_data)):
+        for i, record in enumerate(display_data):
             tag = 'evenrow' if i % 2 == 0 else 'oddrow'
             self.records_tree.insert(
                 '', tk.END,
-                values=(
-                    record['user_id'],
-                    record['user_name'],
-                    record['date'],
-                    record['time_in'],
-                    record['time_out'],
-                    record['duration']
-                ),
+                iid=str(id(record)),
+                values=record.display_values(),
                 tags=(tag,)
             )
+        
+        self.records_result_key = result_key
+        self.records_result = display_data
 
     def update_sessions_display(self):
         """Update the active sessions treeview"""
         for item in self.sessions_tree.get_children():
             self.sessions_tree.delete(item)
         
-        for i, session in enumerate(self.active_sessions):
+        for i, (department, session) in enumerate(self.shards.sessions(self.visible_departments())):
             tag = 'evenrow' if i % 2 == 0 else 'oddrow'
             self.sessions_tree.insert(
                 '', tk.END,
@@ -1695,47 +5455,109 @@ class WFHAttendanceApp:
                     session['session_id'],
                     session['user_id'],
                     session['user_name'],
-                    session['date'],
-                    session['time_in']
+                    department,
+                    format_timestamp(session['time_in'], "%Y-%m-%d"),
+                    format_timestamp(session['time_in'], "%H:%M:%S")
                 ),
                 tags=(tag,)
             )
 
-    def load_data(self) -> List[Dict]:
-        """Load attendance data from JSON file"""
+    def migrate_storage(self):
+        """Convert stored date/time strings to epoch seconds, once.
+
+        Each file is rewritten atomically and only string values are
+        converted, so an interrupted migration is simply run again; the
+        version marker is written last.
+        """
         try:
-            if os.path.exists(self.data_file):
-                with open(self.data_file, 'r') as f:
-                    return json.load(f)
+            version = read_data_file(self.storage_version_file).get('version', 1)
+        except FileNotFoundError:
+            version = 1
         except Exception as e:
-            print(f"Error loading data: {e}")
-        return []
-
-    def load_sessions(self) -> List[Dict]:
-        """Load active sessions from JSON file"""
+            print(f"Error reading storage version: {e}")
+            return
+        if version >= STORAGE_VERSION:
+            return
+        
         try:
+            store = AttendanceStore(self.partition_dir, legacy_file=self.data_file)
+            store.load()
+            store.rewrite()
+            
             if os.path.exists(self.sessions_file):
-                with open(self.sessions_file, 'r') as f:
-                    return json.load(f)
+                sessions = []
+                unmigrated = []
+                for session in read_data_file(self.sessions_file):
+                    if isinstance(session.get('time_in'), str):
+                        time_in = legacy_session_time_in(session)
+                        if time_in is None:
+                            print(f"Setting aside active session without a readable time in: {session!r}")
+                            unmigrated.append(session)
+                            continue
+                        session.pop('date', None)
+                        session['time_in'] = time_in
+                    sessions.append(session)
+                if unmigrated:
+                    write_data_file(f"{self.sessions_file}.unmigrated", unmigrated)
+                write_data_file(self.sessions_file, sessions)
+            
+            for filepath, keys in ((self.users_file, ('registered_date',)),
+                                   (self.admin_file, ('admin_since',)),
+                                   (self.roles_file, ('roles_since',)),
+                                   (self.archive_file, ('registered_date', 'deleted_date'))):
+                if not os.path.exists(filepath):
+                    continue
+                users = read_data_file(filepath)
+                for user in users:
+                    for key in keys:
+                        if isinstance(user.get(key), str):
+                            user[key] = parse_timestamp(user[key])
+                write_data_file(filepath, users)
+            
+            # Both normalize timestamps while loading; writing them back stores the epochs
+            history = ExportHistoryLog(self.export_log_file, legacy_file=self.export_history_file)
+            history.load()
+            if history.entries:
+                history.compact()
+            manifest = ExportManifest(self.roles_exports_dir)
+            manifest.load()
+            if manifest.entries:
+                manifest.save()
+            
+            write_data_file(self.storage_version_file, {'version': STORAGE_VERSION, 'migrated_at': int(time.time())})
+            print(f"Migrated stored timestamps to storage version {STORAGE_VERSION}")
         except Exception as e:
-            print(f"Error loading sessions: {e}")
-        return []
+            print(f"Error migrating storage: {e}")
 
-    def save_data(self):
-        """Save attendance data to JSON file"""
+    def load_data(self) -> AttendanceStore:
+        """Open the partitioned attendance store, loading only the current month"""
+        store = AttendanceStore(self.partition_dir, legacy_file=self.data_file)
         try:
-            with open(self.data_file, 'w') as f:
-                json.dump(self.attendance_data, f, indent=2)
+            store.load(preload_day=date.today().toordinal())
+            frozen = store.freeze(date.today().replace(day=1).toordinal())
+            if frozen:
+                print(f"Compressed {frozen} closed months into the cold tier")
         except Exception as e:
-            messagebox.showerror("Error", f"Failed to save data: {str(e)}")
+            print(f"Error loading data: {e}")
+        return store
 
-    def save_sessions(self):
-        """Save active sessions to JSON file"""
+    def load_history(self) -> AttendanceStore:
+        """Open the store of exported records; only its index is read until a report needs a month"""
+        history = AttendanceStore(self.history_dir, compress_all=True)
         try:
-            with open(self.sessions_file, 'w') as f:
-                json.dump(self.active_sessions, f, indent=2)
+            history.load()
         except Exception as e:
-            messagebox.showerror("Error", f"Failed to save sessions: {str(e)}")
+            print(f"Error loading attendance history: {e}")
+        return history
+
+    def load_sessions(self) -> List[Dict]:
+        """Load active sessions from JSON file"""
+        try:
+            if os.path.exists(self.sessions_file):
+                return read_data_file(self.sessions_file)
+        except Exception as e:
+            print(f"Error loading sessions: {e}")
+        return []
 
 def main():
     root = tk.Tk()